@@ -1,11 +1,19 @@
 from django.contrib import admin
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
 from .models import (
     CustomUser,
     Package,
     Folder,
     UserFile,
     Transaction,
-    EncryptedChatSession,
+    ChatMessage,
+    UploadSession,
+    Blob,
+    ImageJob,
+    RequestProfile,
 )
 
 
@@ -34,6 +42,7 @@ class CustomUserAdmin(admin.ModelAdmin):
                     "phone",
                     "package",
                     "password",
+                    "profile_requests",
                 )
             },
         ),
@@ -108,4 +117,71 @@ class FolderAdmin(admin.ModelAdmin):
 admin.site.register(Folder, FolderAdmin)
 admin.site.register(UserFile)
 admin.site.register(Transaction)
-admin.site.register(EncryptedChatSession)
+admin.site.register(ChatMessage)
+admin.site.register(UploadSession)
+admin.site.register(ImageJob)
+
+
+class BlobAdmin(admin.ModelAdmin):
+    list_display = ("sha256", "size", "stored_size", "compression", "ref_count")
+    list_filter = ("compression",)
+
+
+admin.site.register(Blob, BlobAdmin)
+
+
+class RequestProfileAdmin(admin.ModelAdmin):
+    """
+    Profiles of requests made with an X-Profile header by staff, or by users
+    with profile_requests set. Downloads open in speedscope or flamegraph.pl.
+    """
+
+    list_display = (
+        "created_at",
+        "method",
+        "view",
+        "status",
+        "duration_ms",
+        "samples",
+        "user",
+        "download",
+    )
+    list_filter = ("view", "method")
+    search_fields = ("=id", "path", "user__username")
+    ordering = ("-created_at",)
+    exclude = ("stacks",)
+    list_select_related = ("user",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path(
+                "<uuid:profile_id>/download/",
+                self.admin_site.admin_view(self.download_view),
+                name="api_requestprofile_download",
+            ),
+            *super().get_urls(),
+        ]
+
+    @admin.display(description="Profile")
+    def download(self, obj):
+        url = reverse("admin:api_requestprofile_download", args=[obj.pk])
+        return format_html('<a href="{}">Download</a>', url)
+
+    def download_view(self, request, profile_id):
+        if not self.has_view_permission(request):
+            return HttpResponse(status=403)
+        profile = get_object_or_404(RequestProfile, pk=profile_id)
+        response = HttpResponse(profile.stacks, content_type="text/plain")
+        response["Content-Disposition"] = (
+            f'attachment; filename="profile-{profile.pk}.folded"'
+        )
+        return response
+
+
+admin.site.register(RequestProfile, RequestProfileAdmin)
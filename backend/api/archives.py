@@ -0,0 +1,260 @@
+import zlib
+import struct
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from django.conf import settings
+
+
+# Folder downloads are streamed as ZIP archives written here. Members whose
+# type is compressed already are stored; the rest are deflated on a thread
+# pool the way pigz does it: a member is cut into BLOCK_SIZE blocks, each
+# block is deflated on its own, primed with the 32 KB before it, and ends
+# with a sync flush, so the blocks joined make one valid deflate stream.
+# zlib releases the GIL while it compresses, so the blocks of one big file or
+# of many small ones keep every worker busy. Output is taken in the order it
+# was queued, which makes the archive the same as a serially built one, and
+# at most WINDOW bytes are queued per archive.
+
+BLOCK_SIZE = 1024 * 1024
+WINDOW = 16 * BLOCK_SIZE
+DICT_SIZE = 32 * 1024
+ZIP64_LIMIT = 0xFFFFFFFF
+# an empty final block, closing a stream of sync-flushed blocks
+END_OF_STREAM = b"\x03\x00"
+
+STORED = 0
+DEFLATED = 8
+# sizes follow the data (bit 3), names are UTF-8 (bit 11)
+FLAGS = 0x08 | 0x800
+# made on Unix, by a ZIP 4.5 (zip64) writer
+MADE_BY = 3 << 8 | 45
+FILE_ATTRIBUTES = 0o100644 << 16
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.ARCHIVE_WORKERS, thread_name_prefix="archive"
+        )
+    return _executor
+
+
+def deflate_block(data, zdict):
+    if zdict:
+        compressor = zlib.compressobj(
+            zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=zdict
+        )
+    else:
+        compressor = zlib.compressobj(
+            zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS
+        )
+    return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+def blocks(chunks, size):
+    """Join the chunks of a file into blocks of size bytes."""
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= size:
+            yield bytes(buffer[:size])
+            del buffer[:size]
+    if buffer:
+        yield bytes(buffer)
+
+
+def dos_datetime(modified):
+    if modified.year < 1980:
+        return 0, 0
+    date = (modified.year - 1980) << 9 | modified.month << 5 | modified.day
+    time = modified.hour << 11 | modified.minute << 5 | modified.second // 2
+    return time, date
+
+
+class Member:
+    def __init__(self, name, size, modified, deflate):
+        self.name = name.encode()
+        self.method = DEFLATED if deflate else STORED
+        # deflate makes incompressible data a little larger
+        self.zip64 = size * 1.05 >= ZIP64_LIMIT
+        self.time, self.date = dos_datetime(modified)
+        self.crc = 0
+        self.size = 0
+        self.compressed_size = 0
+        self.offset = 0
+
+    @property
+    def version(self):
+        return 45 if self.zip64 else 20
+
+    def local_header(self):
+        # CRC and sizes are not known yet; they come in the data descriptor
+        sizes, extra = 0, b""
+        if self.zip64:
+            sizes, extra = ZIP64_LIMIT, struct.pack("<HHQQ", 1, 16, 0, 0)
+        header = struct.pack(
+            "<IHHHHHIIIHH",
+            0x04034B50,
+            self.version,
+            FLAGS,
+            self.method,
+            self.time,
+            self.date,
+            0,
+            sizes,
+            sizes,
+            len(self.name),
+            len(extra),
+        )
+        return header + self.name + extra
+
+    def data_descriptor(self):
+        if self.zip64:
+            return struct.pack(
+                "<IIQQ", 0x08074B50, self.crc, self.compressed_size, self.size
+            )
+        if self.compressed_size >= ZIP64_LIMIT or self.size >= ZIP64_LIMIT:
+            raise ValueError(f"{self.name!r} is larger than its size said")
+        return struct.pack(
+            "<IIII", 0x08074B50, self.crc, self.compressed_size, self.size
+        )
+
+    def central_header(self):
+        fields = []
+        size, compressed_size, offset = self.size, self.compressed_size, self.offset
+        if self.zip64:
+            fields += [size, compressed_size]
+            size = compressed_size = ZIP64_LIMIT
+        if offset >= ZIP64_LIMIT:
+            fields.append(offset)
+            offset = ZIP64_LIMIT
+        extra = b""
+        if fields:
+            extra = struct.pack(f"<HH{len(fields)}Q", 1, 8 * len(fields), *fields)
+        header = struct.pack(
+            "<IHHHHHHIIIHHHHHII",
+            0x02014B50,
+            MADE_BY,
+            45 if fields else 20,
+            FLAGS,
+            self.method,
+            self.time,
+            self.date,
+            self.crc,
+            compressed_size,
+            size,
+            len(self.name),
+            len(extra),
+            0,
+            0,
+            0,
+            FILE_ATTRIBUTES,
+            offset,
+        )
+        return header + self.name + extra
+
+
+class Archive:
+    """
+    A queue of what goes into the archive next: local headers, data (bytes,
+    or a Future for a block being deflated) and data descriptors. Writing
+    one takes items off the front, waiting for blocks that aren't done.
+    """
+
+    def __init__(self):
+        self.queue = deque()
+        self.queued = 0
+        self.offset = 0
+        self.members = []
+
+    def add(self, member, chunks):
+        self.queue.append(("header", member, None))
+        if member.method == DEFLATED:
+            chunks, previous = blocks(chunks, BLOCK_SIZE), b""
+        for data in chunks:
+            member.crc = zlib.crc32(data, member.crc)
+            member.size += len(data)
+            self.queued += len(data)
+            if member.method == DEFLATED:
+                zdict, previous = previous[-DICT_SIZE:], data
+                item = get_executor().submit(deflate_block, data, zdict)
+                self.queue.append(("data", member, (item, len(data))))
+            else:
+                self.queue.append(("data", member, (data, len(data))))
+            yield from self.write(WINDOW)
+        if member.method == DEFLATED:
+            self.queue.append(("data", member, (END_OF_STREAM, 0)))
+        self.queue.append(("descriptor", member, None))
+
+    def write(self, limit=0):
+        """Write queued items until no more than limit bytes are queued."""
+        while self.queue and (self.queued > limit or not limit):
+            kind, member, item = self.queue.popleft()
+            if kind == "header":
+                member.offset = self.offset
+                data = member.local_header()
+            elif kind == "data":
+                data, weight = item
+                if isinstance(data, Future):
+                    data = data.result()
+                self.queued -= weight
+                member.compressed_size += len(data)
+            else:
+                data = member.data_descriptor()
+                self.members.append(member)
+            self.offset += len(data)
+            yield data
+
+    def close(self):
+        yield from self.write()
+        start = self.offset
+        for member in self.members:
+            data = member.central_header()
+            self.offset += len(data)
+            yield data
+        yield from self.end_records(start, self.offset - start)
+
+    def end_records(self, start, size):
+        count = len(self.members)
+        if count >= 0xFFFF or start >= ZIP64_LIMIT or size >= ZIP64_LIMIT:
+            yield struct.pack(
+                "<IQHHIIQQQQ",
+                0x06064B50,
+                44,
+                MADE_BY,
+                45,
+                0,
+                0,
+                count,
+                count,
+                size,
+                start,
+            )
+            yield struct.pack("<IIQI", 0x07064B50, 0, self.offset, 1)
+        yield struct.pack(
+            "<IHHHHIIH",
+            0x06054B50,
+            0,
+            0,
+            min(count, 0xFFFF),
+            min(count, 0xFFFF),
+            min(size, ZIP64_LIMIT),
+            min(start, ZIP64_LIMIT),
+            0,
+        )
+
+
+def build(entries, store_only=False):
+    """
+    Yield a ZIP archive of entries, (name, size, modified, chunks, deflate)
+    tuples where chunks is an iterable of the member's bytes. store_only
+    skips compression altogether, the quickest way to a download.
+    """
+    archive = Archive()
+    for name, size, modified, chunks, deflate in entries:
+        member = Member(name, size, modified, deflate and not store_only)
+        yield from archive.add(member, chunks)
+    yield from archive.close()
@@ -0,0 +1,282 @@
+import os
+import time
+import uuid
+import resource
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models import Sum
+from django.test import Client
+from django.urls import reverse
+from . import blobs, quota
+from .models import ChatMessage, Folder, ImageJob, UserFile
+from .views import get_user_tokens
+
+
+# Used by the benchmark command. Requests go through Django's test client, so
+# each one runs the full middleware, authentication, view and database stack
+# in this process, without a web server or network in between.
+
+UPLOAD_PREFIX = "bench-upload-"
+SEARCH_WORDS = ["file", "folder", "txt", "pdf", "report", "1"]
+PERCENTILES = (50, 95, 99)
+# (metric, True when a higher value is worse)
+COMPARED = [
+    ("p50_ms", True),
+    ("p95_ms", True),
+    ("p99_ms", True),
+    ("rps", False),
+    ("queries", True),
+]
+
+
+class Actor:
+    """A seeded user: their credentials and what there is to request."""
+
+    def __init__(self, user, rng, upload_size):
+        self.user = user
+        self.rng = rng
+        self.upload_size = upload_size
+        token = get_user_tokens(user)["access"]
+        self.headers = {"HTTP_AUTHORIZATION": f"Bearer {token}"}
+        self.files = list(
+            UserFile.objects.filter(user=user).values_list("unique_link", flat=True)
+        )
+        self.folders = list(
+            Folder.objects.filter(user=user).values_list("id", "unique_link")
+        )
+
+    def get(self, name, kwargs=None, **params):
+        return Client().get(reverse(name, kwargs=kwargs), params, **self.headers)
+
+    def post(self, name, data, **extra):
+        return Client().post(reverse(name), data, **extra, **self.headers)
+
+
+def list_storage(actor):
+    return actor.get("get_f")
+
+
+def list_files(actor):
+    if actor.folders and actor.rng.random() < 0.8:
+        folder_id, _ = actor.rng.choice(actor.folders)
+        return actor.get("list_files", folder_id=folder_id)
+    return actor.get("list_files")
+
+
+def list_folders(actor):
+    return actor.get("list_folders")
+
+
+def usage(actor):
+    return actor.get("get_size_usage")
+
+
+def search(actor):
+    return actor.get("search_storage", q=actor.rng.choice(SEARCH_WORDS))
+
+
+def upload(actor):
+    name = f"{UPLOAD_PREFIX}{uuid.uuid4().hex[:8]}.bin"
+    uploaded = SimpleUploadedFile(name, actor.rng.randbytes(actor.upload_size))
+    return actor.post("upload_file", {"file": uploaded})
+
+
+def download(actor):
+    link = actor.rng.choice(actor.files)
+    return actor.get("download_file", kwargs={"unique_link": link})
+
+
+def download_zip(actor):
+    _, link = actor.rng.choice(actor.folders)
+    return actor.get("download_folder", kwargs={"unique_link": link})
+
+
+def download_zip_stored(actor):
+    _, link = actor.rng.choice(actor.folders)
+    return actor.get("download_folder", kwargs={"unique_link": link}, store=1)
+
+
+def chat_message(actor):
+    return actor.post(
+        "ai-chat",
+        {"message": "How do I share a folder?"},
+        content_type="application/json",
+    )
+
+
+def chat_stream(actor):
+    return actor.post(
+        "ai-chat-stream",
+        {"message": "How do I share a folder?"},
+        content_type="application/json",
+    )
+
+
+def generate_image(actor):
+    return actor.post(
+        "img-generation", {"prompt": "a lighthouse"}, content_type="application/json"
+    )
+
+
+SCENARIOS = {
+    "storage": list_storage,
+    "files": list_files,
+    "folders": list_folders,
+    "usage": usage,
+    "search": search,
+    "upload": upload,
+    "download": download,
+    "zip": download_zip,
+    "zip_store": download_zip_stored,
+    "chat": chat_message,
+    "chat_stream": chat_stream,
+    "image": generate_image,
+}
+
+
+def consume(response):
+    """Read the whole body, as a client would, so streaming work is timed too."""
+    if response.streaming:
+        for _ in response:
+            pass
+    response.close()
+    return response.status_code < 400
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def reset_peak_rss():
+    # Linux only; elsewhere the peak covers the whole process
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 1024**2 if os.uname().sysname == "Darwin" else peak / 1024
+
+
+def run_scenario(name, actors, requests, concurrency=1, warmup=5):
+    """Make requests of one scenario from concurrency threads and summarize."""
+    scenario = SCENARIOS[name]
+
+    def worker(indexes):
+        counter = QueryCounter()
+        latencies, errors = [], 0
+        try:
+            with connection.execute_wrapper(counter):
+                for i in indexes:
+                    started = time.perf_counter()
+                    try:
+                        ok = consume(scenario(actors[i % len(actors)]))
+                    except Exception:
+                        ok = False
+                    latencies.append(time.perf_counter() - started)
+                    errors += not ok
+        finally:
+            connection.close()
+        return latencies, errors, counter.count
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        pool.submit(worker, range(warmup)).result()
+        reset_peak_rss()
+        started = time.perf_counter()
+        results = list(
+            pool.map(
+                worker, [range(n, requests, concurrency) for n in range(concurrency)]
+            )
+        )
+        elapsed = time.perf_counter() - started
+
+    latencies = [latency for result in results for latency in result[0]]
+    return summarize(
+        latencies,
+        errors=sum(result[1] for result in results),
+        queries=sum(result[2] for result in results),
+        elapsed=elapsed,
+    )
+
+
+def summarize(latencies, errors, queries, elapsed):
+    if len(latencies) > 1:
+        cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+    else:
+        cuts = latencies * 99
+    summary = {"requests": len(latencies), "errors": errors}
+    for p in PERCENTILES:
+        summary[f"p{p}_ms"] = round(cuts[p - 1] * 1000, 2)
+    summary["rps"] = round(len(latencies) / elapsed, 1) if elapsed else 0
+    summary["queries"] = round(queries / len(latencies), 1) if latencies else 0
+    summary["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    return summary
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare results against a saved baseline. Returns rows of (scenario,
+    metric, baseline value, current value, change in %, regressed), where
+    regressed means worse by more than threshold %.
+    """
+    rows = []
+    for name, current in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        for metric, higher_is_worse in COMPARED:
+            old, new = before.get(metric), current[metric]
+            if not old:
+                continue
+            change = (new - old) / old * 100
+            regressed = change > threshold if higher_is_worse else change < -threshold
+            rows.append((name, metric, old, new, change, regressed))
+    return rows
+
+
+def wait_for_image_jobs(users, timeout=60):
+    deadline = time.monotonic() + timeout
+    pending = ImageJob.objects.filter(user__in=users, status__in=["queued", "running"])
+    while pending.exists() and time.monotonic() < deadline:
+        time.sleep(0.5)
+
+
+def clean_up(users, started_at, last_message_id):
+    """Remove what the scenarios created, so runs start from the same data."""
+    wait_for_image_jobs(users)
+    jobs = ImageJob.objects.filter(user__in=users, created_at__gte=started_at)
+    generated = list(jobs.exclude(result=None).values_list("result", flat=True))
+    jobs.delete()
+
+    for user in users:
+        files = UserFile.all_objects.filter(user=user).filter(
+            filename__startswith=UPLOAD_PREFIX
+        ) | UserFile.all_objects.filter(user=user, pk__in=generated)
+        live = files.filter(trashed_at__isnull=True)
+        size = live.aggregate(total=Sum("size"))["total"] or 0
+        blobs.delete_user_files(files)
+        quota.free(user, size)
+
+    ChatMessage.objects.filter(user__in=users, id__gt=last_message_id).delete()
+
+
+def last_message_id():
+    return ChatMessage.objects.order_by("-id").values_list("id", flat=True).first() or 0
@@ -0,0 +1,328 @@
+import os
+import uuid
+import shutil
+import hashlib
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, Exists, F, OuterRef, Subquery, Value, When
+from . import changes, compression, search, storage, thumbnails
+from .models import Blob, Thumbnail, UserFile, blob_upload_path
+
+
+COPY_BUFFER_SIZE = 1024 * 1024
+DELETE_BATCH_SIZE = 500
+
+
+class HashingWriter:
+    """Write to a temp file while computing size and SHA-256 on the way."""
+
+    def __init__(self):
+        tmp_dir = os.path.join(settings.UPLOAD_TEMP_DIR, "blobs")
+        os.makedirs(tmp_dir, exist_ok=True)
+        self.path = os.path.join(tmp_dir, uuid.uuid4().hex)
+        self.file = open(self.path, "wb")
+        self.hash = hashlib.sha256()
+        self.size = 0
+        # how the temp file is stored, see compress()
+        self.compression = ""
+        self.stored_size = 0
+
+    def write(self, data):
+        self.hash.update(data)
+        self.size += len(data)
+        self.file.write(data)
+
+    def close(self):
+        # on disk before it is renamed into the blob store
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        self.stored_size = self.size
+
+    def discard(self):
+        self.file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    @property
+    def sha256(self):
+        return self.hash.hexdigest()
+
+
+def fsync_dir(path):
+    """Make a rename into path durable (POSIX only)."""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def put_file(tmp_path, name):
+    """Move a finished temp file into storage under name."""
+    if storage.is_local():
+        path = default_storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.move(tmp_path, path)
+        fsync_dir(os.path.dirname(path))
+    else:
+        with open(tmp_path, "rb") as f:
+            default_storage.save(name, File(f))
+        os.remove(tmp_path)
+
+
+def compress(writer):
+    """
+    With STORAGE_COMPRESSION on, swap a closed writer's temp file for a
+    zstd-compressed copy if the content compresses. Media and archives are
+    recognised by their first bytes and left as they are. The writer's size
+    and sha256 stay those of the original content.
+    """
+    if settings.STORAGE_COMPRESSION != "zstd" or writer.compression:
+        return
+    compression.require_zstandard()
+    if not compression.worth_compressing(writer.path, writer.size):
+        return
+    path = writer.path + compression.SUFFIX
+    compression.compress_file(writer.path, path, settings.STORAGE_COMPRESSION_LEVEL)
+    stored_size = os.path.getsize(path)
+    if stored_size > writer.size * (1 - compression.MIN_SAVING):
+        # the start of the file compressed, the rest didn't
+        os.remove(path)
+        return
+    os.remove(writer.path)
+    writer.path = path
+    writer.compression = "zstd"
+    writer.stored_size = stored_size
+
+
+def new_blob(writer, ref_count):
+    blob = Blob(
+        sha256=writer.sha256,
+        size=writer.size,
+        stored_size=writer.stored_size,
+        compression=writer.compression,
+        ref_count=ref_count,
+    )
+    blob.file.name = blob_upload_path(blob, writer.sha256)
+    if writer.compression:
+        # never the name a presigned upload of the same content would use
+        blob.file.name += compression.SUFFIX
+    return blob
+
+
+def write_chunks(chunks):
+    """Stream an iterable of bytes into a HashingWriter."""
+    writer = HashingWriter()
+    try:
+        for chunk in chunks:
+            writer.write(chunk)
+    except Exception:
+        writer.discard()
+        raise
+    writer.close()
+    return writer
+
+
+def store(writer):
+    """
+    Turn a finished HashingWriter into a referenced Blob.
+    If the content is already stored the temp file is dropped and the
+    existing blob gets one more reference.
+    """
+    blob = link(writer.sha256, writer.size)
+    if blob:
+        writer.discard()
+        return blob
+
+    compress(writer)
+    blob = new_blob(writer, 1)
+    try:
+        # Insert first, then move the bytes in: a concurrent unref() of the
+        # same hash holds the row until it has removed the old file.
+        with transaction.atomic():
+            blob.save(force_insert=True)
+            put_file(writer.path, blob.file.name)
+    except IntegrityError:
+        # Someone stored the same content in the meantime
+        blob = link(writer.sha256, writer.size)
+        writer.discard()
+        if not blob:
+            raise
+    return blob
+
+
+def store_many(writers):
+    """
+    store() for a batch of writers, returning their blobs in the same order.
+    Known content gets its references added with one UPDATE and new content
+    is inserted with one bulk INSERT, however many files there are.
+    """
+    groups = {}
+    for writer in writers:
+        groups.setdefault((writer.sha256, writer.size), []).append(writer)
+
+    if settings.STORAGE_COMPRESSION:
+        # compress new content before the transaction, not while holding it
+        known = set(
+            Blob.objects.filter(
+                sha256__in=[sha256 for sha256, _ in groups]
+            ).values_list("sha256", "size")
+        )
+        for key, group in groups.items():
+            if key not in known:
+                compress(group[0])
+
+    try:
+        with transaction.atomic():
+            existing = {
+                (blob.sha256, blob.size): blob
+                for blob in Blob.objects.filter(
+                    sha256__in=[sha256 for sha256, _ in groups]
+                )
+            }
+            if existing:
+                Blob.objects.filter(pk__in=[sha256 for sha256, _ in existing]).update(
+                    ref_count=F("ref_count")
+                    + Case(
+                        *[
+                            When(pk=sha256, then=Value(len(groups[sha256, size])))
+                            for sha256, size in existing
+                        ]
+                    )
+                )
+
+            new = {}
+            for (sha256, size), group in groups.items():
+                if (sha256, size) not in existing:
+                    new[sha256, size] = new_blob(group[0], len(group))
+            Blob.objects.bulk_create(new.values())
+
+            # Same order as store(): rows first, then the bytes
+            for key, blob in new.items():
+                put_file(groups[key][0].path, blob.file.name)
+    except IntegrityError:
+        # Someone stored some of the same content in the meantime
+        return [store(writer) for writer in writers]
+
+    for key, group in groups.items():
+        for writer in group if key in existing else group[1:]:
+            writer.discard()
+    blobs = {**existing, **new}
+    return [blobs[writer.sha256, writer.size] for writer in writers]
+
+
+def adopt(sha256, size):
+    """
+    Reference content a client uploaded straight into storage under its
+    blob name (presigned upload). The bytes are already in place, so this
+    is only the row: a new blob, or one more reference to the existing one.
+    """
+    blob = link(sha256, size)
+    if blob:
+        if blob.compression:
+            # the content is kept compressed under another name
+            default_storage.delete(blob_upload_path(blob, sha256))
+        return blob
+    blob = Blob(sha256=sha256, size=size, stored_size=size, ref_count=1)
+    blob.file.name = blob_upload_path(blob, sha256)
+    try:
+        with transaction.atomic():
+            blob.save(force_insert=True)
+    except IntegrityError:
+        blob = link(sha256, size)
+        if not blob:
+            raise
+    return blob
+
+
+def link(sha256, size, owner=None):
+    """
+    Add a reference to an existing blob. Returns None if there is none.
+    With owner, only a blob one of owner's own files (trashed ones too)
+    already holds: knowing a hash must not give access to others' content.
+    """
+    candidates = Blob.objects.filter(sha256=sha256, size=size)
+    if owner is not None:
+        candidates = candidates.filter(
+            Exists(UserFile.all_objects.filter(blob=OuterRef("pk"), user=owner))
+        )
+    updated = candidates.update(ref_count=F("ref_count") + 1)
+    if not updated:
+        return None
+    return Blob.objects.get(sha256=sha256)
+
+
+def create_user_file(user, blob, filename, folder):
+    user_file = UserFile.objects.create(
+        user=user,
+        file=blob.file.name,
+        filename=filename,
+        size=blob.size,
+        parent_folder=folder,
+        blob=blob,
+    )
+    search.add_files([user_file])
+    thumbnails.schedule([user_file])
+    changes.record(user, "file", "insert", [user_file.pk])
+    return user_file
+
+
+def create_user_files(user, blobs, filenames, folder):
+    user_files = UserFile.objects.bulk_create(
+        UserFile(
+            user=user,
+            file=blob.file.name,
+            filename=filename,
+            size=blob.size,
+            parent_folder=folder,
+            blob=blob,
+        )
+        for blob, filename in zip(blobs, filenames)
+    )
+    search.add_files(user_files)
+    thumbnails.schedule(user_files)
+    changes.record(user, "file", "insert", [f.pk for f in user_files])
+    return user_files
+
+
+def delete_user_files(user_files):
+    """
+    Delete a set of UserFile rows and release the stored bytes behind them.
+    Reference counts are adjusted with one UPDATE for the whole set; blobs
+    nobody uses any more are removed together with their files.
+    """
+    with transaction.atomic():
+        refs = (
+            user_files.filter(blob=OuterRef("pk"))
+            .values("blob")
+            .annotate(total=Count("pk"))
+            .values("total")
+        )
+        touched = Blob.objects.filter(pk__in=user_files.values("blob"))
+        touched.update(ref_count=F("ref_count") - Subquery(refs))
+        orphans = list(touched.filter(ref_count__lte=0).values_list("sha256", "file"))
+        # files uploaded before blobs existed
+        legacy = list(
+            user_files.filter(blob__isnull=True).values_list("file", flat=True)
+        )
+
+        user_files.delete()
+        previews = []
+        for start in range(0, len(orphans), DELETE_BATCH_SIZE):
+            batch = [sha256 for sha256, _ in orphans[start : start + DELETE_BATCH_SIZE]]
+            previews += Thumbnail.objects.filter(blob__in=batch).values_list(
+                "file", flat=True
+            )
+            # thumbnail rows go with their blob
+            Blob.objects.filter(pk__in=batch).delete()
+
+        # Still inside the transaction: a concurrent upload of the same content
+        # waits on the blob row until the old file is gone.
+        for name in [name for _, name in orphans] + legacy + previews:
+            if name:
+                default_storage.delete(name)
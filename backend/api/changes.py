@@ -0,0 +1,145 @@
+import time
+from django.conf import settings
+from django.db import transaction
+from .models import Change, CustomUser, Folder, UserFile
+
+
+# Every create, move, trash and restore of a file or folder adds a Change row
+# for its user. Sync clients keep a cursor (the id of the last change they
+# have seen, and when they were up to date) and fetch only what changed
+# since. Entries carry the item's current state, so the journal rows stay
+# small and compact_changes can drop every entry of an item but its newest.
+# Entries of items that have been purged go too: a trashed folder only gets
+# a tombstone of its own, which stands for everything inside it. A deleted
+# item's last entry (its tombstone) is dropped after CHANGES_RETENTION_DAYS;
+# cursors older than that have expired, and their clients must list
+# everything again.
+#
+# Ids are handed out when a row is inserted but become visible when its
+# transaction commits. If two writers of one user could commit in the other
+# order, a client could read the later id, move its cursor past it and never
+# see the earlier one. record() therefore locks the user's row until the
+# transaction commits, which makes a user's entries commit in id order.
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorExpired(Exception):
+    pass
+
+
+def record(user, kind, action, item_ids):
+    with transaction.atomic():
+        CustomUser.objects.select_for_update().filter(pk=user.pk).exists()
+        Change.objects.bulk_create(
+            (
+                Change(user_id=user.pk, kind=kind, action=action, item_id=item_id)
+                for item_id in item_ids
+            ),
+            batch_size=1000,
+        )
+
+
+def make_cursor(change_id, issued):
+    return f"{change_id}.{int(issued)}"
+
+
+def parse_cursor(cursor):
+    try:
+        change_id, issued = cursor.split(".")
+        return int(change_id), int(issued)
+    except ValueError:
+        raise InvalidCursor(cursor)
+
+
+def current_cursor(user):
+    last = (
+        Change.objects.filter(user=user)
+        .order_by("-id")
+        .values_list("id", flat=True)
+        .first()
+    )
+    return make_cursor(last or 0, time.time())
+
+
+def feed(user, cursor, limit):
+    """
+    Up to limit changes after cursor, oldest first, and the cursor to ask
+    with next. has_more means there are more right away.
+    """
+    after, issued = parse_cursor(cursor)
+    if issued < time.time() - settings.CHANGES_RETENTION_DAYS * 24 * 3600:
+        raise CursorExpired(cursor)
+
+    rows = list(
+        Change.objects.filter(user=user, id__gt=after)
+        .order_by("id")
+        .values_list("id", "kind", "action", "item_id", "created_at")[: limit + 1]
+    )
+    has_more = len(rows) > limit
+    if has_more:
+        # the client is only up to date until the first change it hasn't seen
+        issued = rows[limit][4].timestamp()
+        rows = rows[:limit]
+    else:
+        issued = time.time()
+    last = rows[-1][0] if rows else after
+    return {
+        "changes": entries(rows),
+        "cursor": make_cursor(last, issued),
+        "has_more": has_more,
+    }
+
+
+def entries(rows):
+    # an item changed more than once in this page only needs its latest entry
+    latest = {}
+    for _, kind, action, item_id, _ in rows:
+        latest.pop((kind, item_id), None)
+        latest[kind, item_id] = action
+
+    wanted = {
+        kind: [
+            i for (k, i), action in latest.items() if k == kind and action != "delete"
+        ]
+        for kind in ("file", "folder")
+    }
+    files = UserFile.objects.in_bulk(wanted["file"])
+    folders = Folder.objects.in_bulk(wanted["folder"])
+
+    result = []
+    for (kind, item_id), action in latest.items():
+        if action == "delete":
+            result.append({"action": action, "type": kind, "id": item_id})
+        elif kind == "file" and item_id in files:
+            result.append(file_entry(action, files[item_id]))
+        elif kind == "folder" and item_id in folders:
+            result.append(folder_entry(action, folders[item_id]))
+        # otherwise it has been trashed or deleted since; its tombstone follows
+    return result
+
+
+def file_entry(action, user_file):
+    return {
+        "action": action,
+        "type": "file",
+        "id": user_file.pk,
+        "name": user_file.filename,
+        "parent": user_file.parent_folder_id,
+        "size": user_file.size,
+        "uploaded_at": user_file.uploaded_at,
+        "unique_link": user_file.unique_link,
+    }
+
+
+def folder_entry(action, folder):
+    return {
+        "action": action,
+        "type": "folder",
+        "id": folder.pk,
+        "name": folder.name,
+        "parent": folder.parent_id,
+        "unique_link": folder.unique_link,
+    }
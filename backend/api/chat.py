@@ -0,0 +1,128 @@
+import json
+import asyncio
+import contextlib
+import httpx
+from django.conf import settings
+from . import metrics
+from .models import ChatMessage
+
+
+SYSTEM_PROMPT = "You are a helpful AI assistant."
+HISTORY_LENGTH = 15
+
+# Under ASGI one pooled client serves the whole worker, so connections (and
+# HTTP/2 streams) to the chat API are reused instead of paying a TLS
+# handshake on every message. An httpx client belongs to the event loop it
+# was first used on, and under WSGI every request runs on a loop of its own
+# that is closed afterwards, so there each request gets a client of its own
+# and closes it when the reply is done.
+_client = None
+_client_loop = None
+
+
+def new_client():
+    return httpx.AsyncClient(
+        http2=True,
+        timeout=httpx.Timeout(settings.CHAT_TIMEOUT, connect=10),
+        limits=httpx.Limits(
+            max_connections=settings.CHAT_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.CHAT_MAX_CONNECTIONS,
+        ),
+    )
+
+
+@contextlib.asynccontextmanager
+async def client(shared):
+    """The worker's client if shared (the caller runs on the ASGI loop)."""
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if shared and (_client is None or _client.is_closed):
+        _client, _client_loop = new_client(), loop
+    if shared and _client_loop is loop:
+        yield _client
+        return
+    async with new_client() as own_client:
+        yield own_client
+
+
+def model_for(package):
+    if package.name.lower() == "pro":
+        return "llama-3.3-70b-versatile"
+    return "groq/compound-mini"
+
+
+def is_chat_message(m):
+    return (
+        isinstance(m, dict)
+        and "role" in m
+        and "content" in m
+        and isinstance(m["role"], str)
+        and isinstance(m["content"], str)
+    )
+
+
+def load_conversation(user):
+    """The latest messages to send as context, oldest first."""
+    conversation = []
+    rows = ChatMessage.objects.filter(user=user).order_by("-id")
+    # Newest first, decrypting only until we have enough valid messages
+    for row in rows.iterator(chunk_size=HISTORY_LENGTH):
+        try:
+            message = row.get_message()
+        except Exception:
+            continue
+        if is_chat_message(message):
+            conversation.append(message)
+            if len(conversation) == HISTORY_LENGTH:
+                break
+    conversation.reverse()
+    return conversation
+
+
+def build_messages(conversation):
+    return [{"role": "system", "content": SYSTEM_PROMPT}] + conversation
+
+
+def append_messages(user, messages):
+    rows = []
+    for message in messages:
+        row = ChatMessage(user=user)
+        row.set_message(message)
+        rows.append(row)
+    ChatMessage.objects.bulk_create(rows)
+
+
+class UpstreamError(Exception):
+    def __init__(self, status_code, details):
+        super().__init__(f"Groq API error {status_code}")
+        self.status_code = status_code
+        self.details = details
+
+
+async def stream_reply(model_id, messages, shared=False):
+    """
+    Yield the reply text piece by piece as the chat API produces it. shared
+    uses the worker's pooled client; only for requests served by ASGI.
+    """
+    payload = {"model": model_id, "messages": messages, "stream": True}
+    headers = {"Authorization": f"Bearer {settings.GROQ_API_KEY}"}
+
+    async with client(shared) as http:
+        with metrics.upstream("groq"):
+            async with http.stream(
+                "POST", settings.GROQ_CHAT_URL, headers=headers, json=payload
+            ) as response:
+                if response.status_code != 200:
+                    details = (await response.aread()).decode(errors="replace")
+                    raise UpstreamError(response.status_code, details)
+
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    choices = json.loads(data).get("choices") or [{}]
+                    content = choices[0].get("delta", {}).get("content")
+                    if content:
+                        yield content
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core import checks
+
+
+# Caches that live in one process only, or don't keep anything at all
+PROCESS_LOCAL_CACHES = {
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+}
+
+
+@checks.register(checks.Tags.database, checks.Tags.caches)
+def check_replica_pins(app_configs, **kwargs):
+    """Read replicas need a shared cache for api.routers' primary pins."""
+    backend = settings.CACHES["default"]["BACKEND"]
+    if settings.REPLICA_DATABASES and backend in PROCESS_LOCAL_CACHES:
+        return [
+            checks.Warning(
+                "DATABASE_REPLICA_URLS is set but the cache is not shared "
+                "between processes.",
+                hint=(
+                    "Set REDIS_URL. Otherwise a user who has just written is "
+                    "pinned to the primary only in the worker that served the "
+                    "write, and other workers read from a lagging replica."
+                ),
+                id="api.W001",
+            )
+        ]
+    return []
@@ -0,0 +1,107 @@
+import os
+from django.core.exceptions import ImproperlyConfigured
+
+
+try:
+    import zstandard
+except ImportError:  # compression at rest is off without zstandard
+    zstandard = None
+
+
+# Blobs can be stored zstd-compressed (STORAGE_COMPRESSION = "zstd"). A
+# compressed blob is stored under its usual name plus SUFFIX; blob names are
+# otherwise bare hashes, so the name alone tells readers to decompress.
+
+SUFFIX = ".zst"
+READ_SIZE = 64 * 1024
+# The start of a file is test-compressed first; incompressible data (random,
+# encrypted, formats not in SIGNATURES) is not worth compressing in full
+SAMPLE_SIZE = 256 * 1024
+MIN_SIZE = 1024
+# Keep the compressed copy only if it saves at least this much
+MIN_SAVING = 0.1
+
+# (offset, bytes) identifying formats that are compressed already
+SIGNATURES = [
+    (0, b"\xff\xd8\xff"),  # JPEG
+    (0, b"\x89PNG"),
+    (0, b"GIF8"),
+    (8, b"WEBP"),
+    (4, b"ftyp"),  # MP4, MOV, M4A, HEIC, AVIF
+    (0, b"\x1aE\xdf\xa3"),  # Matroska, WebM
+    (0, b"OggS"),
+    (0, b"fLaC"),
+    (0, b"ID3"),  # MP3
+    (0, b"PK\x03\x04"),  # ZIP, and DOCX, XLSX, JAR, APK, EPUB...
+    (0, b"\x1f\x8b"),  # gzip
+    (0, b"\x28\xb5\x2f\xfd"),  # zstd
+    (0, b"\xfd7zXZ\x00"),  # xz
+    (0, b"BZh"),  # bzip2
+    (0, b"7z\xbc\xaf\x27\x1c"),
+    (0, b"Rar!\x1a\x07"),
+]
+
+# The same formats by file extension, for when reading the first bytes would
+# cost a request (folder archives)
+COMPRESSED_EXTENSIONS = set(
+    ".jpg .jpeg .png .gif .webp .heic .avif "
+    ".mp4 .m4v .mov .mkv .webm .avi .mp3 .m4a .aac .ogg .opus .flac "
+    ".zip .gz .tgz .bz2 .xz .zst .7z .rar "
+    ".docx .xlsx .pptx .odt .ods .odp .epub .jar .apk".split()
+)
+
+
+def require_zstandard():
+    if zstandard is None:
+        raise ImproperlyConfigured("Compressed storage needs zstandard installed")
+
+
+def is_compressed(name):
+    return name.startswith("blobs/") and name.endswith(SUFFIX)
+
+
+def already_compressed(head):
+    return any(head[offset:].startswith(magic) for offset, magic in SIGNATURES)
+
+
+def compressed_type(filename):
+    return os.path.splitext(filename)[1].lower() in COMPRESSED_EXTENSIONS
+
+
+def worth_compressing(path, size):
+    if size < MIN_SIZE:
+        return False
+    with open(path, "rb") as f:
+        sample = f.read(SAMPLE_SIZE)
+    if already_compressed(sample):
+        return False
+    compressed = zstandard.ZstdCompressor(level=1).compress(sample)
+    return len(compressed) <= len(sample) * (1 - MIN_SAVING)
+
+
+def compress_file(src, dst, level):
+    """Write a zstd-compressed copy of src to dst, synced to disk."""
+    with open(src, "rb") as source, open(dst, "wb") as target:
+        zstandard.ZstdCompressor(level=level).copy_stream(
+            source, target, size=os.path.getsize(src)
+        )
+        target.flush()
+        os.fsync(target.fileno())
+
+
+def reader(fileobj):
+    """
+    A read-only file object giving the decompressed bytes of fileobj. It can
+    seek forward (by decompressing and dropping), which is enough for ranges.
+    """
+    require_zstandard()
+    return zstandard.ZstdDecompressor().stream_reader(
+        fileobj, read_size=READ_SIZE, closefd=True
+    )
+
+
+def decompress_chunks(fileobj):
+    require_zstandard()
+    yield from zstandard.ZstdDecompressor().read_to_iter(
+        fileobj, read_size=READ_SIZE, write_size=READ_SIZE
+    )
@@ -0,0 +1,280 @@
+import os
+import uuid
+import functools
+import mimetypes
+from urllib.parse import quote
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import (
+    content_disposition_header,
+    http_date,
+    parse_etags,
+    parse_http_date_safe,
+    quote_etag,
+)
+from . import compression, storage
+
+
+READ_BLOCK_SIZE = 64 * 1024
+MAX_RANGES = 16
+
+
+class ChunkedAsyncMixin:
+    """
+    Under ASGI Django serves a sync iterator by reading all of it into a list
+    first, which would hold a whole download or ZIP in memory. Responses with
+    this mixin hand it over a chunk at a time instead, each one read on the
+    request's worker thread. Under WSGI nothing changes.
+    """
+
+    async def __aiter__(self):
+        if self.is_async:
+            async for part in self.streaming_content:
+                yield part
+            return
+        parts = iter(self.streaming_content)
+        next_part = sync_to_async(next)
+        while (part := await next_part(parts, None)) is not None:
+            yield part
+
+
+class StreamingResponse(ChunkedAsyncMixin, StreamingHttpResponse):
+    pass
+
+
+class FileStreamResponse(ChunkedAsyncMixin, FileResponse):
+    pass
+
+
+def file_etag(file_obj):
+    """Stored files never change in place, so id + size + upload time is enough."""
+    return quote_etag(
+        f"{file_obj.unique_link.hex}-{file_obj.size}-{int(file_obj.uploaded_at.timestamp())}"
+    )
+
+
+def file_content_type(filename):
+    content_type, encoding = mimetypes.guess_type(filename)
+    if not content_type or encoding:
+        return "application/octet-stream"
+    return content_type
+
+
+def parse_range_header(header, size):
+    """
+    Parse a "bytes=" Range header into a list of (start, end) pairs,
+    end inclusive.
+    Returns None when the header should be ignored (bad syntax, other units,
+    too many ranges) and [] when no range can be satisfied.
+    """
+    units, _, spec = header.partition("=")
+    if units.strip().lower() != "bytes" or not spec:
+        return None
+
+    ranges = []
+    for part in spec.split(","):
+        start, sep, end = part.strip().partition("-")
+        if not sep:
+            return None
+        try:
+            if start:
+                start, end = int(start), int(end) if end else size - 1
+                if start > end and start < size:
+                    return None
+            else:
+                # suffix range: last N bytes
+                length = int(end)
+                start, end = max(size - length, 0), size - 1
+                if length == 0:
+                    continue
+        except ValueError:
+            return None
+        if start >= size:
+            continue
+        ranges.append((start, min(end, size - 1)))
+
+    if len(ranges) > MAX_RANGES:
+        return None
+    return ranges
+
+
+def if_range_matches(request, etag, last_modified):
+    header = request.META.get("HTTP_IF_RANGE")
+    if not header:
+        return True
+    if header.startswith('"') or header.startswith("W/"):
+        return parse_etags(header) == [etag]
+    return parse_http_date_safe(header) == last_modified
+
+
+def read_range(open_file, start, end):
+    with open_file() as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            data = f.read(min(READ_BLOCK_SIZE, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+
+def part_header(start, end, size, content_type, boundary):
+    return (
+        f"\r\n--{boundary}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+    ).encode()
+
+
+def multipart_ranges(open_file, ranges, size, content_type, boundary):
+    for start, end in ranges:
+        yield part_header(start, end, size, content_type, boundary)
+        yield from read_range(open_file, start, end)
+    yield f"\r\n--{boundary}--\r\n".encode()
+
+
+def multipart_length(ranges, size, content_type, boundary):
+    length = len(f"\r\n--{boundary}--\r\n")
+    for start, end in ranges:
+        length += len(part_header(start, end, size, content_type, boundary))
+        length += end - start + 1
+    return length
+
+
+def add_file_headers(response, etag, last_modified):
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    response["Accept-Ranges"] = "bytes"
+    patch_cache_control(
+        response, public=True, max_age=settings.DOWNLOAD_CACHE_MAX_AGE
+    )
+    return response
+
+
+def internal_url(name):
+    """Where the web server finds a stored file in X-Accel-Redirect mode."""
+    return f"{settings.DOWNLOAD_ACCEL_PREFIX.rstrip('/')}/{quote(name)}"
+
+
+def offload_response(file_obj, content_type):
+    """
+    Empty response that tells nginx (X-Accel-Redirect) or Apache/lighttpd
+    (X-Sendfile) to send the file. They handle Range requests themselves.
+    """
+    response = HttpResponse(content_type=content_type)
+    if settings.DOWNLOAD_OFFLOAD == "nginx":
+        response["X-Accel-Redirect"] = internal_url(file_obj.file.name)
+    else:
+        response["X-Sendfile"] = file_obj.file.path
+    return response
+
+
+def serve_thumbnail(request, thumb):
+    """A stored preview image; the blob and size never change what's in it."""
+    etag = quote_etag(f"{thumb.blob_id}-{thumb.size}")
+    last_modified = int(thumb.created_at.timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        if settings.DOWNLOAD_OFFLOAD:
+            response = offload_response(thumb, thumb.content_type)
+        else:
+            response = FileStreamResponse(
+                thumb.file.open("rb"), content_type=thumb.content_type
+            )
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    patch_cache_control(response, public=True, max_age=settings.DOWNLOAD_CACHE_MAX_AGE)
+    return response
+
+
+def zip_manifest(members):
+    """
+    File list for nginx mod_zip: "crc32 size location name" per line, from
+    (file, name) pairs.
+    """
+    for f, arcname in members:
+        yield f"- {f.size} {internal_url(f.file.name)} {arcname}\n"
+
+
+def has_compressed(files):
+    """Compressed blobs have to go through Django to be decompressed."""
+    return files.filter(
+        file__startswith="blobs/", file__endswith=compression.SUFFIX
+    ).exists()
+
+
+def serve_file(request, file_obj, as_attachment=True):
+    """
+    Build the response for a stored file: conditional GET (304), single
+    range (206), multiple ranges (206 multipart/byteranges) or the full body.
+    With DOWNLOAD_OFFLOAD set only the headers come from here, except for
+    compressed blobs: those are decompressed as they are sent, and a range
+    is read by decompressing up to its start.
+    """
+    etag = file_etag(file_obj)
+    last_modified = int(file_obj.uploaded_at.timestamp())
+
+    not_modified = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if not_modified is not None:
+        return add_file_headers(not_modified, etag, last_modified)
+
+    content_type = file_content_type(file_obj.filename)
+    compressed = compression.is_compressed(file_obj.file.name)
+    if settings.DOWNLOAD_OFFLOAD and not compressed:
+        response = offload_response(file_obj, content_type)
+        response["Content-Disposition"] = content_disposition_header(
+            as_attachment, file_obj.filename
+        )
+        return add_file_headers(response, etag, last_modified)
+
+    if compressed:
+        size = file_obj.size
+        open_file = functools.partial(storage.open_file, file_obj.file.name)
+    else:
+        path = file_obj.file.path
+        size = os.path.getsize(path)
+        open_file = functools.partial(open, path, "rb")
+    range_header = request.META.get("HTTP_RANGE")
+    ranges = None
+    if range_header and if_range_matches(request, etag, last_modified):
+        ranges = parse_range_header(range_header, size)
+
+    if ranges == []:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return add_file_headers(response, etag, last_modified)
+
+    if ranges is None and compressed:
+        response = StreamingResponse(
+            read_range(open_file, 0, size - 1), content_type=content_type
+        )
+        response["Content-Length"] = size
+    elif ranges is None:
+        response = FileStreamResponse(open_file(), content_type=content_type)
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        response = StreamingResponse(
+            read_range(open_file, start, end), content_type=content_type, status=206
+        )
+        response["Content-Length"] = end - start + 1
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    else:
+        boundary = uuid.uuid4().hex
+        response = StreamingResponse(
+            multipart_ranges(open_file, ranges, size, content_type, boundary),
+            content_type=f"multipart/byteranges; boundary={boundary}",
+            status=206,
+        )
+        response["Content-Length"] = multipart_length(
+            ranges, size, content_type, boundary
+        )
+
+    response["Content-Disposition"] = content_disposition_header(
+        as_attachment, file_obj.filename
+    )
+    return add_file_headers(response, etag, last_modified)
@@ -0,0 +1,151 @@
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+from . import blobs, changes, quota, search, uploads
+from .models import Folder, FolderClosure, SearchEntry, UploadSession, UserFile
+
+
+# Folder hierarchy is stored twice: Folder.parent for direct children and
+# FolderClosure with one row per (ancestor, descendant) pair, depth 0 being
+# the folder itself. Subtree operations are then a fixed number of indexed
+# queries no matter how deep or wide the tree is.
+
+
+def db_id(folder):
+    return Folder._meta.pk.get_db_prep_value(folder.pk, connection)
+
+
+def subtree_ids(folder):
+    """Subquery of the ids of a folder and everything below it."""
+    return FolderClosure.objects.filter(ancestor=folder).values("descendant")
+
+
+def subtree_files(folder):
+    return UserFile.objects.filter(parent_folder__in=subtree_ids(folder))
+
+
+def create_folder(user, name, parent=None):
+    with transaction.atomic():
+        folder = Folder.objects.create(user=user, name=name, parent=parent)
+        links = [FolderClosure(ancestor=folder, descendant=folder, depth=0)]
+        if parent:
+            links += [
+                FolderClosure(
+                    ancestor_id=ancestor_id, descendant=folder, depth=depth + 1
+                )
+                for ancestor_id, depth in FolderClosure.objects.filter(
+                    descendant=parent
+                ).values_list("ancestor_id", "depth")
+            ]
+        FolderClosure.objects.bulk_create(links)
+        search.add_folder(folder)
+        changes.record(user, "folder", "insert", [folder.pk])
+    return folder
+
+
+def is_in_subtree(folder, other):
+    return FolderClosure.objects.filter(ancestor=folder, descendant=other).exists()
+
+
+def move_folder(folder, new_parent):
+    """Re-hang a folder (and its subtree) under new_parent, or the root if None."""
+    closure = FolderClosure._meta.db_table
+    with transaction.atomic():
+        # Unlink the subtree from its old ancestors
+        FolderClosure.objects.filter(
+            descendant__in=subtree_ids(folder),
+            ancestor__in=FolderClosure.objects.filter(descendant=folder)
+            .exclude(ancestor=folder)
+            .values("ancestor"),
+        ).delete()
+
+        # Link every node of the subtree to every ancestor of the new parent
+        if new_parent:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"INSERT INTO {closure} (ancestor_id, descendant_id, depth) "
+                    f"SELECT a.ancestor_id, d.descendant_id, a.depth + d.depth + 1 "
+                    f"FROM {closure} a, {closure} d "
+                    f"WHERE a.descendant_id = %s AND d.ancestor_id = %s",
+                    [db_id(new_parent), db_id(folder)],
+                )
+
+        folder.parent = new_parent
+        folder.save(update_fields=["parent"])
+        changes.record(folder.user, "folder", "rename", [folder.pk])
+
+
+def subtree_stats(folder):
+    stats = subtree_files(folder).aggregate(
+        size=Coalesce(Sum("size"), 0), file_count=Count("id")
+    )
+    stats["folder_count"] = subtree_ids(folder).count()
+    return stats
+
+
+def purge_folder(folder):
+    """
+    Permanently remove a folder and everything below it.
+    Storage quota is not touched here; it was given back when the folder
+    went to the trash.
+    """
+    folder_table = Folder._meta.db_table
+    closure = FolderClosure._meta.db_table
+    with transaction.atomic():
+        blobs.delete_user_files(
+            UserFile.all_objects.filter(parent_folder__in=subtree_ids(folder))
+        )
+
+        sessions = list(
+            UploadSession.objects.filter(parent_folder__in=subtree_ids(folder))
+        )
+        UploadSession.objects.filter(pk__in=[s.pk for s in sessions]).delete()
+        quota.release(folder.user, sum(s.size for s in sessions))
+
+        def discard_chunks():
+            for session in sessions:
+                uploads.discard_session(session)
+
+        transaction.on_commit(discard_chunks)
+        SearchEntry.objects.filter(folder__in=subtree_ids(folder)).delete()
+
+        # Foreign keys are checked at commit, so folders can go before their
+        # closure rows and the whole subtree is removed by two statements.
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {folder_table} WHERE id IN "
+                f"(SELECT descendant_id FROM {closure} WHERE ancestor_id = %s)",
+                [db_id(folder)],
+            )
+        FolderClosure.objects.filter(descendant__in=subtree_ids(folder)).delete()
+
+
+def subtree_paths(folder):
+    """Map every folder id in the subtree to its path relative to folder."""
+    rows = Folder.objects.filter(id__in=subtree_ids(folder)).values_list(
+        "id", "parent_id", "name"
+    )
+    parents = {folder_id: (parent_id, name) for folder_id, parent_id, name in rows}
+    paths = {folder.pk: ""}
+
+    for folder_id in parents:
+        # walk up iteratively so 10k-deep trees don't hit the recursion limit
+        chain = []
+        while folder_id not in paths:
+            chain.append(folder_id)
+            folder_id = parents[folder_id][0]
+        for node in reversed(chain):
+            parent_id, name = parents[node]
+            paths[node] = f"{paths[parent_id]}{archive_name(name)}/"
+    return paths
+
+
+def archive_name(name):
+    # names stored before uploads were cleaned may still hold "/" or ".."
+    return uploads.clean_filename(name) or "_"
+
+
+def archive_members(files, paths):
+    """(file, path in the archive) for each of files, paths from subtree_paths."""
+    for f in files:
+        yield f, f"{paths[f.parent_folder_id]}{archive_name(f.filename)}"
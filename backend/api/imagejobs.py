@@ -0,0 +1,168 @@
+import base64
+import time
+import logging
+import requests
+from datetime import timedelta
+from urllib.parse import urljoin
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from . import blobs, metrics, quota
+from .models import ImageJob
+
+
+logger = logging.getLogger(__name__)
+
+FIRST_POLL_DELAY = 2
+MAX_POLL_DELAY = 15
+POLL_BACKOFF = 1.5
+
+# Jobs run on a small thread pool inside the web process. They spend nearly
+# all their time waiting on Stable Horde, so a few threads go a long way and
+# no request worker is held while an image is being generated.
+_executor = None
+_session = requests.Session()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_JOB_WORKERS, thread_name_prefix="imagejob"
+        )
+    return _executor
+
+
+class JobFailed(Exception):
+    pass
+
+
+def create_job(user, prompt):
+    job = ImageJob.objects.create(
+        user=user,
+        prompt=prompt,
+        deadline=timezone.now() + timedelta(seconds=settings.IMAGE_JOB_TIMEOUT),
+    )
+    transaction.on_commit(lambda: get_executor().submit(run_job, job.pk))
+    return job
+
+
+def expire(job):
+    """Fail a job whose worker is gone (e.g. the process restarted)."""
+    if not job.finished and job.deadline < timezone.now():
+        update(job, status="failed", error="Image generation timed out")
+    return job
+
+
+def update(job, **fields):
+    for name, value in fields.items():
+        setattr(job, name, value)
+    job.save(update_fields=[*fields, "updated_at"])
+
+
+def horde_headers():
+    return {"apikey": settings.API_KEY, "Content-Type": "application/json"}
+
+
+def horde_url(path):
+    # STABLE_HORDE_URL points at .../generate/async
+    return urljoin(settings.STABLE_HORDE_URL, path)
+
+
+def submit_upstream(prompt):
+    payload = {
+        "prompt": prompt,
+        "steps": 20,
+        "cfg_scale": 7,
+        "sampler_name": "k_euler",
+        "nsfw": True,
+    }
+    with metrics.upstream("horde"):
+        response = _session.post(
+            settings.STABLE_HORDE_URL, headers=horde_headers(), json=payload, timeout=30
+        )
+    if response.status_code not in [200, 202]:
+        raise JobFailed(f"Stable Horde API error {response.status_code}")
+    upstream_id = response.json().get("id")
+    if not upstream_id:
+        raise JobFailed("No prediction ID returned")
+    return upstream_id
+
+
+def wait_upstream(job):
+    """Poll the light check endpoint with backoff until done or the deadline."""
+    delay = FIRST_POLL_DELAY
+    while True:
+        remaining = (job.deadline - timezone.now()).total_seconds()
+        if remaining <= 0:
+            raise JobFailed("Image generation timed out")
+        time.sleep(min(delay, remaining))
+        with metrics.upstream("horde"):
+            response = _session.get(
+                horde_url(f"check/{job.upstream_id}"),
+                headers=horde_headers(),
+                timeout=30,
+            )
+        if response.status_code == 200:
+            data = response.json()
+            if data.get("faulted") or data.get("is_possible") is False:
+                raise JobFailed("Stable Horde could not generate the image")
+            if data.get("done"):
+                return
+        delay = min(delay * POLL_BACKOFF, MAX_POLL_DELAY)
+
+
+def fetch_image(job):
+    with metrics.upstream("horde"):
+        response = _session.get(
+            horde_url(f"status/{job.upstream_id}"), headers=horde_headers(), timeout=30
+        )
+    response.raise_for_status()
+    img = response.json().get("generations", [{}])[0].get("img")
+    if not img:
+        raise JobFailed("No image returned")
+    if img.startswith("http"):
+        with metrics.upstream("horde"):
+            download = _session.get(img, timeout=60)
+        download.raise_for_status()
+        return download.content
+    return base64.b64decode(img)
+
+
+def store_image(job, data):
+    writer = blobs.write_chunks([data])
+    if not quota.reserve(job.user, writer.size):
+        writer.discard()
+        raise JobFailed("You exceeded your package storage limit")
+    try:
+        with transaction.atomic():
+            blob = blobs.store(writer)
+            user_file = blobs.create_user_file(
+                job.user, blob, f"generated-{job.pk.hex[:8]}.webp", None
+            )
+            quota.commit(job.user, writer.size)
+    except Exception:
+        quota.release(job.user, writer.size)
+        raise
+    return user_file
+
+
+def run_job(job_id):
+    close_old_connections()
+    try:
+        job = ImageJob.objects.select_related("user").get(pk=job_id)
+        update(job, status="running")
+        try:
+            update(job, upstream_id=submit_upstream(job.prompt))
+            wait_upstream(job)
+            user_file = store_image(job, fetch_image(job))
+        except JobFailed as e:
+            update(job, status="failed", error=str(e))
+        except Exception as e:
+            logger.exception("Image job %s failed", job_id)
+            update(job, status="failed", error=str(e))
+        else:
+            update(job, status="done", result=user_file)
+    finally:
+        close_old_connections()
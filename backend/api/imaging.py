@@ -0,0 +1,71 @@
+import io
+
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # thumbnails are off without Pillow
+    Image = None
+
+try:
+    import pypdfium2
+except ImportError:  # no PDF previews without pypdfium2
+    pypdfium2 = None
+
+
+# Runs in the thumbnail process pool (see api.thumbnails). Pool processes are
+# started fresh, so this module must not import Django or anything that does.
+
+
+def can_render(kind):
+    if Image is None:
+        return False
+    return kind == "image" or (kind == "pdf" and pypdfium2 is not None)
+
+
+def output_format():
+    if features.check("webp"):
+        return "WEBP", "image/webp", ".webp"
+    return "JPEG", "image/jpeg", ".jpg"
+
+
+def open_source(source, kind, size):
+    """Decode just enough of source (path or bytes) for a size px preview."""
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    if kind == "pdf":
+        pdf = pypdfium2.PdfDocument(source)
+        try:
+            page = pdf[0]
+            scale = min(size / max(page.get_size()), 4)
+            return page.render(scale=scale).to_pil()
+        finally:
+            pdf.close()
+
+    image = Image.open(source)
+    # JPEG can decode at 1/2, 1/4 or 1/8 scale, far cheaper for camera photos
+    image.draft("RGB", (size, size))
+    return ImageOps.exif_transpose(image)
+
+
+def render(source, kind, sizes):
+    """
+    Make a preview no larger than each of sizes (longest side, px).
+    Returns [(size, content_type, extension, data)]. Each size is scaled
+    down from the previous, larger one instead of from the original.
+    """
+    sizes = sorted(sizes, reverse=True)
+    image = open_source(source, kind, sizes[0])
+    fmt, content_type, ext = output_format()
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+    if fmt == "WEBP" and has_alpha:
+        image = image.convert("RGBA")
+    else:
+        image = image.convert("RGB")
+
+    results = []
+    for size in sizes:
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        out = io.BytesIO()
+        image.save(out, fmt, quality=80)
+        results.append((size, content_type, ext, out.getvalue()))
+    return results
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from api import blobs
+from api.models import UserFile
+
+
+class Command(BaseCommand):
+    help = "Move files stored before deduplication into the blob store."
+
+    def handle(self, *args, **options):
+        moved = missing = 0
+        for user_file in UserFile.all_objects.filter(blob__isnull=True).iterator():
+            old_name = user_file.file.name
+            if not old_name or not user_file.file.storage.exists(old_name):
+                missing += 1
+                continue
+
+            with user_file.file.open("rb") as f:
+                writer = blobs.write_chunks(f.chunks())
+
+            with transaction.atomic():
+                blob = blobs.store(writer)
+                UserFile.all_objects.filter(pk=user_file.pk).update(
+                    blob=blob, file=blob.file.name, size=blob.size
+                )
+            user_file.file.storage.delete(old_name)
+            moved += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Moved {moved} files into the blob store")
+        )
+        if missing:
+            self.stdout.write(
+                self.style.WARNING(f"{missing} files had no data on disk")
+            )
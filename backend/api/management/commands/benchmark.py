@@ -0,0 +1,143 @@
+import json
+import random
+import warnings
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django.utils import timezone
+from api import benchmark
+from api.models import CustomUser
+from api.upstream_stub import UpstreamStub
+
+
+DEFAULT_SCENARIOS = "storage,files,folders,usage,search,upload,download,zip,chat"
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure API latency, throughput, queries per request and peak memory "
+        "against data from seed_data. Chat and image generation talk to a "
+        "local stub instead of Groq and Stable Horde."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scenarios",
+            default=DEFAULT_SCENARIOS,
+            help=f"Comma separated, from: {', '.join(benchmark.SCENARIOS)}",
+        )
+        parser.add_argument("--prefix", default="bench", help="seed_data --prefix")
+        parser.add_argument("--requests", type=int, default=200, help="Per scenario")
+        parser.add_argument("--concurrency", type=int, default=1)
+        parser.add_argument("--warmup", type=int, default=5)
+        parser.add_argument(
+            "--upload-size", type=int, default=256 * 1024, help="Bytes per upload"
+        )
+        parser.add_argument(
+            "--stub-latency", type=int, default=50, help="Upstream API delay in ms"
+        )
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--save-baseline", metavar="FILE")
+        parser.add_argument("--baseline", metavar="FILE", help="Compare against")
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=10,
+            help="Fail when a metric is worse than the baseline by this many %%",
+        )
+
+    def handle(self, *args, **options):
+        names = [name.strip() for name in options["scenarios"].split(",")]
+        unknown = [name for name in names if name not in benchmark.SCENARIOS]
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(unknown)}")
+
+        users = list(
+            CustomUser.objects.filter(username__startswith=options["prefix"]).order_by(
+                "username"
+            )
+        )
+        if not users:
+            raise CommandError(f"No {options['prefix']}* users, run seed_data first")
+
+        baseline = None
+        if options["baseline"]:
+            try:
+                with open(options["baseline"]) as f:
+                    baseline = json.load(f)["results"]
+            except (OSError, ValueError, KeyError) as e:
+                raise CommandError(f"Can't read baseline: {e}")
+
+        rng = random.Random(options["seed"])
+        actors = [benchmark.Actor(user, rng, options["upload_size"]) for user in users]
+        # sync test client iterating the async chat_stream response
+        warnings.filterwarnings(
+            "ignore", message="StreamingHttpResponse must consume", category=Warning
+        )
+
+        results = {}
+        started_at = timezone.now()
+        last_message_id = benchmark.last_message_id()
+        with UpstreamStub(latency=options["stub_latency"] / 1000) as stub:
+            with override_settings(
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+                **stub.settings(),
+            ):
+                try:
+                    self.write_header()
+                    for name in names:
+                        results[name] = benchmark.run_scenario(
+                            name,
+                            actors,
+                            options["requests"],
+                            options["concurrency"],
+                            options["warmup"],
+                        )
+                        self.write_row(name, results[name])
+                finally:
+                    benchmark.clean_up(users, started_at, last_message_id)
+
+        if options["save_baseline"]:
+            with open(options["save_baseline"], "w") as f:
+                json.dump(
+                    {"options": self.run_options(options), "results": results},
+                    f,
+                    indent=2,
+                )
+            self.stdout.write(f"Saved baseline to {options['save_baseline']}")
+
+        if baseline is not None:
+            self.check_baseline(results, baseline, options["threshold"])
+
+    def run_options(self, options):
+        keys = ["prefix", "requests", "concurrency", "upload_size", "stub_latency"]
+        return {key: options[key] for key in keys}
+
+    def write_header(self):
+        self.stdout.write(
+            f"{'scenario':<12}{'reqs':>6}{'errs':>6}{'p50 ms':>10}{'p95 ms':>10}"
+            f"{'p99 ms':>10}{'req/s':>9}{'queries':>9}{'rss MB':>9}"
+        )
+
+    def write_row(self, name, r):
+        self.stdout.write(
+            f"{name:<12}{r['requests']:>6}{r['errors']:>6}{r['p50_ms']:>10.1f}"
+            f"{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}{r['rps']:>9.1f}"
+            f"{r['queries']:>9.1f}{r['peak_rss_mb']:>9.1f}"
+        )
+
+    def check_baseline(self, results, baseline, threshold):
+        rows = benchmark.compare(results, baseline, threshold)
+        regressions = []
+        for name, metric, old, new, change, regressed in rows:
+            line = f"{name:<12}{metric:<9}{old:>10.1f} -> {new:>10.1f} ({change:+.1f}%)"
+            if regressed:
+                regressions.append(line)
+                self.stdout.write(self.style.ERROR(line))
+            else:
+                self.stdout.write(line)
+        if regressions:
+            raise CommandError(
+                f"{len(regressions)} metrics regressed by more than {threshold}%"
+            )
+        self.stdout.write(self.style.SUCCESS("No regressions against the baseline"))
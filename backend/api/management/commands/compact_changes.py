@@ -0,0 +1,110 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from api.models import Change, Folder, UserFile
+
+
+class Command(BaseCommand):
+    help = (
+        "Keep the change journal bounded: drop every entry of an item except "
+        "its newest, the entries of items that have been purged, and the "
+        "tombstones of items deleted before the retention period. Runs in "
+        "small batches like purge_trash."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.CHANGES_RETENTION_DAYS,
+            help="Drop deletions older than this many days",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0.1,
+            help="Seconds to pause between batches",
+        )
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=0,
+            help="Keep running and compact again every N seconds",
+        )
+
+    def handle(self, *args, **options):
+        if options["days"] < settings.CHANGES_RETENTION_DAYS:
+            self.stderr.write(
+                self.style.WARNING(
+                    "--days is below CHANGES_RETENTION_DAYS: clients with cursors "
+                    "in between will miss deletions"
+                )
+            )
+        while True:
+            superseded, purged, tombstones = self.compact(
+                timezone.now() - timedelta(days=options["days"]),
+                options["batch_size"],
+                options["sleep"],
+            )
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Removed {superseded} superseded entries, {purged} entries "
+                    f"of purged items and {tombstones} expired deletions"
+                )
+            )
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
+
+    def compact(self, cutoff, batch_size, pause):
+        # An entry sends the item's current state, so an older entry of the
+        # same item tells no client anything the newest one doesn't
+        newer = Change.objects.filter(
+            item_id=OuterRef("item_id"), id__gt=OuterRef("id")
+        )
+        superseded = self.delete(
+            Change.objects.filter(Exists(newer)), batch_size, pause
+        )
+        # Trashing a folder records a deletion for the folder only; the
+        # entries of what was inside it are left once purge_trash removes it
+        purged = self.delete(
+            Change.objects.exclude(action="delete").filter(
+                Q(
+                    ~Exists(UserFile.all_objects.filter(pk=OuterRef("item_id"))),
+                    kind="file",
+                )
+                | Q(
+                    ~Exists(Folder.all_objects.filter(pk=OuterRef("item_id"))),
+                    kind="folder",
+                )
+            ),
+            batch_size,
+            pause,
+        )
+        tombstones = self.delete(
+            Change.objects.filter(action="delete", created_at__lt=cutoff),
+            batch_size,
+            pause,
+        )
+        return superseded, purged, tombstones
+
+    def delete(self, entries, batch_size, pause):
+        # each batch starts after the last one instead of scanning the
+        # entries that were kept all over again
+        deleted = last = 0
+        while True:
+            ids = list(
+                entries.filter(id__gt=last)
+                .order_by("id")
+                .values_list("id", flat=True)[:batch_size]
+            )
+            if not ids:
+                return deleted
+            Change.objects.filter(id__in=ids).delete()
+            deleted += len(ids)
+            last = ids[-1]
+            time.sleep(pause)
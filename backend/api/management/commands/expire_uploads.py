@@ -0,0 +1,48 @@
+import time
+from django.core.management.base import BaseCommand
+from api import uploads
+
+
+class Command(BaseCommand):
+    help = (
+        "Drop upload sessions that were never finished: delete their chunks "
+        "and release the storage they reserved."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0.1,
+            help="Seconds to pause between batches",
+        )
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=0,
+            help="Keep running and expire again every N seconds",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            expired = self.expire(options["batch_size"], options["sleep"])
+            self.stdout.write(
+                self.style.SUCCESS(f"Expired {expired} upload sessions")
+            )
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
+
+    def expire(self, batch_size, pause):
+        expired = 0
+        sessions = uploads.expired_sessions().select_related("user")
+        while True:
+            batch = list(sessions[:batch_size])
+            if not batch:
+                break
+            for session in batch:
+                uploads.drop_session(session)
+            expired += len(batch)
+            time.sleep(pause)
+        return expired
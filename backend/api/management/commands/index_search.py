@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from api import search
+from api.models import SearchEntry
+
+
+class Command(BaseCommand):
+    help = (
+        "Extract the text of files whose content isn't indexed yet (files "
+        "stored before search existed, or queued when the process stopped)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=200)
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Rebuild the SQLite full text index from the entries first",
+        )
+
+    def handle(self, *args, **options):
+        if options["rebuild"] and connection.vendor == "sqlite":
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"INSERT INTO {search.FTS_TABLE} ({search.FTS_TABLE}) "
+                    f"VALUES ('rebuild')"
+                )
+
+        pending = SearchEntry.objects.filter(
+            file__isnull=False, content_indexed_at__isnull=True
+        ).select_related("file")
+        indexed = 0
+        while True:
+            batch = list(pending.order_by("id")[: options["batch_size"]])
+            if not batch:
+                break
+            for entry in batch:
+                if search.content_kind(entry.file.filename):
+                    search.index_content(entry)
+                else:
+                    SearchEntry.objects.filter(pk=entry.pk).update(
+                        content_indexed_at=entry.file.uploaded_at
+                    )
+                indexed += 1
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} files"))
@@ -0,0 +1,77 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+from api import blobs, folders
+from api.models import Folder, UserFile
+
+
+class Command(BaseCommand):
+    help = (
+        "Permanently delete trashed files and folders older than the retention "
+        "period, in small batches so the database is never locked for long."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.TRASH_RETENTION_DAYS,
+            help="Purge items trashed more than this many days ago",
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0.1,
+            help="Seconds to pause between batches",
+        )
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=0,
+            help="Keep running and purge again every N seconds",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            cutoff = timezone.now() - timedelta(days=options["days"])
+            files, trees = self.purge(cutoff, options["batch_size"], options["sleep"])
+            self.stdout.write(
+                self.style.SUCCESS(f"Purged {files} files and {trees} folder trees")
+            )
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
+
+    def purge(self, cutoff, batch_size, pause):
+        # Files first: each batch is one short transaction
+        files = 0
+        expired = UserFile.all_objects.filter(trashed_at__lt=cutoff)
+        while True:
+            ids = list(expired.values_list("id", flat=True)[:batch_size])
+            if not ids:
+                break
+            blobs.delete_user_files(UserFile.all_objects.filter(id__in=ids))
+            files += len(ids)
+            time.sleep(pause)
+
+        # Then the now empty folder trees, from the top of each deleted tree
+        trees = 0
+        roots = Folder.all_objects.filter(
+            Q(parent__isnull=True)
+            | Q(parent__trashed_at__isnull=True)
+            | Q(parent__trashed_at__gte=cutoff),
+            trashed_at__lt=cutoff,
+        ).select_related("user")
+        while True:
+            batch = list(roots[:batch_size])
+            if not batch:
+                break
+            for folder in batch:
+                folders.purge_folder(folder)
+            trees += len(batch)
+            time.sleep(pause)
+        return files, trees
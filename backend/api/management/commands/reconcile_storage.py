@@ -0,0 +1,134 @@
+from datetime import timedelta
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from api import uploads
+from api.models import Blob, CustomUser, UserFile, UploadSession, blob_upload_path
+
+# Blob files younger than this may belong to a transaction still running
+ORPHAN_GRACE = timedelta(hours=1)
+
+
+def total_for_user(queryset):
+    return Coalesce(
+        Subquery(
+            queryset.filter(user=OuterRef("pk"))
+            .values("user")
+            .annotate(total=Sum("size"))
+            .values("total")
+        ),
+        Value(0),
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the per-user storage counters and the blob reference counts "
+        "from the UserFile table. Expired upload sessions are dropped first, "
+        "so they no longer count as reserved. Then files in the blob store "
+        "without a Blob row are deleted: a blob moved in by a transaction "
+        "that rolled back leaves one behind."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only reconcile this username")
+
+    def handle(self, *args, **options):
+        users = CustomUser.objects.all()
+        if options["user"]:
+            users = users.filter(username=options["user"])
+
+        for session in uploads.expired_sessions().filter(user__in=users):
+            uploads.drop_session(session)
+
+        with transaction.atomic():
+            users = users.annotate(
+                actual_used=total_for_user(UserFile.objects.all()),
+                actual_reserved=total_for_user(UploadSession.objects.all()),
+            )
+            drifted = [
+                u
+                for u in users.only(
+                    "id", "username", "storage_used", "storage_reserved"
+                )
+                if u.storage_used != u.actual_used
+                or u.storage_reserved != u.actual_reserved
+            ]
+            for u in drifted:
+                self.stdout.write(
+                    f"{u.username}: used {u.storage_used} -> {u.actual_used}, "
+                    f"reserved {u.storage_reserved} -> {u.actual_reserved}"
+                )
+                CustomUser.objects.filter(pk=u.pk).update(
+                    storage_used=total_for_user(UserFile.objects.all()),
+                    storage_reserved=total_for_user(UploadSession.objects.all()),
+                )
+
+            blob_refs = Coalesce(
+                Subquery(
+                    UserFile.all_objects.filter(blob=OuterRef("pk"))
+                    .values("blob")
+                    .annotate(total=Count("pk"))
+                    .values("total")
+                ),
+                Value(0),
+            )
+            blobs_fixed = (
+                Blob.objects.annotate(actual_refs=blob_refs)
+                .exclude(ref_count=F("actual_refs"))
+                .update(ref_count=blob_refs)
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Reconciled storage counters for {len(drifted)} users "
+                f"and {blobs_fixed} blobs"
+            )
+        )
+
+        if not options["user"]:
+            orphans = self.remove_orphans()
+            self.stdout.write(
+                self.style.SUCCESS(f"Removed {orphans} unreferenced blob files")
+            )
+
+    def remove_orphans(self):
+        cutoff = timezone.now() - ORPHAN_GRACE
+        # presigned uploads sit under their blob name until they are completed
+        uploading = {
+            blob_upload_path(Blob(sha256=sha256), sha256)
+            for sha256 in UploadSession.objects.exclude(sha256="").values_list(
+                "sha256", flat=True
+            )
+        }
+        removed = 0
+        for directory in blob_directories():
+            names = [
+                f"{directory}/{name}" for name in default_storage.listdir(directory)[1]
+            ]
+            known = set(
+                Blob.objects.filter(file__in=names).values_list("file", flat=True)
+            )
+            for name in names:
+                if (
+                    name not in known
+                    and name not in uploading
+                    and default_storage.get_modified_time(name) < cutoff
+                ):
+                    default_storage.delete(name)
+                    removed += 1
+        return removed
+
+
+def blob_directories():
+    """The blobs/xx/yy directories that exist in storage."""
+    try:
+        prefixes = default_storage.listdir("blobs")[0]
+    except FileNotFoundError:
+        return
+    for first in prefixes:
+        for second in default_storage.listdir(f"blobs/{first}")[0]:
+            yield f"blobs/{first}/{second}"
@@ -0,0 +1,137 @@
+import random
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from api import blobs, chat, folders, quota
+from api.models import CustomUser, Package, UserFile
+
+
+SIZE_UNITS = {"": 1, "b": 1, "k": 1024, "m": 1024**2, "g": 1024**3}
+
+
+def parse_sizes(spec):
+    """Turn "4k:60,256k:30,8m:10" into sizes in bytes and their weights."""
+    sizes, weights = [], []
+    try:
+        for part in spec.split(","):
+            size, _, weight = part.strip().partition(":")
+            size = size.strip().lower()
+            unit = size[-1] if size[-1] in SIZE_UNITS else ""
+            sizes.append(int(float(size.rstrip("bkmg")) * SIZE_UNITS[unit]))
+            weights.append(float(weight or 1))
+    except (ValueError, IndexError):
+        raise CommandError(f"Bad --file-sizes value: {spec!r}")
+    return sizes, weights
+
+
+class Command(BaseCommand):
+    help = (
+        "Create synthetic users with folder trees, files and chat history for "
+        "benchmarking. The same --seed gives the same data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=5)
+        parser.add_argument("--prefix", default="bench", help="Username prefix")
+        parser.add_argument("--folders", type=int, default=50, help="Per user")
+        parser.add_argument(
+            "--depth", type=int, default=4, help="Deepest folder nesting"
+        )
+        parser.add_argument("--files", type=int, default=500, help="Per user")
+        parser.add_argument(
+            "--file-sizes",
+            default="4k:60,256k:30,4m:10",
+            help="size:weight pairs the file sizes are drawn from",
+        )
+        parser.add_argument("--chat-messages", type=int, default=40, help="Per user")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Delete users with the prefix (and their files) first",
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        prefix = options["prefix"]
+        if options["clear"]:
+            self.clear(prefix)
+
+        sizes, weights = parse_sizes(options["file_sizes"])
+        package, _ = Package.objects.get_or_create(
+            name=f"{prefix}-package",
+            defaults={
+                "max_upload_size": 10 * 1024**4,
+                "chat_enabled": True,
+                "image_gen_enabled": True,
+            },
+        )
+        # hashing is deliberately slow; every seeded user shares one hash
+        password = make_password(prefix)
+
+        total = 0
+        for n in range(options["users"]):
+            username = f"{prefix}{n}"
+            if CustomUser.objects.filter(username=username).exists():
+                raise CommandError(f"{username} already exists, use --clear")
+            user = CustomUser.objects.create(
+                username=username,
+                email=f"{username}@example.com",
+                phone="+919999999999",
+                password=password,
+                package=package,
+            )
+            tree = self.seed_folders(user, rng, options["folders"], options["depth"])
+            total += self.seed_files(user, rng, tree, options["files"], sizes, weights)
+            self.seed_chat(user, rng, options["chat_messages"])
+            self.stdout.write(f"{username}: {len(tree)} folders")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Seeded {options['users']} users, "
+                f"{options['users'] * options['files']} files "
+                f"({total / 1024**2:.1f} MB). Password: {prefix}"
+            )
+        )
+
+    def clear(self, prefix):
+        for user in CustomUser.objects.filter(username__startswith=prefix):
+            # through blobs so shared content keeps correct reference counts
+            blobs.delete_user_files(UserFile.all_objects.filter(user=user))
+            user.delete()
+
+    def seed_folders(self, user, rng, count, max_depth):
+        tree = []  # (folder, depth)
+        for n in range(count):
+            parents = [(f, depth) for f, depth in tree if depth < max_depth]
+            parent, depth = (
+                rng.choice(parents) if parents and rng.random() < 0.7 else (None, 0)
+            )
+            folder = folders.create_folder(user, f"Folder {n}", parent)
+            tree.append((folder, depth + 1))
+        return [folder for folder, _ in tree]
+
+    def seed_files(self, user, rng, tree, count, sizes, weights):
+        total = 0
+        for n in range(count):
+            size = rng.choices(sizes, weights)[0]
+            folder = rng.choice(tree) if tree and rng.random() < 0.8 else None
+            ext = rng.choice(["txt", "pdf", "jpg", "png", "mp4", "zip", "docx"])
+            # random bytes: no two seeded files share a blob
+            writer = blobs.write_chunks([rng.randbytes(size)])
+            quota.reserve(user, size)
+            with transaction.atomic():
+                blob = blobs.store(writer)
+                blobs.create_user_file(user, blob, f"file-{n}.{ext}", folder)
+                quota.commit(user, size)
+            total += size
+        return total
+
+    def seed_chat(self, user, rng, count):
+        words = ["storage", "upload", "folder", "share", "zip", "quota", "link"]
+        messages = []
+        for n in range(count):
+            text = " ".join(rng.choices(words, k=rng.randint(5, 40)))
+            role = "user" if n % 2 == 0 else "assistant"
+            messages.append({"role": role, "content": text})
+        chat.append_messages(user, messages)
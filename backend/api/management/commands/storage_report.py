@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+from api.models import Blob
+
+
+class Command(BaseCommand):
+    help = (
+        "Show how much the blob store holds: the size users are charged for "
+        "and what it takes up in storage, by compression."
+    )
+
+    def handle(self, *args, **options):
+        rows = (
+            Blob.objects.values("compression")
+            .annotate(blobs=Count("pk"), logical=Sum("size"), stored=Sum("stored_size"))
+            .order_by("compression")
+        )
+        total_logical = total_stored = 0
+        for row in rows:
+            total_logical += row["logical"]
+            total_stored += row["stored"]
+            self.stdout.write(
+                f"{row['compression'] or 'none'}: {row['blobs']} blobs, "
+                f"{row['logical']} bytes stored in {row['stored']} "
+                f"({ratio(row['stored'], row['logical'])})"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Total: {total_logical} bytes stored in {total_stored} "
+                f"({ratio(total_stored, total_logical)})"
+            )
+        )
+
+
+def ratio(stored, logical):
+    return f"{stored / logical:.0%}" if logical else "-"
@@ -0,0 +1,272 @@
+import os
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from . import profiling
+
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# The RequestStats of the request being handled, if it is one we measure.
+# A context variable follows the request into sync_to_async threads and
+# async_to_sync loops, so queries and upstream calls made there count too.
+_current = contextvars.ContextVar("request_stats", default=None)
+
+
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db = 0.0
+        self.upstream = 0.0
+        self.bytes = 0
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        return (
+            f"app;dur={self.elapsed() * 1000:.1f}, "
+            f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries", '
+            f"upstream;dur={self.upstream * 1000:.1f}"
+        )
+
+
+class Registry:
+    """
+    Counters and histograms in Prometheus text format. They live in memory,
+    so each worker process reports its own: scrape every worker (each has a
+    distinct pid label) or run one worker per container.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = {}  # (view, method) -> [count per bucket..., sum]
+        self.requests = {}  # (view, method, status) -> count
+        self.totals = {}  # (metric, view) -> value
+        self.upstream = {}  # service -> [calls, seconds]
+
+    def observe(self, view, method, status, stats, duration):
+        with self.lock:
+            buckets = self.latency.setdefault(
+                (view, method), [0] * (len(BUCKETS) + 1) + [0.0]
+            )
+            for i, bound in enumerate(BUCKETS):
+                if duration <= bound:
+                    buckets[i] += 1
+            buckets[len(BUCKETS)] += 1  # +Inf
+            buckets[-1] += duration
+            key = (view, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            for metric, value in (
+                ("db_queries", stats.queries),
+                ("db_seconds", stats.db),
+                ("upstream_seconds", stats.upstream),
+                ("response_bytes", stats.bytes),
+            ):
+                self.totals[metric, view] = self.totals.get((metric, view), 0) + value
+
+    def observe_upstream(self, service, duration):
+        with self.lock:
+            calls = self.upstream.setdefault(service, [0, 0.0])
+            calls[0] += 1
+            calls[1] += duration
+
+    def render(self):
+        pid = f'pid="{os.getpid()}"'
+        lines = ["# TYPE api_request_duration_seconds histogram"]
+        with self.lock:
+            for (view, method), buckets in sorted(self.latency.items()):
+                labels = f'{pid},view="{view}",method="{method}"'
+                for bound, count in zip([*BUCKETS, "+Inf"], buckets):
+                    lines.append(
+                        f'api_request_duration_seconds_bucket{{{labels},le="{bound}"}} '
+                        f"{count}"
+                    )
+                lines.append(
+                    f"api_request_duration_seconds_sum{{{labels}}} {buckets[-1]}"
+                )
+                lines.append(
+                    f"api_request_duration_seconds_count{{{labels}}} {buckets[-2]}"
+                )
+
+            lines.append("# TYPE api_requests_total counter")
+            for (view, method, status), count in sorted(self.requests.items()):
+                lines.append(
+                    f'api_requests_total{{{pid},view="{view}",method="{method}",'
+                    f'status="{status}"}} {count}'
+                )
+
+            for metric in (
+                "db_queries",
+                "db_seconds",
+                "upstream_seconds",
+                "response_bytes",
+            ):
+                lines.append(f"# TYPE api_{metric}_total counter")
+                for (name, view), value in sorted(self.totals.items()):
+                    if name == metric:
+                        lines.append(
+                            f'api_{metric}_total{{{pid},view="{view}"}} {value}'
+                        )
+
+            lines.append("# TYPE api_upstream_calls_total counter")
+            for service, (calls, _) in sorted(self.upstream.items()):
+                lines.append(
+                    f'api_upstream_calls_total{{{pid},service="{service}"}} {calls}'
+                )
+            lines.append("# TYPE api_upstream_call_seconds_total counter")
+            for service, (_, seconds) in sorted(self.upstream.items()):
+                lines.append(
+                    f'api_upstream_call_seconds_total{{{pid},service="{service}"}} {seconds}'
+                )
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper, installed on every connection (see signals)."""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db += time.perf_counter() - started
+
+
+@contextmanager
+def upstream(service):
+    """Time a call to an outside API ("groq", "horde")."""
+    stats = _current.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - started
+        registry.observe_upstream(service, duration)
+        if stats is not None:
+            stats.upstream += duration
+
+
+def view_name(request):
+    """The URL name of api.views views, None for anything else."""
+    match = getattr(request, "resolver_match", None)
+    if match is None or match.func.__module__ != "api.views":
+        return None
+    return match.url_name or match.route
+
+
+class PerformanceMiddleware:
+    """
+    Measures requests to api.views: wall time, database queries and their
+    time, time waiting for upstream APIs and response bytes. Adds a
+    Server-Timing header, logs requests slower than SLOW_REQUEST_MS, feeds
+    the metrics view and saves the profiles of profiled requests. Streamed responses are finished, logged and
+    counted once their last chunk is sent; their Server-Timing header can
+    only cover the time until streaming started.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats = RequestStats()
+        _current.set(stats)
+        return self.process(request, self.get_response(request), stats)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        _current.set(stats)
+        return self.process(request, await self.get_response(request), stats)
+
+    def process(self, request, response, stats):
+        view = view_name(request)
+        if view is None:
+            _current.set(None)
+            return response
+
+        if settings.SERVER_TIMING:
+            response["Server-Timing"] = stats.server_timing()
+        profiler = getattr(request, "profiler", None)
+        if profiler is not None:
+            response["X-Profile-Id"] = str(profiler.request_id)
+
+        def finish():
+            _current.set(None)
+            duration = stats.elapsed()
+            registry.observe(
+                view, request.method, response.status_code, stats, duration
+            )
+            profiling.finish(request, response, view, duration)
+            if duration * 1000 >= settings.SLOW_REQUEST_MS:
+                logger.warning(
+                    "Slow request: %s %s (%s) %s in %.0f ms, %d queries in %.0f ms, "
+                    "upstream %.0f ms, %d bytes",
+                    request.method,
+                    request.path,
+                    view,
+                    response.status_code,
+                    duration * 1000,
+                    stats.queries,
+                    stats.db * 1000,
+                    stats.upstream * 1000,
+                    stats.bytes,
+                )
+
+        if not response.streaming:
+            stats.bytes = len(response.content)
+            finish()
+        elif getattr(response, "file_to_stream", None) is not None:
+            # Replacing a FileResponse's content would stop the server from
+            # sending the file itself (wsgi.file_wrapper, sendfile)
+            stats.bytes = int(response.get("Content-Length") or 0)
+            finish()
+        elif response.is_async:
+            response.streaming_content = count_async(
+                response.streaming_content, stats, finish
+            )
+        else:
+            response.streaming_content = count_sync(
+                response.streaming_content, stats, finish
+            )
+        return response
+
+
+def count_sync(content, stats, finish):
+    _current.set(stats)
+    try:
+        for chunk in content:
+            stats.bytes += len(chunk)
+            yield chunk
+    finally:
+        finish()
+
+
+async def count_async(content, stats, finish):
+    _current.set(stats)
+    try:
+        async for chunk in content:
+            stats.bytes += len(chunk)
+            yield chunk
+    finally:
+        finish()
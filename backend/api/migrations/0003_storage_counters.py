@@ -0,0 +1,42 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:58
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_storage_used(apps, schema_editor):
+    CustomUser = apps.get_model("api", "CustomUser")
+    UserFile = apps.get_model("api", "UserFile")
+    CustomUser.objects.update(
+        storage_used=Coalesce(
+            Subquery(
+                UserFile.objects.filter(user=OuterRef("pk"))
+                .values("user")
+                .annotate(total=Sum("size"))
+                .values("total")
+            ),
+            Value(0),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_upload_session'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='storage_reserved',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='storage_used',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_storage_used, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_blobs'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='folder',
+            index=models.Index(fields=['user', '-created_at'], name='api_folder_user_id_129458_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userfile',
+            index=models.Index(fields=['user', 'parent_folder', '-uploaded_at'], name='api_userfil_user_id_120736_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_nested_folders'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='folder',
+            name='trashed_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='userfile',
+            name='trashed_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
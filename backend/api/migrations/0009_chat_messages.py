@@ -0,0 +1,79 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:11
+
+import json
+import django.db.models.deletion
+import django.utils.timezone
+from cryptography.fernet import Fernet
+from django.conf import settings
+from django.db import migrations, models
+
+
+def split_sessions(apps, schema_editor):
+    """Turn every encrypted conversation blob into one row per message."""
+    # not api.models.CIPHER: migrations must not depend on the current models
+    cipher = Fernet(settings.FERNET_KEY)
+    EncryptedChatSession = apps.get_model("api", "EncryptedChatSession")
+    ChatMessage = apps.get_model("api", "ChatMessage")
+
+    def messages():
+        for session in EncryptedChatSession.objects.order_by("created_at").iterator():
+            try:
+                conversation = json.loads(
+                    cipher.decrypt(bytes(session.conversation_encrypted))
+                )
+            except Exception:
+                continue
+            for message in conversation if isinstance(conversation, list) else []:
+                yield ChatMessage(
+                    user_id=session.user_id,
+                    message_encrypted=cipher.encrypt(json.dumps(message).encode()),
+                    created_at=session.created_at,
+                )
+
+    ChatMessage.objects.bulk_create(messages(), batch_size=1000)
+
+
+def join_messages(apps, schema_editor):
+    cipher = Fernet(settings.FERNET_KEY)
+    EncryptedChatSession = apps.get_model("api", "EncryptedChatSession")
+    ChatMessage = apps.get_model("api", "ChatMessage")
+
+    conversations = {}
+    for row in ChatMessage.objects.order_by("id").iterator():
+        conversations.setdefault(row.user_id, []).append(
+            json.loads(cipher.decrypt(bytes(row.message_encrypted)))
+        )
+    EncryptedChatSession.objects.bulk_create(
+        EncryptedChatSession(
+            user_id=user_id,
+            conversation_encrypted=cipher.encrypt(json.dumps(conversation).encode()),
+        )
+        for user_id, conversation in conversations.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_image_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('message_encrypted', models.BinaryField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chat_messages', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['user', '-id'], name='api_chatmes_user_id_831c31_idx'),
+        ),
+        migrations.RunPython(split_sessions, join_messages),
+        migrations.DeleteModel(
+            name='EncryptedChatSession',
+        ),
+    ]
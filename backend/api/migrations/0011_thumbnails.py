@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:22
+
+import api.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_direct_uploads'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Thumbnail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('size', models.PositiveSmallIntegerField()),
+                ('file', models.FileField(blank=True, upload_to=api.models.thumbnail_upload_path)),
+                ('content_type', models.CharField(blank=True, max_length=50)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('blob', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='thumbnails', to='api.blob')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('blob', 'size'), name='unique_thumbnail')],
+            },
+        ),
+    ]
@@ -0,0 +1,110 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# SQLite: an external content FTS5 table over api_searchentry, kept in sync by
+# triggers. user_id is indexed too so that a search only walks the posting
+# lists of one user's entries. SQLite migrations that rebuild api_searchentry
+# drop its triggers, so such a migration has to create them again.
+SQLITE_INDEX = [
+    "CREATE VIRTUAL TABLE api_searchentry_fts USING fts5("
+    "user_id, name, content, content='api_searchentry', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER api_searchentry_ai AFTER INSERT ON api_searchentry BEGIN "
+    "INSERT INTO api_searchentry_fts (rowid, user_id, name, content) "
+    "VALUES (new.id, new.user_id, new.name, new.content); END",
+    "CREATE TRIGGER api_searchentry_ad AFTER DELETE ON api_searchentry BEGIN "
+    "INSERT INTO api_searchentry_fts "
+    "(api_searchentry_fts, rowid, user_id, name, content) "
+    "VALUES ('delete', old.id, old.user_id, old.name, old.content); END",
+    "CREATE TRIGGER api_searchentry_au AFTER UPDATE ON api_searchentry BEGIN "
+    "INSERT INTO api_searchentry_fts "
+    "(api_searchentry_fts, rowid, user_id, name, content) "
+    "VALUES ('delete', old.id, old.user_id, old.name, old.content); "
+    "INSERT INTO api_searchentry_fts (rowid, user_id, name, content) "
+    "VALUES (new.id, new.user_id, new.name, new.content); END",
+]
+SQLITE_DROP = [
+    "DROP TRIGGER api_searchentry_au",
+    "DROP TRIGGER api_searchentry_ad",
+    "DROP TRIGGER api_searchentry_ai",
+    "DROP TABLE api_searchentry_fts",
+]
+
+# PostgreSQL: trigram index for substring matches on names, full text index
+# on the extracted content. Creating pg_trgm may need a superuser once.
+POSTGRES_INDEX = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX api_searchentry_name_trgm "
+    "ON api_searchentry USING gin (name gin_trgm_ops)",
+    "CREATE INDEX api_searchentry_content_fts "
+    "ON api_searchentry USING gin (to_tsvector('simple', content))",
+]
+POSTGRES_DROP = [
+    "DROP INDEX api_searchentry_content_fts",
+    "DROP INDEX api_searchentry_name_trgm",
+]
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+
+    return run
+
+
+def add_existing(apps, schema_editor):
+    """Entries for everything stored so far; index_search extracts the text."""
+    SearchEntry = apps.get_model("api", "SearchEntry")
+    UserFile = apps.get_model("api", "UserFile")
+    Folder = apps.get_model("api", "Folder")
+
+    SearchEntry.objects.bulk_create(
+        (
+            SearchEntry(user_id=user_id, file_id=file_id, name=name)
+            for user_id, file_id, name in UserFile.objects.values_list(
+                "user_id", "id", "filename"
+            ).iterator()
+        ),
+        batch_size=1000,
+    )
+    SearchEntry.objects.bulk_create(
+        (
+            SearchEntry(user_id=user_id, folder_id=folder_id, name=name)
+            for user_id, folder_id, name in Folder.objects.values_list(
+                "user_id", "id", "name"
+            ).iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_thumbnails'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('content', models.TextField(blank=True)),
+                ('content_indexed_at', models.DateTimeField(blank=True, null=True)),
+                ('file', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_entry', to='api.userfile')),
+                ('folder', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_entry', to='api.folder')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(
+            run_for_vendor({"sqlite": SQLITE_INDEX, "postgresql": POSTGRES_INDEX}),
+            run_for_vendor({"sqlite": SQLITE_DROP, "postgresql": POSTGRES_DROP}),
+        ),
+        migrations.RunPython(add_existing, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:54
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_request_profiles'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('file', 'File'), ('folder', 'Folder')], max_length=6)),
+                ('action', models.CharField(choices=[('insert', 'Insert'), ('rename', 'Rename'), ('delete', 'Delete')], max_length=6)),
+                ('item_id', models.UUIDField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='changes', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'id'], name='api_change_user_id_1a2e92_idx'), models.Index(fields=['item_id', 'id'], name='api_change_item_id_7f975d_idx'), models.Index(fields=['action', 'created_at'], name='api_change_action_095cdd_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:57
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_stored_size(apps, schema_editor):
+    Blob = apps.get_model("api", "Blob")
+    Blob.objects.update(stored_size=F("size"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_change_journal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blob',
+            name='compression',
+            field=models.CharField(blank=True, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='blob',
+            name='stored_size',
+            field=models.BigIntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_stored_size, migrations.RunPython.noop),
+    ]
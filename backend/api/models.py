@@ -27,6 +27,23 @@ def user_upload_path(instance, filename):
     return f"user_{instance.user.id}/{filename}"
 
 
+def blob_upload_path(instance, filename):
+    return f"blobs/{instance.sha256[:2]}/{instance.sha256[2:4]}/{instance.sha256}"
+
+
+def thumbnail_upload_path(instance, filename):
+    sha256 = instance.blob_id
+    ext = os.path.splitext(filename)[1]
+    return f"thumbs/{sha256[:2]}/{sha256[2:4]}/{sha256}-{instance.size}{ext}"
+
+
+class LiveManager(models.Manager):
+    """Default manager that hides rows sitting in the trash."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(trashed_at__isnull=True)
+
+
 class Package(models.Model):
     name = models.CharField(max_length=20)
     max_upload_size = models.BigIntegerField()
@@ -50,10 +67,29 @@ class CustomUser(AbstractUser):
         default=get_default_package,
     )
 
+    # Denormalized storage counters, kept in sync by api.quota
+    storage_used = models.BigIntegerField(default=0, editable=False)
+    storage_reserved = models.BigIntegerField(default=0, editable=False)
+    # Profile every API request this user makes (see api.profiling)
+    profile_requests = models.BooleanField(default=False)
+
     @property
     def name(self):
         return f"{self.first_name} {self.last_name}".strip()
 
+    def save(self, *args, update_fields=None, **kwargs):
+        # The counters are only changed by api.quota's UPDATEs. A user object
+        # loaded earlier (or from the auth cache) must not write back its
+        # stale copy of them.
+        if update_fields is None and not self._state.adding:
+            update_fields = [
+                f.name
+                for f in self._meta.concrete_fields
+                if not f.primary_key
+                and f.name not in ("storage_used", "storage_reserved")
+            ]
+        super().save(*args, update_fields=update_fields, **kwargs)
+
     def __str__(self):
         return self.name or self.username
 
@@ -66,11 +102,80 @@ class Folder(models.Model):
     name = models.CharField(max_length=255)
     created_at = models.DateTimeField(auto_now_add=True)
     unique_link = models.UUIDField(default=uuid.uuid4, unique=True)
+    parent = models.ForeignKey(
+        "self", on_delete=models.CASCADE, null=True, blank=True, related_name="children"
+    )
+    trashed_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    objects = LiveManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [models.Index(fields=["user", "-created_at"])]
 
     def __str__(self):
         return self.name
 
 
+class FolderClosure(models.Model):
+    """One row per (ancestor, descendant) pair, including (folder, folder)."""
+
+    ancestor = models.ForeignKey(
+        Folder, on_delete=models.CASCADE, related_name="descendant_links"
+    )
+    descendant = models.ForeignKey(
+        Folder, on_delete=models.CASCADE, related_name="ancestor_links"
+    )
+    depth = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["ancestor", "descendant"], name="unique_folder_closure"
+            )
+        ]
+        indexes = [models.Index(fields=["descendant", "depth"])]
+
+
+class Blob(models.Model):
+    """File content stored once per SHA-256 and shared by every UserFile using it."""
+
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    file = models.FileField(upload_to=blob_upload_path)
+    size = models.BigIntegerField()
+    # what the stored bytes take up: less than size when compressed
+    stored_size = models.BigIntegerField()
+    compression = models.CharField(max_length=10, blank=True)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.sha256
+
+
+class Thumbnail(models.Model):
+    """
+    A downscaled preview of a blob, made by api.thumbnails. Files sharing
+    content share their thumbnails. An empty file records that no preview
+    could be made, so broken images aren't decoded again on every request.
+    """
+
+    blob = models.ForeignKey(Blob, on_delete=models.CASCADE, related_name="thumbnails")
+    # longest side in pixels
+    size = models.PositiveSmallIntegerField()
+    file = models.FileField(upload_to=thumbnail_upload_path, blank=True)
+    content_type = models.CharField(max_length=50, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["blob", "size"], name="unique_thumbnail")
+        ]
+
+    def __str__(self):
+        return f"{self.blob_id} ({self.size}px)"
+
+
 class UserFile(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(
@@ -84,20 +189,134 @@ class UserFile(models.Model):
         Folder, on_delete=models.CASCADE, null=True, blank=True, related_name="files"
     )
     unique_link = models.UUIDField(default=uuid.uuid4, unique=True)
+    # file points at blob.file; null for files stored before deduplication
+    blob = models.ForeignKey(
+        Blob,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name="user_files",
+    )
+    trashed_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    objects = LiveManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [models.Index(fields=["user", "parent_folder", "-uploaded_at"])]
 
     def save(self, *args, **kwargs):
         if self.file:
-            self.filename = self.file.name
-            try:
-                self.size = self.file.size
-            except Exception:
-                self.size = 0
+            if not self.filename:
+                self.filename = self.file.name
+            if not self.size:
+                try:
+                    self.size = self.file.size
+                except Exception:
+                    self.size = 0
         super().save(*args, **kwargs)
 
     def __str__(self):
         return self.filename
 
 
+class SearchEntry(models.Model):
+    """
+    A file or folder as api.search sees it. Indexed by an FTS5 table on
+    SQLite and by trigram/full text indexes on PostgreSQL (migration 0012).
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="search_entries",
+    )
+    file = models.OneToOneField(
+        UserFile,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="search_entry",
+    )
+    folder = models.OneToOneField(
+        Folder,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="search_entry",
+    )
+    name = models.CharField(max_length=255)
+    # text extracted from the file by the background indexer
+    content = models.TextField(blank=True)
+    content_indexed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.name
+
+
+class UploadSession(models.Model):
+    """
+    An upload in progress: chunked (chunks live on disk until finalize) or
+    direct to object storage through a presigned URL.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="upload_sessions",
+    )
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    chunk_size = models.BigIntegerField()
+    parent_folder = models.ForeignKey(
+        Folder, on_delete=models.CASCADE, null=True, blank=True
+    )
+    # set for presigned direct uploads, which go to the blob's key
+    sha256 = models.CharField(max_length=64, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @property
+    def total_chunks(self):
+        return max(1, -(-self.size // self.chunk_size))
+
+    def __str__(self):
+        return f"{self.filename} ({self.user})"
+
+
+class ImageJob(models.Model):
+    """An image generation request, run by the worker pool in api.imagejobs."""
+
+    STATUS_CHOICES = (
+        ("queued", "Queued"),
+        ("running", "Running"),
+        ("done", "Done"),
+        ("failed", "Failed"),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="image_jobs"
+    )
+    prompt = models.TextField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="queued")
+    upstream_id = models.CharField(max_length=100, blank=True)
+    error = models.TextField(blank=True)
+    result = models.ForeignKey(
+        UserFile, on_delete=models.SET_NULL, null=True, blank=True
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    deadline = models.DateTimeField()
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+    def __str__(self):
+        return f"{self.user} - {self.status}"
+
+
 class Transaction(models.Model):
     STATUS_CHOICES = (
         ("pending", "Pending"),
@@ -117,21 +336,86 @@ class Transaction(models.Model):
         return f"{self.user.username} - {self.package.name} - {self.status}"
 
 
-class EncryptedChatSession(models.Model):
-    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
-    conversation_encrypted = models.BinaryField()
+class ChatMessage(models.Model):
+    """
+    One encrypted chat message. Messages are only ever appended, so saving
+    a message costs the same no matter how long the conversation is.
+    """
+
+    user = models.ForeignKey(
+        CustomUser, on_delete=models.CASCADE, related_name="chat_messages"
+    )
+    message_encrypted = models.BinaryField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=["user", "-id"])]
+
+    def set_message(self, message):
+        """Encrypt a message dict (not saved)."""
+        self.message_encrypted = CIPHER.encrypt(json.dumps(message).encode())
+
+    def get_message(self):
+        """Return the decrypted message dict."""
+        return json.loads(CIPHER.decrypt(bytes(self.message_encrypted)).decode())
+
+    def __str__(self):
+        return f"{self.user.name}'s chat message"
+
+
+class Change(models.Model):
+    """
+    One entry of a user's change journal (see api.changes). Its id is the
+    sync cursor, so entries are never updated, only added and compacted.
+    """
+
+    ACTION_CHOICES = (
+        ("insert", "Insert"),
+        ("rename", "Rename"),
+        ("delete", "Delete"),
+    )
+    KIND_CHOICES = (
+        ("file", "File"),
+        ("folder", "Folder"),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(
+        CustomUser, on_delete=models.CASCADE, related_name="changes"
+    )
+    kind = models.CharField(max_length=6, choices=KIND_CHOICES)
+    action = models.CharField(max_length=6, choices=ACTION_CHOICES)
+    item_id = models.UUIDField()
     created_at = models.DateTimeField(default=timezone.now)
 
-    def set_conversation(self, conversation):
-        """Save a Python list/dict conversation."""
-        data = json.dumps(conversation).encode()
-        self.conversation_encrypted = CIPHER.encrypt(data)
-        self.save()
+    class Meta:
+        indexes = [
+            # the feed: a user's entries after a cursor
+            models.Index(fields=["user", "id"]),
+            # compaction: the entries of one item
+            models.Index(fields=["item_id", "id"]),
+            models.Index(fields=["action", "created_at"]),
+        ]
 
-    def get_conversation(self):
-        """Return decrypted conversation as Python list/dict."""
-        data = CIPHER.decrypt(self.conversation_encrypted)
-        return json.loads(data.decode())
+    def __str__(self):
+        return f"{self.action} {self.kind} {self.item_id}"
+
+
+class RequestProfile(models.Model):
+    """A profiled request (see api.profiling), stacks in folded format."""
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        CustomUser, on_delete=models.SET_NULL, null=True, blank=True
+    )
+    view = models.CharField(max_length=100)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    status = models.PositiveSmallIntegerField()
+    duration_ms = models.PositiveIntegerField()
+    samples = models.PositiveIntegerField()
+    stacks = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
     def __str__(self):
-        return f"{self.user.name}'s chat"
+        return f"{self.method} {self.view} ({self.duration_ms} ms)"
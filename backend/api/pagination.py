@@ -0,0 +1,77 @@
+from rest_framework.pagination import BasePagination, CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class FileCursorPagination(CursorPagination):
+    page_size = 100
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+    # backed by the (user, parent_folder, uploaded_at) index on UserFile
+    ordering = ("-uploaded_at", "-id")
+
+
+class FolderCursorPagination(CursorPagination):
+    page_size = 100
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+    # backed by the (user, created_at) index on Folder
+    ordering = ("-created_at", "-id")
+
+
+class ChatMessageCursorPagination(CursorPagination):
+    """Newest messages first; each page only decrypts the rows it returns."""
+
+    ordering = "-id"
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 500
+
+
+class SearchPagination(BasePagination):
+    """
+    Numbered pages of ranked search results (?page=). There is no total:
+    one row more than the page is fetched to tell whether a next page exists.
+    """
+
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        try:
+            self.page = max(int(request.query_params.get("page", 1)), 1)
+            self.size = int(request.query_params.get(self.page_size_query_param, 0))
+        except ValueError:
+            self.page, self.size = 1, 0
+        if not 0 < self.size <= self.max_page_size:
+            self.size = self.page_size
+
+        start = (self.page - 1) * self.size
+        rows = list(queryset[start : start + self.size + 1])
+        self.has_next = len(rows) > self.size
+        return rows[: self.size]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, "page", self.page + 1)
+
+    def get_previous_link(self):
+        if self.page == 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.page == 2:
+            return remove_query_param(url, "page")
+        return replace_query_param(url, "page", self.page - 1)
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
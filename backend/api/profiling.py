@@ -0,0 +1,129 @@
+import sys
+import time
+import uuid
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections
+from .models import RequestProfile
+
+
+logger = logging.getLogger(__name__)
+
+HEADER = "X-Profile"
+
+# Profiling a request: a sampler thread looks at the stack of the thread
+# running the view every PROFILE_INTERVAL_MS and counts each distinct stack.
+# The counts are saved in the "folded" format that flamegraph.pl, speedscope
+# and most flame graph viewers read. Requests are only profiled for users with
+# profile_requests set, or when a staff user sends an X-Profile header; every
+# other request pays one attribute and one header lookup.
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="profiles")
+    return _executor
+
+
+class Sampler(threading.Thread):
+    def __init__(self, thread_id, interval, max_seconds):
+        super().__init__(name="profiler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.stacks = Counter()
+        self.done = threading.Event()
+
+    def run(self):
+        deadline = time.monotonic() + self.max_seconds
+        while not self.done.wait(self.interval) and time.monotonic() < deadline:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                module = frame.f_globals.get("__name__", "?")
+                stack.append(f"{module}:{code.co_qualname}")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self.done.set()
+        self.join()
+
+    def folded(self):
+        return "\n".join(
+            f"{stack} {count}" for stack, count in self.stacks.most_common()
+        )
+
+
+def wanted(request, user):
+    return user.profile_requests or (user.is_staff and HEADER in request.headers)
+
+
+def start(request, user):
+    """
+    Profile the rest of this request if user wants it. Called once the user
+    is known, which is before the view does its work.
+    """
+    request = getattr(request, "_request", request)  # DRF wraps the request
+    if getattr(request, "profiler", None) is not None or not wanted(request, user):
+        return
+    sampler = Sampler(
+        threading.get_ident(),
+        settings.PROFILE_INTERVAL_MS / 1000,
+        settings.PROFILE_MAX_SECONDS,
+    )
+    sampler.request_id = uuid.uuid4()
+    sampler.user_id = user.pk
+    request.profiler = sampler
+    sampler.start()
+
+
+def sample_this_thread(request):
+    """Async views run on the event loop thread; sample that one instead."""
+    sampler = getattr(request, "profiler", None)
+    if sampler is not None:
+        sampler.thread_id = threading.get_ident()
+
+
+def finish(request, response, view, duration):
+    """Stop the request's profiler, if any, and save the profile."""
+    sampler = getattr(request, "profiler", None)
+    if sampler is None:
+        return
+    request.profiler = None
+    sampler.stop()
+    profile = RequestProfile(
+        id=sampler.request_id,
+        user_id=sampler.user_id,
+        view=view,
+        method=request.method,
+        path=request.get_full_path()[:500],
+        status=response.status_code,
+        duration_ms=round(duration * 1000),
+        samples=sum(sampler.stacks.values()),
+        stacks=sampler.folded(),
+    )
+    # may be called from the event loop, where the ORM can't be used
+    get_executor().submit(save, profile)
+
+
+def save(profile):
+    close_old_connections()
+    try:
+        profile.save(force_insert=True)
+        stale = RequestProfile.objects.order_by("-created_at").values_list(
+            "id", flat=True
+        )[settings.PROFILE_KEEP :]
+        RequestProfile.objects.filter(id__in=list(stale)).delete()
+    except Exception:
+        logger.exception("Saving profile %s failed", profile.id)
+    finally:
+        close_old_connections()
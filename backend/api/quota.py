@@ -0,0 +1,57 @@
+from django.db.models import F
+from .models import CustomUser
+
+
+# Storage accounting works on the counters stored on CustomUser, never on a
+# sum over UserFile rows. Every change is a single UPDATE, so concurrent
+# uploads can't both slip past the limit.
+#
+#   reserve -> commit   upload finished, bytes move from reserved to used
+#   reserve -> release  upload failed or was cancelled
+#   free                file deleted
+
+
+def storage_limit(package):
+    return package.max_upload_size if package else 0
+
+
+def used(user):
+    """Current bytes used, read from the database rather than a cached user."""
+    return CustomUser.objects.values_list("storage_used", flat=True).get(pk=user.pk)
+
+
+def available(user):
+    """Bytes that can still be reserved right now."""
+    used, reserved = CustomUser.objects.values_list(
+        "storage_used", "storage_reserved"
+    ).get(pk=user.pk)
+    return storage_limit(user.package) - used - reserved
+
+
+def reserve(user, size):
+    """Reserve space for an upload. Returns False if it would exceed the limit."""
+    limit = storage_limit(user.package)
+    updated = CustomUser.objects.filter(
+        pk=user.pk,
+        storage_used__lte=limit - size - F("storage_reserved"),
+    ).update(storage_reserved=F("storage_reserved") + size)
+    return updated == 1
+
+
+def commit(user, size):
+    CustomUser.objects.filter(pk=user.pk).update(
+        storage_reserved=F("storage_reserved") - size,
+        storage_used=F("storage_used") + size,
+    )
+
+
+def release(user, size):
+    CustomUser.objects.filter(pk=user.pk).update(
+        storage_reserved=F("storage_reserved") - size
+    )
+
+
+def free(user, size):
+    CustomUser.objects.filter(pk=user.pk).update(
+        storage_used=F("storage_used") - size
+    )
@@ -0,0 +1,75 @@
+import random
+import functools
+import contextvars
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.deprecation import MiddlewareMixin
+
+
+# Views decorated with read_from_replica read from a replica in
+# REPLICA_DATABASES; everything else, and every write, uses "default".
+# Replicas lag behind, so a user who just changed something reads from
+# "default" for REPLICA_STICKY_SECONDS afterwards and sees their own change.
+# A user is pinned when a write request is authenticated and again when its
+# response is ready, after its transactions have committed, so the window
+# starts from the write however long the request took.
+# The pin is kept in the cache, so it reaches every process when REDIS_URL
+# is set; the api.W001 check warns about replicas without it.
+_replica = contextvars.ContextVar("replica", default=None)
+
+UNSAFE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+
+def pin_key(user_id):
+    return f"db:pinned:{user_id}"
+
+
+def pin_to_primary(request, user):
+    """Pins users who write; called on authentication and on the response."""
+    if settings.REPLICA_DATABASES and request.method in UNSAFE_METHODS:
+        cache.set(pin_key(user.pk), True, settings.REPLICA_STICKY_SECONDS)
+
+
+def replica_for(user):
+    if not settings.REPLICA_DATABASES:
+        return None
+    if user.is_authenticated and cache.get(pin_key(user.pk)):
+        return None
+    return random.choice(settings.REPLICA_DATABASES)
+
+
+def read_from_replica(view):
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        alias = replica_for(request.user)
+        if alias is None:
+            return view(request, *args, **kwargs)
+        token = _replica.set(alias)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _replica.reset(token)
+
+    return wrapper
+
+
+class PrimaryPinMiddleware(MiddlewareMixin):
+    def process_response(self, request, response):
+        if settings.REPLICA_DATABASES and request.method in UNSAFE_METHODS:
+            # set by DRF once it has authenticated the request
+            user = getattr(request, "user", None)
+            if user is not None and user.is_authenticated:
+                pin_to_primary(request, user)
+        return response
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _replica.get()
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as "default"
+        return True
@@ -0,0 +1,298 @@
+import re
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+from . import compression, storage
+from .downloads import file_content_type
+from .models import Folder, SearchEntry, UserFile
+
+
+try:
+    import pypdfium2
+except ImportError:  # PDFs are found by name only without pypdfium2
+    pypdfium2 = None
+
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = "api_searchentry_fts"
+MAX_TERMS = 8
+RANK_WINDOW = 200
+# true when neither the entry's file nor its folder is in the trash
+LIVE = "f.trashed_at IS NULL AND d.trashed_at IS NULL"
+TEXT_TYPES = {
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "application/x-sh",
+    "application/sql",
+}
+
+# Every file and folder has a SearchEntry, written together with it, so names
+# are searchable right away. Text content is extracted afterwards by one
+# indexer thread per process (pdfium must not be used from two threads).
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="search")
+    return _executor
+
+
+def content_kind(filename):
+    content_type = file_content_type(filename)
+    if content_type.startswith("text/") or content_type in TEXT_TYPES:
+        return "text"
+    if content_type == "application/pdf" and pypdfium2 is not None:
+        return "pdf"
+    return None
+
+
+def add_files(user_files):
+    """Index new files by name now and by content once they are committed."""
+    now = timezone.now()
+    SearchEntry.objects.bulk_create(
+        SearchEntry(
+            user_id=user_file.user_id,
+            file=user_file,
+            name=user_file.filename,
+            content_indexed_at=None if content_kind(user_file.filename) else now,
+        )
+        for user_file in user_files
+    )
+    pending = [f.pk for f in user_files if content_kind(f.filename)]
+    if pending:
+        transaction.on_commit(lambda: get_executor().submit(index_files, pending))
+
+
+def add_folder(folder):
+    SearchEntry.objects.create(user_id=folder.user_id, folder=folder, name=folder.name)
+
+
+def index_files(file_ids):
+    close_old_connections()
+    try:
+        for entry in SearchEntry.objects.filter(
+            file__in=file_ids, content_indexed_at__isnull=True
+        ).select_related("file"):
+            index_content(entry)
+    except Exception:
+        logger.exception("Indexing the content of %s failed", file_ids)
+    finally:
+        close_old_connections()
+
+
+def index_content(entry):
+    user_file = entry.file
+    text = None
+    if user_file.blob_id:
+        # same bytes, same text
+        text = (
+            SearchEntry.objects.filter(
+                file__blob=user_file.blob_id, content_indexed_at__isnull=False
+            )
+            .exclude(content="")
+            .values_list("content", flat=True)
+            .first()
+        )
+    if text is None:
+        try:
+            text = extract_text(user_file)
+        except Exception:
+            logger.info("No text from file %s", user_file.pk, exc_info=True)
+            text = ""
+    SearchEntry.objects.filter(pk=entry.pk).update(
+        content=text, content_indexed_at=timezone.now()
+    )
+
+
+def extract_text(user_file):
+    """Up to SEARCH_CONTENT_MAX_CHARS of a text file's or PDF's text."""
+    limit = settings.SEARCH_CONTENT_MAX_CHARS
+    kind = content_kind(user_file.filename)
+    if kind == "text":
+        with storage.open_file(user_file.file.name) as f:
+            text = f.read(limit).decode("utf-8", errors="ignore")
+    elif kind == "pdf" and user_file.size <= settings.SEARCH_MAX_PDF_SIZE:
+        text = pdf_text(user_file, limit)
+    else:
+        text = ""
+    # PostgreSQL text can't hold NUL
+    return text.replace("\x00", "")
+
+
+def pdf_text(user_file, limit):
+    if storage.is_local() and not compression.is_compressed(user_file.file.name):
+        source = user_file.file.path
+    else:
+        with storage.open_file(user_file.file.name) as f:
+            source = f.read()
+    pdf = pypdfium2.PdfDocument(source)
+    try:
+        parts, length = [], 0
+        for page in pdf:
+            textpage = page.get_textpage()
+            parts.append(textpage.get_text_range())
+            textpage.close()
+            page.close()
+            length += len(parts[-1])
+            if length >= limit:
+                break
+        return "\n".join(parts)[:limit]
+    finally:
+        pdf.close()
+
+
+def search_terms(query):
+    return re.findall(r"\w+", query.lower())[:MAX_TERMS]
+
+
+class Results:
+    """
+    Ranked entries matching a query, best first. Slicing runs one query for
+    just that slice, so pages can be fetched without counting every match.
+    """
+
+    def __init__(self, user, query):
+        self.user = user
+        self.terms = search_terms(query)
+
+    def __getitem__(self, key):
+        start = key.start or 0
+        if not self.terms or key.stop <= start:
+            return []
+        ids = ranked_ids(self.user, self.terms, start, key.stop - start)
+        entries = SearchEntry.objects.select_related("file", "folder").in_bulk(ids)
+        return [entries[entry_id] for entry_id in ids if entry_id in entries]
+
+
+def ranked_ids(user, terms, offset, limit):
+    """
+    Only the newest RANK_WINDOW matches are ranked, so a search costs about
+    the same however many files match. Older matches follow, newest first.
+    """
+    if connection.vendor == "sqlite":
+        window, older = sqlite_window, sqlite_older
+    elif connection.vendor == "postgresql":
+        window, older = postgres_window, postgres_older
+    else:
+        return unindexed_ids(user, terms, offset, limit)
+
+    rows = window(user, terms)
+    ranked = rank([(entry_id, name) for entry_id, name, live in rows if live], terms)
+    ids = ranked[offset : offset + limit]
+    if len(rows) == RANK_WINDOW and len(ids) < limit:
+        before = min(entry_id for entry_id, _, _ in rows)
+        skip = max(offset - len(ranked), 0)
+        ids += older(user, terms, before, skip, limit - len(ids))
+    return ids
+
+
+def rank(rows, terms):
+    """
+    Entries with every term in their name before those found by content,
+    then shorter (more specific) names, then newer ones.
+    """
+
+    def key(row):
+        entry_id, name = row
+        words = re.findall(r"\w+", name.lower())
+        in_name = all(any(word.startswith(term) for word in words) for term in terms)
+        return (not in_name, len(name), -entry_id)
+
+    return [entry_id for entry_id, _ in sorted(rows, key=key)]
+
+
+def unindexed_ids(user, terms, offset, limit):
+    entries = SearchEntry.objects.filter(
+        user=user, file__trashed_at__isnull=True, folder__trashed_at__isnull=True
+    )
+    for term in terms:
+        entries = entries.filter(name__icontains=term)
+    return list(
+        entries.order_by("-id").values_list("id", flat=True)[offset : offset + limit]
+    )
+
+
+def fetch(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def trash_joins():
+    """The entry's file and folder, for checking them against LIVE."""
+    return (
+        f"LEFT JOIN {UserFile._meta.db_table} f ON f.id = e.file_id "
+        f"LEFT JOIN {Folder._meta.db_table} d ON d.id = e.folder_id "
+    )
+
+
+def sqlite_match(user, terms):
+    # All terms in the name or the content of this user's entries; the last
+    # one as a prefix, for search as you type. Only the last: long prefixes
+    # aren't covered by the prefix index and are much slower than whole words.
+    phrases = " AND ".join([*(f'"{term}"' for term in terms[:-1]), f'"{terms[-1]}"*'])
+    return f'user_id: "{user.pk.hex}" AND {{name content}}: ({phrases})'
+
+
+def sqlite_window(user, terms):
+    # FTS5 walks matches in rowid order, so the LIMIT stops it early. No bm25:
+    # it counts every row holding each phrase, the user_id one included.
+    return fetch(
+        f"SELECT e.id, e.name, {LIVE} FROM ("
+        f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+        f"ORDER BY rowid DESC LIMIT %s) m "
+        f"JOIN {SearchEntry._meta.db_table} e ON e.id = m.rowid " + trash_joins(),
+        [sqlite_match(user, terms), RANK_WINDOW],
+    )
+
+
+def sqlite_older(user, terms, before, offset, limit):
+    rows = fetch(
+        f"SELECT e.id FROM {FTS_TABLE} "
+        f"JOIN {SearchEntry._meta.db_table} e ON e.id = {FTS_TABLE}.rowid "
+        + trash_joins()
+        + f"WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid < %s AND {LIVE} "
+        f"ORDER BY {FTS_TABLE}.rowid DESC LIMIT %s OFFSET %s",
+        [sqlite_match(user, terms), before, limit, offset],
+    )
+    return [entry_id for entry_id, in rows]
+
+
+def postgres_match(terms):
+    # Names match on substrings (trigram index), content on word prefixes
+    # (full text index)
+    names = " AND ".join(["e.name ILIKE %s"] * len(terms))
+    sql = (
+        f"(({names}) OR to_tsvector('simple', e.content) "
+        f"@@ to_tsquery('simple', %s))"
+    )
+    patterns = ["%" + term.replace("_", "\\_") + "%" for term in terms]
+    return sql, [*patterns, " & ".join(f"{term}:*" for term in terms)]
+
+
+def postgres_window(user, terms):
+    match, params = postgres_match(terms)
+    return fetch(
+        f"SELECT e.id, e.name, {LIVE} FROM {SearchEntry._meta.db_table} e "
+        + trash_joins()
+        + f"WHERE e.user_id = %s AND {match} ORDER BY e.id DESC LIMIT %s",
+        [user.pk, *params, RANK_WINDOW],
+    )
+
+
+def postgres_older(user, terms, before, offset, limit):
+    match, params = postgres_match(terms)
+    rows = fetch(
+        f"SELECT e.id FROM {SearchEntry._meta.db_table} e "
+        + trash_joins()
+        + f"WHERE e.user_id = %s AND {match} AND e.id < %s AND {LIVE} "
+        f"ORDER BY e.id DESC LIMIT %s OFFSET %s",
+        [user.pk, *params, before, limit, offset],
+    )
+    return [entry_id for entry_id, in rows]
@@ -1,5 +1,31 @@
+from urllib.parse import urljoin
+from django.urls import reverse
 from rest_framework import serializers
-from .models import CustomUser, Folder, UserFile, Package, EncryptedChatSession
+from . import thumbnails
+from .models import (
+    CustomUser,
+    Folder,
+    UserFile,
+    Package,
+    ImageJob,
+)
+
+
+class AbsoluteURLMixin:
+    """
+    Same result as request.build_absolute_uri(location) for a path from
+    reverse(), but the scheme/host part is worked out once per response
+    instead of once per row.
+    """
+
+    def build_absolute_uri(self, location):
+        request = self.context.get("request")
+        if not request:
+            return None
+        base = self.context.get("base_uri")
+        if base is None:
+            base = self.context["base_uri"] = request.build_absolute_uri("/")
+        return urljoin(base, location)
 
 
 class UserRegisterSerializer(serializers.ModelSerializer):
@@ -61,11 +87,13 @@ class UpdateUserSerializer(serializers.ModelSerializer):
         model = CustomUser
         fields = ["username", "first_name", "last_name", "phone"]
 
-        def update(self, instance, validated_data):
-            for attr, value in validated_data.items():
-                setattr(attr, instance, value)
-            instance.save()
-            return instance
+    def update(self, instance, validated_data):
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        # instance may come from the auth cache: saving every field would
+        # put back its stale storage counters
+        instance.save(update_fields=list(validated_data))
+        return instance
 
 
 class PackageSerializer(serializers.ModelSerializer):
@@ -74,9 +102,10 @@ class PackageSerializer(serializers.ModelSerializer):
         fields = ["id", "name", "price"]
 
 
-class UserFileSerializer(serializers.ModelSerializer):
+class UserFileSerializer(AbsoluteURLMixin, serializers.ModelSerializer):
     file_url = serializers.SerializerMethodField()
     unique_link_url = serializers.SerializerMethodField()
+    thumbnail_url = serializers.SerializerMethodField()
 
     class Meta:
         model = UserFile
@@ -86,6 +115,7 @@ class UserFileSerializer(serializers.ModelSerializer):
             "file_url",
             "unique_link",
             "unique_link_url",
+            "thumbnail_url",
             "size",
             "uploaded_at",
             "parent_folder",
@@ -97,30 +127,46 @@ class UserFileSerializer(serializers.ModelSerializer):
             "file_url",
             "unique_link",
             "unique_link_url",
+            "thumbnail_url",
         ]
 
     def get_file_url(self, obj):
-        request = self.context.get("request")
-        if obj.file and request:
-            return request.build_absolute_uri(obj.file.url)
+        if obj.file and self.context.get("request"):
+            return self.build_absolute_uri(obj.file.url)
         return obj.file.url if obj.file else None
 
     def get_unique_link_url(self, obj):
-        request = self.context.get("request")
-        if request:
-            return request.build_absolute_uri(f"files/download/{obj.unique_link}/")
-        return None
+        return self.build_absolute_uri(
+            reverse("download_file", args=[obj.unique_link])
+        )
 
+    def get_thumbnail_url(self, obj):
+        # smallest size; ask for a bigger one with ?size=<px>
+        if not thumbnails.has_preview(obj):
+            return None
+        return self.build_absolute_uri(
+            reverse("file_thumbnail", args=[obj.unique_link])
+        )
 
-class FolderSerializer(serializers.ModelSerializer):
+
+class FolderSerializer(AbsoluteURLMixin, serializers.ModelSerializer):
     files = UserFileSerializer(many=True, read_only=True)
     unique_link_url = serializers.SerializerMethodField()
 
     class Meta:
         model = Folder
-        fields = ["id", "name", "created_at", "files", "unique_link", "unique_link_url"]
+        fields = [
+            "id",
+            "name",
+            "parent",
+            "created_at",
+            "files",
+            "unique_link",
+            "unique_link_url",
+        ]
         read_only_fields = [
             "id",
+            "parent",
             "created_at",
             "files",
             "unique_link",
@@ -128,21 +174,89 @@ class FolderSerializer(serializers.ModelSerializer):
         ]
 
     def get_unique_link_url(self, obj):
-        request = self.context.get("request")
-        if request:
-            return request.build_absolute_uri(f"folders/download/{obj.unique_link}/")
-        return None
+        return self.build_absolute_uri(
+            reverse("download_folder", args=[obj.unique_link])
+        )
+
+
+class FolderSummarySerializer(AbsoluteURLMixin, serializers.ModelSerializer):
+    """Folder without its file list; needs file_count/total_size annotations."""
+
+    file_count = serializers.IntegerField(read_only=True)
+    total_size = serializers.IntegerField(read_only=True)
+    unique_link_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Folder
+        fields = [
+            "id",
+            "name",
+            "parent",
+            "created_at",
+            "file_count",
+            "total_size",
+            "unique_link",
+            "unique_link_url",
+        ]
+
+    def get_unique_link_url(self, obj):
+        return self.build_absolute_uri(
+            reverse("download_folder", args=[obj.unique_link])
+        )
+
 
+class FolderItemSerializer(AbsoluteURLMixin, serializers.ModelSerializer):
+    """Just the folder itself, no file list or totals."""
 
-class EncryptedChatSessionSerializer(serializers.ModelSerializer):
-    conversation = serializers.SerializerMethodField()
+    unique_link_url = serializers.SerializerMethodField()
 
     class Meta:
-        model = EncryptedChatSession
-        fields = ["id", "conversation", "created_at"]
-
-    def get_conversation(self, obj):
-        try:
-            return obj.get_conversation()
-        except Exception:
-            return []  # fallback in case of bad data
+        model = Folder
+        fields = [
+            "id",
+            "name",
+            "parent",
+            "created_at",
+            "unique_link",
+            "unique_link_url",
+        ]
+
+    def get_unique_link_url(self, obj):
+        return self.build_absolute_uri(
+            reverse("download_folder", args=[obj.unique_link])
+        )
+
+
+class SearchResultSerializer(serializers.Serializer):
+    """A SearchEntry as a search hit: the file or folder it stands for."""
+
+    type = serializers.SerializerMethodField()
+    file = UserFileSerializer(read_only=True)
+    folder = FolderItemSerializer(read_only=True)
+
+    def get_type(self, obj):
+        return "file" if obj.file_id else "folder"
+
+
+class ImageJobSerializer(AbsoluteURLMixin, serializers.ModelSerializer):
+    image_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ImageJob
+        fields = [
+            "id",
+            "prompt",
+            "status",
+            "error",
+            "result",
+            "image_url",
+            "created_at",
+        ]
+
+    def get_image_url(self, obj):
+        if not obj.result:
+            return None
+        return self.build_absolute_uri(
+            reverse("download_file", args=[obj.result.unique_link])
+        )
+
@@ -0,0 +1,21 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from . import metrics, usercache
+from .models import CustomUser, Package
+
+
+@receiver([post_save, post_delete], sender=CustomUser)
+def drop_cached_user(sender, instance, **kwargs):
+    usercache.invalidate_user(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Package)
+def drop_cached_package(sender, instance, **kwargs):
+    usercache.invalidate_package(instance.pk)
+
+
+@receiver(connection_created)
+def measure_queries(sender, connection, **kwargs):
+    if metrics.record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(metrics.record_query)
@@ -0,0 +1,148 @@
+import base64
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import File
+from django.core.files.storage import Storage, default_storage
+from django.utils.deconstruct import deconstructible
+from django.utils.http import content_disposition_header
+from . import compression
+
+
+# Two storage drivers: Django's FileSystemStorage (MEDIA_ROOT, the default)
+# and S3Storage below for S3 compatible object stores (AWS, MinIO, ...).
+# Code that needs the bytes goes through the Storage API; with S3 clients
+# upload and download directly against the bucket using presigned URLs.
+# Blobs may be stored compressed (see compression.py); open_file() and
+# iter_file() give the original content either way.
+
+
+def is_local(storage=default_storage):
+    try:
+        storage.path("")
+    except NotImplementedError:
+        return False
+    return True
+
+
+def open_file(name):
+    """Open a stored file for reading its content."""
+    f = default_storage.open(name)
+    if compression.is_compressed(name):
+        return compression.reader(f)
+    return f
+
+
+def iter_file(name):
+    """Yield a stored file's bytes, opening it only when first read."""
+    with default_storage.open(name) as f:
+        if compression.is_compressed(name):
+            yield from compression.decompress_chunks(f)
+        else:
+            yield from f.chunks()
+
+
+def sha256_checksum(sha256):
+    """The base64 form S3 uses for x-amz-checksum-sha256."""
+    return base64.b64encode(bytes.fromhex(sha256)).decode()
+
+
+@deconstructible
+class S3Storage(Storage):
+    """
+    Minimal S3 storage on boto3 (installed separately: pip install boto3).
+    Names are used as object keys as they are; blob names are content
+    addressed, so an existing key always holds the same bytes.
+    """
+
+    def __init__(self):
+        try:
+            import boto3
+            from botocore.config import Config
+        except ImportError:
+            raise ImproperlyConfigured("The s3 storage driver needs boto3 installed")
+        self.bucket = settings.S3_BUCKET
+        self.expires = settings.S3_PRESIGN_EXPIRES
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=settings.S3_ENDPOINT_URL or None,
+            region_name=settings.S3_REGION or None,
+            config=Config(signature_version="s3v4"),
+        )
+
+    def _open(self, name, mode="rb"):
+        body = self.client.get_object(Bucket=self.bucket, Key=name)["Body"]
+        return File(body, name)
+
+    def _save(self, name, content):
+        content.seek(0)
+        self.client.upload_fileobj(content, self.bucket, name)
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=name)
+
+    def head(self, name):
+        from botocore.exceptions import ClientError
+
+        try:
+            return self.client.head_object(
+                Bucket=self.bucket, Key=name, ChecksumMode="ENABLED"
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def exists(self, name):
+        return self.head(name) is not None
+
+    def size(self, name):
+        return self.head(name)["ContentLength"]
+
+    def get_modified_time(self, name):
+        return self.head(name)["LastModified"]
+
+    def listdir(self, path):
+        prefix = path.rstrip("/") + "/"
+        directories, files = [], []
+        pages = self.client.get_paginator("list_objects_v2").paginate(
+            Bucket=self.bucket, Prefix=prefix, Delimiter="/"
+        )
+        for page in pages:
+            for entry in page.get("CommonPrefixes", []):
+                directories.append(entry["Prefix"][len(prefix) :].rstrip("/"))
+            for entry in page.get("Contents", []):
+                files.append(entry["Key"][len(prefix) :])
+        return directories, files
+
+    def url(self, name, filename=None, as_attachment=True):
+        params = {"Bucket": self.bucket, "Key": name}
+        if filename:
+            params["ResponseContentDisposition"] = content_disposition_header(
+                as_attachment, filename
+            )
+        return self.client.generate_presigned_url(
+            "get_object", Params=params, ExpiresIn=self.expires
+        )
+
+    def upload_url(self, name, size, sha256):
+        """
+        Presigned PUT for exactly this content: S3 rejects the upload unless
+        the body has this length and SHA-256.
+        """
+        checksum = sha256_checksum(sha256)
+        url = self.client.generate_presigned_url(
+            "put_object",
+            Params={
+                "Bucket": self.bucket,
+                "Key": name,
+                "ContentLength": size,
+                "ChecksumSHA256": checksum,
+            },
+            ExpiresIn=self.expires,
+        )
+        headers = {"Content-Length": str(size), "x-amz-checksum-sha256": checksum}
+        return {"method": "PUT", "url": url, "headers": headers}
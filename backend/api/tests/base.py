@@ -0,0 +1,55 @@
+import shutil
+import tempfile
+from django.core.files.base import ContentFile
+from django.test import override_settings
+from rest_framework.test import APIClient
+from api.models import CustomUser, Package
+from api.views import get_user_tokens
+
+
+class StorageMixin:
+    """
+    Give each test its own MEDIA_ROOT and UPLOAD_TEMP_DIR, and a user with
+    an authenticated API client.
+    """
+
+    max_upload_size = 1024 * 1024
+
+    def setUp(self):
+        super().setUp()
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        settings = override_settings(
+            MEDIA_ROOT=f"{root}/media", UPLOAD_TEMP_DIR=f"{root}/tmp"
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.package = Package.objects.create(
+            name="test", max_upload_size=self.max_upload_size
+        )
+        self.user = self.create_user("user")
+        self.client = self.client_for(self.user)
+
+    def create_user(self, username):
+        return CustomUser.objects.create_user(
+            username=username,
+            password="password",
+            phone="+919999999999",
+            package=self.package,
+        )
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION="Bearer " + get_user_tokens(user)["access"]
+        )
+        return client
+
+    def upload(self, content, filename="file.txt", folder=None):
+        data = {"file": ContentFile(content, name=filename)}
+        if folder:
+            data["folder_id"] = folder.pk
+        response = self.client.post("/api/v1/file/upload/", data, format="multipart")
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data["file"]
@@ -0,0 +1,107 @@
+import time
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase
+from api import changes, folders
+from api.models import Change
+from .base import StorageMixin
+
+
+class ChangesTests(StorageMixin, TestCase):
+    url = "/api/v1/storage/changes/"
+
+    def cursor(self):
+        return self.client.get(self.url).data["cursor"]
+
+    def feed(self, cursor, **params):
+        response = self.client.get(self.url, {"cursor": cursor, **params})
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.json()
+
+    def summary(self, page):
+        return [(c["action"], c["type"], c["id"]) for c in page["changes"]]
+
+    def delete(self, **data):
+        self.client.delete("/api/v1/storage/delete/", data, format="json")
+
+    def compact(self):
+        call_command("compact_changes", sleep=0, stdout=StringIO())
+
+    def test_feed_from_a_cursor(self):
+        self.upload(b"before")
+        cursor = self.cursor()
+        folder = folders.create_folder(self.user, "folder")
+        user_file = self.upload(b"content", folder=folder)
+
+        page = self.feed(cursor)
+        self.assertEqual(
+            self.summary(page),
+            [
+                ("insert", "folder", str(folder.pk)),
+                ("insert", "file", str(user_file["id"])),
+            ],
+        )
+        self.assertEqual(page["changes"][1]["parent"], str(folder.pk))
+        self.assertFalse(page["has_more"])
+        self.assertEqual(self.feed(page["cursor"])["changes"], [])
+
+    def test_paging(self):
+        cursor = self.cursor()
+        ids = [str(self.upload(f"file {i}".encode())["id"]) for i in range(3)]
+
+        seen = []
+        for _ in range(3):
+            page = self.feed(cursor, page_size=2)
+            seen += [c["id"] for c in page["changes"]]
+            cursor = page["cursor"]
+            if not page["has_more"]:
+                break
+        self.assertEqual(seen, ids)
+
+    def test_compaction_keeps_what_a_cursor_needs(self):
+        cursor = self.cursor()
+        kept = self.upload(b"kept")
+        deleted = self.upload(b"deleted")
+        self.delete(file_id=deleted["id"])
+        self.compact()
+
+        # the insert of the deleted file is gone, its tombstone is not
+        self.assertEqual(Change.objects.count(), 2)
+        self.assertEqual(
+            self.summary(self.feed(cursor)),
+            [
+                ("insert", "file", str(kept["id"])),
+                ("delete", "file", str(deleted["id"])),
+            ],
+        )
+
+    def test_compaction_after_purging_a_folder(self):
+        cursor = self.cursor()
+        folder = folders.create_folder(self.user, "folder")
+        sub = folders.create_folder(self.user, "sub", folder)
+        for i in range(3):
+            self.upload(f"file {i}".encode(), folder=sub)
+        self.delete(folder_id=folder.pk)
+        call_command("purge_trash", days=0, sleep=0, stdout=StringIO())
+        self.compact()
+
+        # only the folder's tombstone is left, standing for all it held
+        self.assertEqual(
+            list(Change.objects.values_list("kind", "action", "item_id")),
+            [("folder", "delete", folder.pk)],
+        )
+        self.assertEqual(
+            self.summary(self.feed(cursor)), [("delete", "folder", str(folder.pk))]
+        )
+
+    def test_bad_and_expired_cursors(self):
+        response = self.client.get(self.url, {"cursor": "nonsense"})
+        self.assertEqual(response.status_code, 400)
+
+        issued = time.time() - 31 * 24 * 3600
+        with self.settings(CHANGES_RETENTION_DAYS=30):
+            response = self.client.get(
+                self.url, {"cursor": changes.make_cursor(0, issued)}
+            )
+        self.assertEqual(response.status_code, 410)
+        self.assertTrue(response.data["reset"])
@@ -0,0 +1,66 @@
+from django.test import TestCase
+from .base import StorageMixin
+
+
+class DownloadTests(StorageMixin, TestCase):
+    content = b"0123456789abcdefghij"
+
+    def setUp(self):
+        super().setUp()
+        user_file = self.upload(self.content, filename="data.bin")
+        self.url = f"/api/v1/storage/files/download/{user_file['unique_link']}/"
+
+    def get(self, **headers):
+        response = self.client.get(self.url, headers=headers)
+        if response.streaming:
+            response.body = b"".join(response.streaming_content)
+        return response
+
+    def test_full_download(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.body, self.content)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertIn("ETag", response)
+
+    def test_single_range(self):
+        response = self.get(Range="bytes=5-9")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.body, b"56789")
+        self.assertEqual(response["Content-Range"], "bytes 5-9/20")
+        self.assertEqual(response["Content-Length"], "5")
+
+        response = self.get(Range="bytes=-3")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.body, b"hij")
+
+    def test_multiple_ranges(self):
+        response = self.get(Range="bytes=0-1,18-")
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response["Content-Type"].startswith("multipart/byteranges"))
+        self.assertIn(b"Content-Range: bytes 0-1/20\r\n\r\n01", response.body)
+        self.assertIn(b"Content-Range: bytes 18-19/20\r\n\r\nij", response.body)
+        self.assertEqual(int(response["Content-Length"]), len(response.body))
+
+    def test_unsatisfiable_range(self):
+        response = self.get(Range="bytes=20-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */20")
+
+    def test_etag(self):
+        etag = self.get()["ETag"]
+        response = self.get(If_None_Match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(self.get(If_None_Match='"other"').status_code, 200)
+
+    def test_if_range(self):
+        etag = self.get()["ETag"]
+        response = self.get(Range="bytes=0-3", If_Range=etag)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.body, b"0123")
+
+        # a changed file is sent whole
+        response = self.get(Range="bytes=0-3", If_Range='"other"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.body, self.content)
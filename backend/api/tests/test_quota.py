@@ -0,0 +1,67 @@
+import threading
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from api import quota
+from api.models import CustomUser, Package
+
+
+class QuotaTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username="user",
+            phone="+919999999999",
+            package=Package.objects.create(name="test", max_upload_size=100),
+        )
+
+    def counters(self):
+        return CustomUser.objects.values_list(
+            "storage_used", "storage_reserved"
+        ).get(pk=self.user.pk)
+
+    def test_reserve_up_to_the_limit(self):
+        self.assertTrue(quota.reserve(self.user, 60))
+        self.assertTrue(quota.reserve(self.user, 40))
+        self.assertFalse(quota.reserve(self.user, 1))
+        self.assertEqual(self.counters(), (0, 100))
+        self.assertEqual(quota.available(self.user), 0)
+
+    def test_commit_release_and_free(self):
+        quota.reserve(self.user, 60)
+        quota.reserve(self.user, 30)
+        quota.commit(self.user, 60)
+        quota.release(self.user, 30)
+        self.assertEqual(self.counters(), (60, 0))
+        self.assertFalse(quota.reserve(self.user, 41))
+
+        quota.free(self.user, 60)
+        self.assertEqual(self.counters(), (0, 0))
+        self.assertTrue(quota.reserve(self.user, 100))
+
+
+class QuotaRaceTests(TransactionTestCase):
+    def test_concurrent_reserves_stop_at_the_limit(self):
+        user = CustomUser.objects.create_user(
+            username="user",
+            phone="+919999999999",
+            package=Package.objects.create(name="test", max_upload_size=100),
+        )
+        # ten uploads of 30 bytes start together, only three fit
+        barrier = threading.Barrier(10)
+        results = []
+
+        def reserve():
+            try:
+                barrier.wait()
+                results.append(quota.reserve(user, 30))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=reserve) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results.count(True), 3)
+        user.refresh_from_db()
+        self.assertEqual(user.storage_reserved, 90)
@@ -0,0 +1,115 @@
+import hashlib
+from datetime import timedelta
+from io import StringIO
+from importlib.util import find_spec
+from unittest import mock, skipUnless
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from api import storage
+from api.models import UserFile
+from .base import StorageMixin
+
+# The s3 driver is optional: these tests need boto3, and moto for the fake S3
+S3_TEST_SETTINGS = {
+    "STORAGES": {
+        "default": {"BACKEND": "api.storage.S3Storage"},
+        "staticfiles": {
+            "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"
+        },
+    },
+    "S3_BUCKET": "test-bucket",
+    "S3_ENDPOINT_URL": None,
+    "S3_REGION": "us-east-1",
+}
+
+
+@skipUnless(find_spec("boto3") and find_spec("moto"), "needs boto3 and moto")
+@override_settings(**S3_TEST_SETTINGS)
+class S3StorageTests(StorageMixin, TestCase):
+    def setUp(self):
+        from moto import mock_aws
+
+        mock = mock_aws()
+        mock.start()
+        self.addCleanup(mock.stop)
+        super().setUp()
+        default_storage.client.create_bucket(Bucket="test-bucket")
+
+    def test_save_open_and_delete(self):
+        name = default_storage.save("blobs/ab/cd/abcd", ContentFile(b"hello"))
+        self.assertEqual(name, "blobs/ab/cd/abcd")
+        self.assertFalse(storage.is_local())
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(default_storage.size(name), 5)
+        with default_storage.open(name) as f:
+            self.assertEqual(f.read(), b"hello")
+
+        default_storage.delete(name)
+        self.assertFalse(default_storage.exists(name))
+        self.assertIsNone(default_storage.head(name))
+
+    def test_listdir(self):
+        for name in ("blobs/ab/cd/abcd", "blobs/ab/ef/abef", "blobs/top"):
+            default_storage.save(name, ContentFile(b"x"))
+        self.assertEqual(default_storage.listdir("blobs"), (["ab"], ["top"]))
+        self.assertEqual(default_storage.listdir("blobs/ab/"), (["cd", "ef"], []))
+        self.assertEqual(default_storage.listdir("blobs/ab/cd"), ([], ["abcd"]))
+
+    def test_download_url_names_the_file(self):
+        default_storage.save("blobs/ab/cd/abcd", ContentFile(b"x"))
+        url = default_storage.url("blobs/ab/cd/abcd", "report.pdf")
+        self.assertIn("test-bucket", url)
+        self.assertIn("response-content-disposition=attachment", url)
+
+    def test_direct_upload(self):
+        import requests
+
+        content = b"direct upload content"
+        sha256 = hashlib.sha256(content).hexdigest()
+        response = self.client.post(
+            "/api/v1/file/upload/direct/",
+            {"filename": "a.txt", "size": len(content), "sha256": sha256},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        session_id = response.data["id"]
+        upload = response.data["upload"]
+        complete = f"/api/v1/file/upload/direct/{session_id}/complete/"
+
+        # Completing before the PUT fails and keeps the session
+        self.assertEqual(self.client.post(complete).status_code, 400)
+
+        put = requests.put(upload["url"], data=content, headers=upload["headers"])
+        self.assertEqual(put.status_code, 200)
+        response = self.client.post(complete)
+        self.assertEqual(response.status_code, 200)
+
+        user_file = UserFile.objects.get(user=self.user)
+        self.assertEqual(user_file.blob_id, sha256)
+        self.assertEqual(user_file.size, len(content))
+        with storage.open_file(user_file.blob.file.name) as f:
+            self.assertEqual(f.read(), content)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.storage_used, len(content))
+        self.assertEqual(self.user.storage_reserved, 0)
+
+
+    def test_reconcile_removes_unreferenced_blobs(self):
+        content = b"kept"
+        sha256 = hashlib.sha256(content).hexdigest()
+        self.client.post(
+            "/api/v1/file/upload/",
+            {"file": ContentFile(content, name="a.txt")},
+            format="multipart",
+        )
+        default_storage.save("blobs/ab/cd/abcd", ContentFile(b"orphan"))
+
+        with mock.patch(
+            "api.management.commands.reconcile_storage.ORPHAN_GRACE", timedelta(0)
+        ):
+            call_command("reconcile_storage", stdout=StringIO())
+        self.assertFalse(default_storage.exists("blobs/ab/cd/abcd"))
+        self.assertTrue(default_storage.exists(UserFile.objects.get().blob.file.name))
+        self.assertEqual(UserFile.objects.get().blob_id, sha256)
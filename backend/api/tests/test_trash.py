@@ -0,0 +1,59 @@
+from django.test import TestCase
+from api import folders, trash
+from api.models import Change, Folder, UserFile
+from .base import StorageMixin
+
+
+class TrashTests(StorageMixin, TestCase):
+    def used(self):
+        self.user.refresh_from_db()
+        return self.user.storage_used
+
+    def delete(self, **data):
+        return self.client.delete("/api/v1/storage/delete/", data, format="json")
+
+    def test_deleting_a_file_twice_frees_its_space_once(self):
+        kept = self.upload(b"kept")
+        deleted = self.upload(b"deleted")
+        self.assertEqual(self.used(), 11)
+
+        # the second request loaded the row before the first trashed it
+        user_file = UserFile.objects.get(pk=deleted["id"])
+        self.assertEqual(self.delete(file_id=deleted["id"]).status_code, 200)
+        trash.trash_file(self.user, user_file)
+
+        self.assertEqual(self.used(), 4)
+        self.assertEqual(Change.objects.filter(action="delete").count(), 1)
+        self.assertEqual(self.delete(file_id=deleted["id"]).status_code, 404)
+        self.assertTrue(UserFile.objects.filter(pk=kept["id"]).exists())
+
+    def test_deleting_a_folder_after_one_of_its_files(self):
+        folder = folders.create_folder(self.user, "folder")
+        sub = folders.create_folder(self.user, "sub", folder)
+        first = self.upload(b"first", folder=folder)
+        self.upload(b"second", folder=sub)
+        self.upload(b"outside")
+        self.assertEqual(self.used(), 18)
+
+        self.delete(file_id=first["id"])
+        self.assertEqual(self.used(), 13)
+        folder_obj = Folder.objects.get(pk=folder.pk)
+        self.assertEqual(self.delete(folder_id=folder.pk).status_code, 200)
+        self.assertEqual(self.used(), 7)
+
+        # a request that found the folder before it was trashed changes nothing
+        trash.trash_folder(self.user, folder_obj)
+        self.assertEqual(self.used(), 7)
+        self.assertEqual(UserFile.objects.count(), 1)
+        self.assertFalse(Folder.objects.exists())
+
+    def test_restore_takes_the_space_again(self):
+        user_file = self.upload(b"content")
+        self.delete(file_id=user_file["id"])
+        self.assertEqual(self.used(), 0)
+
+        response = self.client.post(
+            "/api/v1/storage/restore/", {"file_id": user_file["id"]}, format="json"
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.used(), 7)
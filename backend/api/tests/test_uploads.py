@@ -0,0 +1,84 @@
+import hashlib
+from unittest import mock
+from django.test import TestCase, override_settings
+from api import uploads
+from api.models import UploadSession, UserFile
+from .base import StorageMixin
+
+
+@override_settings(UPLOAD_CHUNK_SIZE=4)
+class ChunkedUploadTests(StorageMixin, TestCase):
+    content = b"0123456789"
+
+    def start(self):
+        response = self.client.post(
+            "/api/v1/file/upload/sessions/",
+            {"filename": "numbers.txt", "size": len(self.content)},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        return f"/api/v1/file/upload/sessions/{response.data['id']}/"
+
+    def put_chunk(self, session, index):
+        chunk = self.content[index * 4 : index * 4 + 4]
+        return self.client.put(
+            f"{session}chunks/{index}/", chunk, content_type="application/octet-stream"
+        )
+
+    def counters(self):
+        self.user.refresh_from_db()
+        return self.user.storage_used, self.user.storage_reserved
+
+    def test_resume_and_finalize(self):
+        session = self.start()
+        self.assertEqual(self.counters(), (0, 10))
+        self.assertEqual(self.put_chunk(session, 2).status_code, 200)
+        self.assertEqual(self.put_chunk(session, 0).status_code, 200)
+
+        # an interrupted client asks what arrived and sends only the rest
+        status = self.client.get(session).data
+        self.assertEqual(status["total_chunks"], 3)
+        self.assertEqual(status["received"], [0, 2])
+        response = self.client.post(f"{session}finalize/")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["missing"], [1])
+
+        self.assertEqual(self.put_chunk(session, 1).status_code, 200)
+        upload = UploadSession.objects.get()
+        # the chunks are removed once the file is committed
+        with mock.patch("api.search.index_files"):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(f"{session}finalize/")
+        self.assertEqual(response.status_code, 200, response.data)
+
+        user_file = UserFile.objects.get(pk=response.data["file"]["id"])
+        self.assertEqual(user_file.filename, "numbers.txt")
+        self.assertEqual(user_file.blob_id, hashlib.sha256(self.content).hexdigest())
+        with user_file.file.open("rb") as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertEqual(self.counters(), (10, 0))
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertEqual(uploads.received_chunks(upload), [])
+
+        # a retried finalize finds the session gone
+        self.assertEqual(self.client.post(f"{session}finalize/").status_code, 404)
+
+    def test_short_chunk_is_rejected(self):
+        session = self.start()
+        response = self.client.put(
+            f"{session}chunks/0/", b"01", content_type="application/octet-stream"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(session).data["received"], [])
+        self.assertEqual(self.put_chunk(session, 3).status_code, 400)
+
+    def test_cancel_releases_the_reservation(self):
+        session = self.start()
+        self.put_chunk(session, 0)
+        upload = UploadSession.objects.get()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(session).status_code, 200)
+        self.assertEqual(self.counters(), (0, 0))
+        self.assertEqual(uploads.received_chunks(upload), [])
+        self.assertEqual(self.client.post(f"{session}finalize/").status_code, 404)
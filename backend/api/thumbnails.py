@@ -0,0 +1,177 @@
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, close_old_connections, transaction
+from . import imaging, storage
+from .downloads import file_content_type
+from .models import Blob, Thumbnail
+
+
+logger = logging.getLogger(__name__)
+
+# Previews are made after upload, off the request: a thread per job reads the
+# source and hands decoding and resizing to a process pool, so the CPU heavy
+# part neither blocks web workers nor fights them for the GIL. A thumbnail
+# requested before it exists is queued the same way, once per blob at a time,
+# and the client asks again later.
+_pool = None
+_dispatcher = None
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        # Not fork: the web process has threads and open connections that a
+        # forked child would inherit half-way through.
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context(
+            "forkserver" if "forkserver" in methods else "spawn"
+        )
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS, mp_context=context
+        )
+    return _pool
+
+
+def get_dispatcher():
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS, thread_name_prefix="thumbnail"
+        )
+    return _dispatcher
+
+
+def preview_kind(filename):
+    """The kind of preview ("image" or "pdf") a file can get, or None."""
+    content_type = file_content_type(filename)
+    if content_type == "application/pdf":
+        kind = "pdf"
+    elif content_type.startswith("image/") and content_type != "image/svg+xml":
+        kind = "image"
+    else:
+        return None
+    return kind if imaging.can_render(kind) else None
+
+
+def has_preview(user_file):
+    # files stored before deduplication have no blob to hang thumbnails on
+    return bool(user_file.blob_id) and preview_kind(user_file.filename) is not None
+
+
+def pick_size(requested):
+    """The smallest size covering requested, or the largest there is."""
+    sizes = sorted(settings.THUMBNAIL_SIZES)
+    for size in sizes:
+        if size >= requested:
+            return size
+    return sizes[-1]
+
+
+def schedule(user_files):
+    """Make previews for new files once the transaction creating them commits."""
+    jobs = {}
+    for user_file in user_files:
+        if has_preview(user_file):
+            jobs.setdefault(user_file.blob_id, preview_kind(user_file.filename))
+    if not jobs:
+        return
+
+    def submit():
+        done = set(
+            Thumbnail.objects.filter(blob__in=list(jobs)).values_list(
+                "blob_id", flat=True
+            )
+        )
+        for blob_id, kind in jobs.items():
+            if blob_id not in done:
+                get_dispatcher().submit(run, blob_id, kind)
+
+    transaction.on_commit(submit)
+
+
+def run(blob_id, kind):
+    close_old_connections()
+    try:
+        generate(Blob.objects.get(pk=blob_id), kind)
+    except Exception:
+        logger.exception("Thumbnails for blob %s failed", blob_id)
+    finally:
+        close_old_connections()
+
+
+def read_source(blob):
+    """A path the pool can open itself, or the bytes for remote storage."""
+    if storage.is_local() and not blob.compression:
+        return blob.file.path
+    with storage.open_file(blob.file.name) as f:
+        return f.read()
+
+
+def render(blob, kind):
+    global _pool
+    if blob.size > settings.THUMBNAIL_MAX_SOURCE_SIZE:
+        return []
+    future = get_pool().submit(
+        imaging.render, read_source(blob), kind, settings.THUMBNAIL_SIZES
+    )
+    try:
+        return future.result(timeout=settings.THUMBNAIL_TIMEOUT)
+    except BrokenProcessPool:
+        # a worker died (out of memory, ...); start over with a new pool
+        _pool = None
+        raise
+    except TimeoutError:
+        # not the file's fault, so no "no preview" marker for it
+        raise
+    except Exception:
+        logger.info("No preview for blob %s", blob.pk, exc_info=True)
+        return []
+
+
+def generate(blob, kind):
+    """Render and store every size of blob's preview. Returns {size: Thumbnail}."""
+    results = render(blob, kind) or [
+        (size, "", None, None) for size in settings.THUMBNAIL_SIZES
+    ]
+    thumbs = {}
+    for size, content_type, ext, data in results:
+        thumb = Thumbnail(blob=blob, size=size, content_type=content_type)
+        if data is not None:
+            thumb.file.save(f"{size}{ext}", ContentFile(data), save=False)
+        try:
+            with transaction.atomic():
+                thumb.save(force_insert=True)
+        except IntegrityError:
+            # made at the same time by another worker or request; on S3 both
+            # wrote the same key, so only a differently named copy is ours
+            existing = Thumbnail.objects.get(blob=blob, size=size)
+            if thumb.file and thumb.file.name != existing.file.name:
+                default_storage.delete(thumb.file.name)
+            thumb = existing
+        thumbs[size] = thumb
+    return thumbs
+
+
+def pending_key(blob_id):
+    return f"thumbnail:pending:{blob_id}"
+
+
+def get_thumbnail(user_file, size):
+    """
+    user_file's preview at size, or None if it isn't made yet. A missing
+    preview is queued unless it already is.
+    """
+    thumb = Thumbnail.objects.filter(blob_id=user_file.blob_id, size=size).first()
+    if thumb is None and cache.add(
+        pending_key(user_file.blob_id), True, settings.THUMBNAIL_TIMEOUT
+    ):
+        get_dispatcher().submit(
+            run, user_file.blob_id, preview_kind(user_file.filename)
+        )
+    return thumb
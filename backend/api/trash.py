@@ -0,0 +1,104 @@
+from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from . import changes, folders, quota
+from .models import Folder, UserFile
+
+
+# Deleting only stamps trashed_at (the default managers hide those rows) and
+# gives the space back. Everything trashed by one delete shares the same
+# timestamp, which is how restore knows what belongs together. The bytes are
+# removed later by the purge_trash command.
+
+
+def total_size(files):
+    return files.aggregate(total=Coalesce(Sum("size"), 0))["total"]
+
+
+def trash_file(user, user_file):
+    with transaction.atomic():
+        # a request deleting the same file at the same time finds it trashed
+        updated = UserFile.objects.filter(pk=user_file.pk).update(
+            trashed_at=timezone.now()
+        )
+        if updated:
+            quota.free(user, user_file.size)
+            changes.record(user, "file", "delete", [user_file.pk])
+
+
+def trash_folder(user, folder):
+    now = timezone.now()
+    with transaction.atomic():
+        if not Folder.objects.select_for_update().filter(pk=folder.pk).exists():
+            return
+        # Only files that are still live count; the rows stay locked so a
+        # request trashing some of them at the same time waits and skips them
+        files = folders.subtree_files(folder).select_for_update()
+        freed = sum(files.values_list("size", flat=True))
+        files.update(trashed_at=now)
+        Folder.objects.filter(id__in=folders.subtree_ids(folder)).update(trashed_at=now)
+        quota.free(user, freed)
+        # clients drop the folder's contents with it
+        changes.record(user, "folder", "delete", [folder.pk])
+
+
+def restore_file(user, user_file):
+    """Returns False if the file no longer fits in the user's storage."""
+    with transaction.atomic():
+        if not quota.reserve(user, user_file.size):
+            return False
+        parent = user_file.parent_folder
+        if parent and parent.trashed_at:
+            # its folder is still in the trash, bring it back at the root
+            user_file.parent_folder = None
+        user_file.trashed_at = None
+        user_file.save(update_fields=["parent_folder", "trashed_at"])
+        quota.commit(user, user_file.size)
+        changes.record(user, "file", "insert", [user_file.pk])
+    return True
+
+
+def restore_folder(user, folder):
+    """Returns False if the folder no longer fits in the user's storage."""
+    trashed_at = folder.trashed_at
+    with transaction.atomic():
+        files = UserFile.all_objects.filter(
+            parent_folder__in=folders.subtree_ids(folder), trashed_at=trashed_at
+        )
+        size = total_size(files)
+        if not quota.reserve(user, size):
+            return False
+        subtree = Folder.all_objects.filter(
+            id__in=folders.subtree_ids(folder), trashed_at=trashed_at
+        )
+        # everything comes back, so clients are sent all of it
+        changes.record(user, "folder", "insert", subtree.values_list("id", flat=True))
+        changes.record(user, "file", "insert", files.values_list("id", flat=True))
+        files.update(trashed_at=None)
+        subtree.update(trashed_at=None)
+        quota.commit(user, size)
+
+        parent = folder.parent
+        if parent and parent.trashed_at:
+            folders.move_folder(folder, None)
+    return True
+
+
+def not_trashed_with(parent):
+    return (
+        Q(**{f"{parent}__isnull": True})
+        | Q(**{f"{parent}__trashed_at__isnull": True})
+        | ~Q(**{f"{parent}__trashed_at": F("trashed_at")})
+    )
+
+
+def trashed_roots(user):
+    """What the user deleted: trashed items whose parent was not trashed with them."""
+    trashed_folders = Folder.all_objects.filter(
+        not_trashed_with("parent"), user=user, trashed_at__isnull=False
+    )
+    trashed_files = UserFile.all_objects.filter(
+        not_trashed_with("parent_folder"), user=user, trashed_at__isnull=False
+    )
+    return trashed_folders, trashed_files
@@ -0,0 +1,209 @@
+import os
+import uuid
+import shutil
+from datetime import timedelta
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile, StopUpload
+from django.db import transaction
+from django.utils import timezone
+from . import blobs, quota
+from .models import Folder, UploadSession
+
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def clean_filename(name):
+    """
+    The last part of a client-supplied name, without control characters, or
+    "" if nothing usable is left. Names become paths inside folder ZIPs, so
+    they must not hold directories or climb out with "..".
+    """
+    name = os.path.basename(str(name).replace("\\", "/"))
+    name = "".join(c for c in name if c.isprintable()).strip()
+    if name in (".", ".."):
+        return ""
+    return name[:255]
+
+
+def session_dir(session):
+    return os.path.join(settings.UPLOAD_TEMP_DIR, "sessions", str(session.id))
+
+
+def chunk_path(session, index):
+    return os.path.join(session_dir(session), f"{index}.part")
+
+
+def expected_chunk_size(session, index):
+    """Every chunk is chunk_size bytes except the last one."""
+    if index == session.total_chunks - 1:
+        return session.size - index * session.chunk_size
+    return session.chunk_size
+
+
+def received_chunks(session):
+    """Indexes of the chunks already stored for a session."""
+    try:
+        names = os.listdir(session_dir(session))
+    except FileNotFoundError:
+        return []
+    return sorted(int(n[:-5]) for n in names if n.endswith(".part"))
+
+
+def write_chunk(session, index, stream):
+    """
+    Store one chunk from a file-like stream.
+    The chunk is written to a temp name and renamed, so a chunk that exists
+    is always complete and a retried chunk simply replaces the old one.
+    Raises ValueError if the body is not exactly the expected chunk size.
+    """
+    expected = expected_chunk_size(session, index)
+    os.makedirs(session_dir(session), exist_ok=True)
+    final_path = chunk_path(session, index)
+    tmp_path = f"{final_path}.{uuid.uuid4().hex}.tmp"
+    written = 0
+    try:
+        with open(tmp_path, "wb") as out:
+            while written <= expected:
+                data = stream.read(COPY_BUFFER_SIZE)
+                if not data:
+                    break
+                written += len(data)
+                out.write(data)
+        if written != expected:
+            raise ValueError(f"Chunk {index} must be {expected} bytes")
+        os.replace(tmp_path, final_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def discard_session(session):
+    shutil.rmtree(session_dir(session), ignore_errors=True)
+
+
+def expired_sessions():
+    """Upload sessions started more than UPLOAD_SESSION_EXPIRY_HOURS ago."""
+    cutoff = timezone.now() - timedelta(hours=settings.UPLOAD_SESSION_EXPIRY_HOURS)
+    return UploadSession.objects.filter(created_at__lt=cutoff)
+
+
+def drop_session(session):
+    """
+    Cancel an upload: its row and reservation now, its chunks once that has
+    committed. Waits for a finalize holding the session's lock; if that got
+    there first the reservation is gone already.
+    """
+    with transaction.atomic():
+        deleted, _ = UploadSession.objects.filter(pk=session.pk).delete()
+        if deleted:
+            quota.release(session.user, session.size)
+        transaction.on_commit(lambda: discard_session(session))
+
+
+def finish_error(session):
+    """
+    Call in the transaction that turns session into a file. Locks the session
+    and its folder until it commits, and returns why the upload can't be
+    finished, or None: the session is gone (cancelled, expired, its folder
+    purged) or its folder has been moved to the trash, whose files no longer
+    count against the quota.
+    """
+    if not UploadSession.objects.select_for_update().filter(pk=session.pk).exists():
+        return "Upload session not found"
+    folder_id = session.parent_folder_id
+    if folder_id and not Folder.objects.select_for_update().filter(pk=folder_id).exists():
+        return "Folder not found"
+    return None
+
+
+def iter_chunks(session):
+    """Yield the bytes of a session's chunks in order."""
+    for index in range(session.total_chunks):
+        with open(chunk_path(session, index), "rb") as f:
+            while True:
+                data = f.read(COPY_BUFFER_SIZE)
+                if not data:
+                    break
+                yield data
+
+
+class HashedUploadedFile(UploadedFile):
+    """
+    An uploaded file that is already sitting in a finished HashingWriter.
+    Views store the writer itself, so the file is only opened if something
+    asks to read it.
+    """
+
+    def __init__(self, writer, name, content_type, charset, content_type_extra):
+        super().__init__(
+            None, name, content_type, writer.size, charset, content_type_extra
+        )
+        self.writer = writer
+
+    def temporary_file_path(self):
+        return self.writer.path
+
+    def open(self, mode="rb"):
+        if self.closed:
+            self.file = open(self.writer.path, mode)
+        else:
+            self.seek(0)
+        return self
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+class BlobUploadHandler(FileUploadHandler):
+    """
+    Multipart upload handler that streams each file straight into a
+    blobs.HashingWriter, so the bytes are written once and size and SHA-256
+    are known when parsing ends. A file stops being read as soon as it goes
+    over the package's max_upload_size: it is skipped and listed in
+    too_large if skip_too_large is set, otherwise the upload is aborted.
+    """
+
+    chunk_size = 256 * 1024
+
+    def __init__(self, request, skip_too_large=False):
+        super().__init__(request)
+        package = getattr(request.user, "package", None)
+        self.limit = package.max_upload_size if package else 0
+        self.skip_too_large = skip_too_large
+        self.too_large = []
+        self.writer = None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.writer = blobs.HashingWriter()
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.writer.size + len(raw_data) > self.limit:
+            self.discard()
+            self.too_large.append(self.file_name)
+            if self.skip_too_large:
+                raise SkipFile()
+            raise StopUpload(connection_reset=True)
+        self.writer.write(raw_data)
+
+    def file_complete(self, file_size):
+        writer, self.writer = self.writer, None
+        writer.close()
+        return HashedUploadedFile(
+            writer,
+            self.file_name,
+            self.content_type,
+            self.charset,
+            self.content_type_extra,
+        )
+
+    def upload_interrupted(self):
+        self.discard()
+
+    def discard(self):
+        if self.writer:
+            self.writer.discard()
+            self.writer = None
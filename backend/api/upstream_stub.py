@@ -0,0 +1,105 @@
+import io
+import json
+import time
+import base64
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Local stand-ins for the Groq chat API and Stable Horde, so the benchmark
+# command measures this code and not somebody else's servers. Every request
+# waits `latency` seconds, like a remote API would.
+
+REPLY = "This is a canned reply from the benchmark stub."
+# 1x1 white WebP
+IMAGE = base64.b64encode(
+    bytes.fromhex(
+        "524946461a000000574542505650384c0d0000002f00000010071011118888fe0700"
+    )
+).decode()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        time.sleep(self.server.latency)
+
+        if self.path.startswith("/groq"):
+            if payload.get("stream"):
+                self.stream_reply()
+            else:
+                self.send_json(
+                    {"choices": [{"message": {"role": "assistant", "content": REPLY}}]}
+                )
+        elif self.path.startswith("/horde"):
+            self.send_json({"id": f"stub-{time.monotonic_ns()}"}, status=202)
+        else:
+            self.send_json({"error": "not found"}, status=404)
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        if "/check/" in self.path:
+            self.send_json({"done": True, "faulted": False, "is_possible": True})
+        elif "/status/" in self.path:
+            self.send_json({"generations": [{"img": IMAGE}]})
+        else:
+            self.send_json({"error": "not found"}, status=404)
+
+    def stream_reply(self):
+        body = io.BytesIO()
+        for word in REPLY.split(" "):
+            chunk = {"choices": [{"delta": {"content": word + " "}}]}
+            body.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        body.write(b"data: [DONE]\n\n")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Content-Length", str(body.tell()))
+        self.end_headers()
+        self.wfile.write(body.getvalue())
+
+
+class UpstreamStub:
+    """Runs the stub on a free local port in a background thread."""
+
+    def __init__(self, latency=0.05):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        self.server.daemon_threads = True
+        self.server.latency = latency
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def settings(self):
+        """Settings overrides pointing the chat and image code at the stub."""
+        return {
+            "GROQ_CHAT_URL": f"{self.url}/groq/chat/completions",
+            "GROQ_API_KEY": "stub",
+            # image jobs resolve check/ and status/ against this URL
+            "STABLE_HORDE_URL": f"{self.url}/horde/generate/async",
+            "API_KEY": "stub",
+        }
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -1,6 +1,7 @@
 from django.urls import path
 from . import views
 
+
 urlpatterns = [
     # User Related
     path("register/", views.register_user, name="register_user"),
@@ -15,9 +16,58 @@ urlpatterns = [
     ),
     path("storage/", views.get_all_storage, name="get_f"),
     path("storage/usage/", views.get_storage_usage, name="get_size_usage"),
+    path("storage/folders/", views.list_folders, name="list_folders"),
+    path("storage/files/", views.list_files, name="list_files"),
+    path("storage/search/", views.search_storage, name="search_storage"),
+    path("storage/changes/", views.storage_changes, name="storage_changes"),
+    path(
+        "storage/folders/<uuid:folder_id>/children/",
+        views.list_folder_children,
+        name="folder_children",
+    ),
+    path(
+        "storage/folders/<uuid:folder_id>/move/",
+        views.move_folder,
+        name="folder_move",
+    ),
+    path(
+        "storage/folders/<uuid:folder_id>/size/",
+        views.get_folder_size,
+        name="folder_size",
+    ),
     # Create , Upload and delete related
     path("file/upload/", views.upload_file, name="upload_file"),
+    path("file/upload/instant/", views.instant_upload, name="instant_upload"),
+    path("file/upload/batch/", views.upload_files, name="upload_files"),
+    path("file/upload/direct/", views.create_direct_upload, name="direct_upload"),
+    path(
+        "file/upload/direct/<uuid:session_id>/complete/",
+        views.complete_direct_upload,
+        name="direct_upload_complete",
+    ),
+    path(
+        "file/upload/sessions/",
+        views.create_upload_session,
+        name="upload_session_create",
+    ),
+    path(
+        "file/upload/sessions/<uuid:session_id>/",
+        views.upload_session_detail,
+        name="upload_session_detail",
+    ),
+    path(
+        "file/upload/sessions/<uuid:session_id>/chunks/<int:index>/",
+        views.upload_chunk,
+        name="upload_chunk",
+    ),
+    path(
+        "file/upload/sessions/<uuid:session_id>/finalize/",
+        views.finalize_upload_session,
+        name="upload_session_finalize",
+    ),
     path("storage/delete/", views.delete_item, name="delete_f"),
+    path("storage/trash/", views.list_trash, name="list_trash"),
+    path("storage/restore/", views.restore_item, name="restore_item"),
     path("create/folder/", views.create_folder, name="folder_creation"),
     # Download related
     path(
@@ -30,15 +80,29 @@ urlpatterns = [
         views.download_file,
         name="download_file",
     ),
+    path(
+        "storage/files/thumbnail/<uuid:unique_link>/",
+        views.file_thumbnail,
+        name="file_thumbnail",
+    ),
     # Payment Related
     path("payment/initiate/", views.initiate_payment, name="initiate-payment"),
     path("payment/status/", views.payment_status, name="payment-status"),
     # AI
     # chat
     path("chat/", views.chat_ai, name="ai-chat"),
+    path("chat/stream/", views.chat_stream, name="ai-chat-stream"),
     path("chat/save/", views.save_chat_session),
     path("chat/history/", views.get_chat_history),
     path("chat/reset/", views.reset_chat_session),
     # Img generation
     path("img/gen/", views.generate_image, name="img-generation"),
+    path("img/jobs/<uuid:job_id>/", views.image_job_status, name="img-job"),
+    path(
+        "img/jobs/<uuid:job_id>/events/",
+        views.image_job_events,
+        name="img-job-events",
+    ),
+    # Monitoring
+    path("metrics/", views.metrics_view, name="metrics"),
 ]
@@ -0,0 +1,57 @@
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+
+
+# Authenticated requests get their user (with the package already attached)
+# from the cache instead of two queries. A user entry is dropped whenever
+# that user is saved. A package change can't find all its users' entries, so
+# each package has a version token instead: entries remember the version
+# they were cached with and count as missing once it has moved on.
+
+
+def user_key(user_id):
+    return f"auth:user:{user_id}"
+
+
+def package_key(package_id):
+    return f"auth:package:{package_id}"
+
+
+def package_version(package_id):
+    if package_id is None:
+        return None
+    version = cache.get(package_key(package_id))
+    if version is None:
+        cache.add(package_key(package_id), uuid.uuid4().hex, None)
+        version = cache.get(package_key(package_id))
+    return version
+
+
+def get(user_id):
+    if not settings.AUTH_CACHE_TIMEOUT:
+        return None
+    entry = cache.get(user_key(user_id))
+    if entry is None:
+        return None
+    user, version = entry
+    if version != package_version(user.package_id):
+        return None
+    return user
+
+
+def put(user):
+    if not settings.AUTH_CACHE_TIMEOUT:
+        return
+    # touch the relation so the package is pickled along with the user
+    user.package
+    entry = (user, package_version(user.package_id))
+    cache.set(user_key(user.pk), entry, settings.AUTH_CACHE_TIMEOUT)
+
+
+def invalidate_user(user_id):
+    cache.delete(user_key(user_id))
+
+
+def invalidate_package(package_id):
+    cache.set(package_key(package_id), uuid.uuid4().hex, None)
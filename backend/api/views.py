@@ -1,19 +1,67 @@
-import os
+import json
 import uuid
-import time
+import asyncio
 import math
-import zipfile
+import httpx
 import requests
+from asgiref.sync import sync_to_async
 from io import BytesIO
 from decimal import Decimal
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import Count, Prefetch, Q, Sum
+from django.db.models.functions import Coalesce
 from rest_framework import status
 from rest_framework.response import Response
-from django.http import FileResponse, HttpResponse
+from django.core.files.storage import default_storage
+from django.http import (
+    HttpResponse,
+    HttpResponseRedirect,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.utils.http import content_disposition_header
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.permissions import IsAuthenticated
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.decorators import api_view, permission_classes
-from .models import UserFile, Folder, Transaction, Package, EncryptedChatSession
+from . import (
+    archives,
+    blobs,
+    changes,
+    chat,
+    compression,
+    downloads,
+    folders,
+    imagejobs,
+    metrics,
+    profiling,
+    quota,
+    search,
+    storage,
+    thumbnails,
+    trash,
+    uploads,
+)
+from .authentication import CachedJWTAuthentication
+from .routers import read_from_replica
+from .models import (
+    UserFile,
+    Folder,
+    Transaction,
+    Package,
+    ChatMessage,
+    UploadSession,
+    ImageJob,
+    Blob,
+    blob_upload_path,
+)
 from .serializers import (
     UserSerializer,
     UserRegisterSerializer,
@@ -21,13 +69,33 @@ from .serializers import (
     PackageSerializer,
     UserFileSerializer,
     FolderSerializer,
+    FolderSummarySerializer,
+    ImageJobSerializer,
+    SearchResultSerializer,
 )
+from .pagination import (
+    ChatMessageCursorPagination,
+    FileCursorPagination,
+    FolderCursorPagination,
+    SearchPagination,
+)
+
+
+ZIP_STREAM_BUFFER_SIZE = 64 * 1024
+IMAGE_JOB_EVENT_INTERVAL = 1
+MAX_SAVED_MESSAGES = 100
+MAX_CHANGES_PAGE_SIZE = 2000
 
 
-GROQ_API_KEY = settings.GROQ_API_KEY
-GROQ_CHAT_URL = settings.GROQ_CHAT_URL
-STABLE_HORDE_URL = settings.STABLE_HORDE_URL
-API_KEY = settings.API_KEY
+def invalid_ids(*values):
+    """True if any of the given ids is set but isn't a UUID."""
+    for value in values:
+        if value:
+            try:
+                uuid.UUID(str(value))
+            except ValueError:
+                return True
+    return False
 
 
 def get_user_tokens(user):
@@ -60,6 +128,7 @@ def get_self_package_permissions(request):
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@read_from_replica
 def get_package_details(request):
     packages = Package.objects.all()
     serializer = PackageSerializer(packages, many=True)
@@ -107,14 +176,182 @@ def update_user(request):
 def upload_file(request):
     user = request.user
     package = user.package
+    # Stream the file straight into the blob writer instead of a temp file
+    handler = uploads.BlobUploadHandler(request)
+    request.upload_handlers = [handler]
     uploaded_file = request.FILES.get("file")
     folder_id = request.data.get("folder_id")
 
+    # Logic for Checking single file size (checked while it was received)
+    if handler.too_large:
+        return Response(
+            {
+                "error": f"File too large. Max size for {package.name} is {package.max_upload_size / (1024*1024)} MB"
+            },
+            status=400,
+        )
+
     if not uploaded_file:
         return Response({"error": "No file provided"}, status=400)
+    writer = uploaded_file.writer
 
-    # Logic for Checking single file size
-    if uploaded_file.size > package.max_upload_size:
+    folder = None
+    if invalid_ids(folder_id):
+        writer.discard()
+        return Response({"error": "Invalid folder_id"}, status=400)
+    if folder_id:
+        folder = Folder.objects.filter(id=folder_id, user=user).first()
+        if not folder:
+            writer.discard()
+            return Response({"error": "Folder not found"}, status=404)
+
+    # Logic for Checking total storage quota
+    if not quota.reserve(user, writer.size):
+        writer.discard()
+        return Response(
+            {"error": "You exceeded your package storage limit"}, status=400
+        )
+
+    try:
+        # Hashed while it was received, so identical content is stored only once
+        with transaction.atomic():
+            user_file = blobs.create_user_file(
+                user, blobs.store(writer), uploaded_file.name, folder
+            )
+            quota.commit(user, writer.size)
+    except Exception:
+        quota.release(user, writer.size)
+        writer.discard()
+        raise
+
+    serializer = UserFileSerializer(user_file, context={"request": request})
+    return Response({"message": "File uploaded successfully", "file": serializer.data})
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def upload_files(request):
+    """
+    Upload many files in one request ("files" repeated, optional folder_id).
+    Files are hashed as they are received, quota is reserved once for the
+    whole batch and everything is stored with bulk inserts. Every file gets
+    its own result, so one bad file does not fail the rest.
+    """
+    user = request.user
+    handler = uploads.BlobUploadHandler(request, skip_too_large=True)
+    request.upload_handlers = [handler]
+    uploaded_files = request.FILES.getlist("files")
+    folder_id = request.data.get("folder_id")
+
+    try:
+        if not uploaded_files and not handler.too_large:
+            return Response({"error": "No files provided"}, status=400)
+        total = len(uploaded_files) + len(handler.too_large)
+        if total > settings.BATCH_UPLOAD_MAX_FILES:
+            return Response(
+                {"error": f"At most {settings.BATCH_UPLOAD_MAX_FILES} files per batch"},
+                status=400,
+            )
+
+        folder = None
+        if invalid_ids(folder_id):
+            return Response({"error": "Invalid folder_id"}, status=400)
+        if folder_id:
+            folder = Folder.objects.filter(id=folder_id, user=user).first()
+            if not folder:
+                return Response({"error": "Folder not found"}, status=404)
+
+        results = [{"filename": f.name} for f in uploaded_files]
+        results += [
+            {"filename": name, "error": "File too large"} for name in handler.too_large
+        ]
+
+        # Take files in order while they fit, then reserve them with one UPDATE
+        accepted = []
+        space = quota.available(user)
+        for index, uploaded_file in enumerate(uploaded_files):
+            if uploaded_file.size > space:
+                results[index]["error"] = "You exceeded your package storage limit"
+            else:
+                space -= uploaded_file.size
+                accepted.append(index)
+
+        reserved = sum(uploaded_files[i].size for i in accepted)
+        if accepted and not quota.reserve(user, reserved):
+            # another upload took the space in the meantime
+            for index in accepted:
+                results[index]["error"] = "You exceeded your package storage limit"
+            accepted = []
+
+        if accepted:
+            try:
+                with transaction.atomic():
+                    user_files = blobs.create_user_files(
+                        user,
+                        blobs.store_many([uploaded_files[i].writer for i in accepted]),
+                        [uploaded_files[i].name for i in accepted],
+                        folder,
+                    )
+                    quota.commit(user, reserved)
+            except Exception:
+                quota.release(user, reserved)
+                raise
+            serialized = UserFileSerializer(
+                user_files, many=True, context={"request": request}
+            ).data
+            for index, data in zip(accepted, serialized):
+                results[index]["file"] = data
+    finally:
+        # temp files of anything that was not stored
+        for uploaded_file in uploaded_files:
+            uploaded_file.writer.discard()
+
+    uploaded = sum("file" in r for r in results)
+    return Response(
+        {
+            "uploaded": uploaded,
+            "failed": len(results) - uploaded,
+            "results": results,
+        },
+        status=200 if uploaded else 400,
+    )
+
+
+def session_status(session):
+    return {
+        "id": session.id,
+        "filename": session.filename,
+        "size": session.size,
+        "chunk_size": session.chunk_size,
+        "total_chunks": session.total_chunks,
+        "received": uploads.received_chunks(session),
+    }
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def create_upload_session(request):
+    """
+    Start a chunked upload.
+    Client sends filename + size, gets back a session id and the chunk size,
+    then PUTs each chunk (in any order, in parallel) and finalizes.
+    """
+    user = request.user
+    package = user.package
+    filename = uploads.clean_filename(request.data.get("filename") or "")
+    folder_id = request.data.get("folder_id")
+    if invalid_ids(folder_id):
+        return Response({"error": "Invalid folder_id"}, status=400)
+
+    try:
+        size = int(request.data.get("size"))
+    except (TypeError, ValueError):
+        return Response({"error": "Valid size required"}, status=400)
+
+    if not filename or size < 0:
+        return Response({"error": "filename and size required"}, status=400)
+
+    if size > package.max_upload_size:
         return Response(
             {
                 "error": f"File too large. Max size for {package.name} is {package.max_upload_size / (1024*1024)} MB"
@@ -122,27 +359,272 @@ def upload_file(request):
             status=400,
         )
 
-    # Logic for Checking total storage quota
-    total_used = sum(f.size for f in user.files.all())
-    if total_used + uploaded_file.size > package.max_upload_size:
+    folder = None
+    if folder_id:
+        folder = Folder.objects.filter(id=folder_id, user=user).first()
+        if not folder:
+            return Response({"error": "Folder not found"}, status=404)
+
+    # Space is held for the whole upload so parallel sessions can't overbook
+    if not quota.reserve(user, size):
         return Response(
             {"error": "You exceeded your package storage limit"}, status=400
         )
 
+    session = UploadSession.objects.create(
+        user=user,
+        filename=filename,
+        size=size,
+        chunk_size=settings.UPLOAD_CHUNK_SIZE,
+        parent_folder=folder,
+    )
+    return Response(session_status(session), status=status.HTTP_201_CREATED)
+
+
+@api_view(["GET", "DELETE"])
+@permission_classes([IsAuthenticated])
+def upload_session_detail(request, session_id):
+    """GET lists the chunks already received, DELETE aborts the upload."""
+    session = UploadSession.objects.filter(id=session_id, user=request.user).first()
+    if not session:
+        return Response({"error": "Upload session not found"}, status=404)
+
+    if request.method == "DELETE":
+        uploads.drop_session(session)
+        return Response({"message": "Upload cancelled"})
+
+    return Response(session_status(session))
+
+
+@api_view(["PUT"])
+@permission_classes([IsAuthenticated])
+def upload_chunk(request, session_id, index):
+    """Store one chunk. The raw request body is the chunk; retries overwrite."""
+    session = UploadSession.objects.filter(id=session_id, user=request.user).first()
+    if not session:
+        return Response({"error": "Upload session not found"}, status=404)
+
+    if index >= session.total_chunks:
+        return Response({"error": "Chunk index out of range"}, status=400)
+
+    try:
+        uploads.write_chunk(session, index, request.stream or BytesIO())
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
+
+    return Response({"index": index, "received": True})
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def finalize_upload_session(request, session_id):
+    user = request.user
+    session = UploadSession.objects.filter(id=session_id, user=user).first()
+    if not session:
+        return Response({"error": "Upload session not found"}, status=404)
+
+    # The session is locked before its chunks are read, so a cancel, an
+    # expiry or a second finalize can't remove them in the meantime
+    with transaction.atomic():
+        error = uploads.finish_error(session)
+        received = [] if error else uploads.received_chunks(session)
+        missing = sorted(set(range(session.total_chunks)) - set(received))
+        if not error and not missing:
+            # The chunks have to be read once anyway to hash the content
+            writer = blobs.write_chunks(uploads.iter_chunks(session))
+            user_file = blobs.create_user_file(
+                user, blobs.store(writer), session.filename, session.parent_folder
+            )
+            # not session.delete(): that clears the id discard_session needs
+            UploadSession.objects.filter(pk=session.pk).delete()
+            # The space was reserved when the session was created
+            quota.commit(user, session.size)
+            transaction.on_commit(lambda: uploads.discard_session(session))
+    if error:
+        uploads.drop_session(session)
+        return Response({"error": error}, status=404)
+    if missing:
+        return Response(
+            {"error": "Upload incomplete", "missing": missing}, status=400
+        )
+
+    serializer = UserFileSerializer(user_file, context={"request": request})
+    return Response({"message": "File uploaded successfully", "file": serializer.data})
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def instant_upload(request):
+    """
+    Upload without sending bytes.
+    Client sends the SHA-256 and size of the file; if the user already stores
+    that content the new file just links to it. Otherwise 404 and the client
+    falls back to a normal upload.
+    """
+    user = request.user
+    sha256 = str(request.data.get("sha256", "")).lower()
+    filename = uploads.clean_filename(request.data.get("filename") or "")
+    folder_id = request.data.get("folder_id")
+    if invalid_ids(folder_id):
+        return Response({"error": "Invalid folder_id"}, status=400)
+
+    try:
+        size = int(request.data.get("size"))
+    except (TypeError, ValueError):
+        return Response({"error": "Valid size required"}, status=400)
+
+    if not filename or size < 0 or len(sha256) != 64:
+        return Response({"error": "filename, sha256 and size required"}, status=400)
+
+    folder = None
+    if folder_id:
+        folder = Folder.objects.filter(id=folder_id, user=user).first()
+        if not folder:
+            return Response({"error": "Folder not found"}, status=404)
+
+    if not quota.reserve(user, size):
+        return Response(
+            {"error": "You exceeded your package storage limit"}, status=400
+        )
+
+    with transaction.atomic():
+        blob = blobs.link(sha256, size, owner=user)
+        if blob:
+            user_file = blobs.create_user_file(user, blob, filename, folder)
+            quota.commit(user, size)
+    if not blob:
+        quota.release(user, size)
+        return Response({"error": "Content not found", "instant": False}, status=404)
+
+    serializer = UserFileSerializer(user_file, context={"request": request})
+    return Response(
+        {
+            "message": "File uploaded successfully",
+            "instant": True,
+            "file": serializer.data,
+        }
+    )
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def create_direct_upload(request):
+    """
+    Start an upload that goes straight to object storage.
+    Client sends filename, size and SHA-256 and gets a presigned PUT (or the
+    finished file if that content is already stored). After the PUT it calls
+    complete; Django never sees the bytes.
+    """
+    user = request.user
+    package = user.package
+    sha256 = str(request.data.get("sha256", "")).lower()
+    filename = uploads.clean_filename(request.data.get("filename") or "")
+    folder_id = request.data.get("folder_id")
+    if invalid_ids(folder_id):
+        return Response({"error": "Invalid folder_id"}, status=400)
+
+    if storage.is_local():
+        return Response(
+            {"error": "Direct upload needs the s3 storage driver, use file/upload/"},
+            status=400,
+        )
+
+    try:
+        size = int(request.data.get("size"))
+        bytes.fromhex(sha256)
+    except (TypeError, ValueError):
+        return Response({"error": "Valid size and sha256 required"}, status=400)
+
+    if not filename or size < 0 or len(sha256) != 64:
+        return Response({"error": "filename, sha256 and size required"}, status=400)
+
+    if size > package.max_upload_size:
+        return Response(
+            {
+                "error": f"File too large. Max size for {package.name} is {package.max_upload_size / (1024*1024)} MB"
+            },
+            status=400,
+        )
+
     folder = None
     if folder_id:
         folder = Folder.objects.filter(id=folder_id, user=user).first()
         if not folder:
             return Response({"error": "Folder not found"}, status=404)
 
-    user_file = UserFile.objects.create(
+    if not quota.reserve(user, size):
+        return Response(
+            {"error": "You exceeded your package storage limit"}, status=400
+        )
+
+    # Already stored by this user: nothing to upload
+    with transaction.atomic():
+        blob = blobs.link(sha256, size, owner=user)
+        if blob:
+            user_file = blobs.create_user_file(user, blob, filename, folder)
+            quota.commit(user, size)
+    if blob:
+        serializer = UserFileSerializer(user_file, context={"request": request})
+        return Response(
+            {"message": "File uploaded successfully", "file": serializer.data},
+            status=status.HTTP_201_CREATED,
+        )
+
+    session = UploadSession.objects.create(
         user=user,
-        file=uploaded_file,
-        filename=uploaded_file.name,
-        size=uploaded_file.size,
+        filename=filename,
+        size=size,
+        chunk_size=size,
         parent_folder=folder,
+        sha256=sha256,
+    )
+    name = blob_upload_path(Blob(sha256=sha256), sha256)
+    return Response(
+        {"id": session.id, "upload": default_storage.upload_url(name, size, sha256)},
+        status=status.HTTP_201_CREATED,
     )
 
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def complete_direct_upload(request, session_id):
+    user = request.user
+    session = UploadSession.objects.filter(
+        id=session_id, user=user, sha256__gt=""
+    ).first()
+    if not session:
+        return Response({"error": "Upload session not found"}, status=404)
+
+    # The presigned PUT only accepts a body with the session's SHA-256, so
+    # checking that the object is there with that checksum is enough. It must
+    # have been written since the session started: the content may be stored
+    # for another user already, which this user hasn't shown they have.
+    name = blob_upload_path(Blob(sha256=session.sha256), session.sha256)
+    head = default_storage.head(name)
+    checksum = head and head.get("ChecksumSHA256")
+    if (
+        not head
+        or head["ContentLength"] != session.size
+        or head["LastModified"] < session.created_at.replace(microsecond=0)
+        or (checksum and checksum != storage.sha256_checksum(session.sha256))
+    ):
+        return Response({"error": "File has not been uploaded"}, status=400)
+
+    with transaction.atomic():
+        error = uploads.finish_error(session)
+        if not error:
+            user_file = blobs.create_user_file(
+                user,
+                blobs.adopt(session.sha256, session.size),
+                session.filename,
+                session.parent_folder,
+            )
+            session.delete()
+            quota.commit(user, session.size)
+    if error:
+        uploads.drop_session(session)
+        return Response({"error": error}, status=404)
+
     serializer = UserFileSerializer(user_file, context={"request": request})
     return Response({"message": "File uploaded successfully", "file": serializer.data})
 
@@ -151,38 +633,143 @@ def upload_file(request):
 @permission_classes([IsAuthenticated])
 def create_folder(request):
     user = request.user
-    folder_name = request.data.get("name")
+    folder_name = uploads.clean_filename(request.data.get("name") or "")
     if not folder_name:
         return Response({"error": "Folder name required"}, status=400)
 
-    folder = Folder.objects.create(user=user, name=folder_name)
+    parent = None
+    parent_id = request.data.get("parent_id")
+    if invalid_ids(parent_id):
+        return Response({"error": "Invalid parent_id"}, status=400)
+    if parent_id:
+        parent = Folder.objects.filter(id=parent_id, user=user).first()
+        if not parent:
+            return Response({"error": "Parent folder not found"}, status=404)
+
+    folder = folders.create_folder(user, folder_name, parent)
     serializer = FolderSerializer(folder, context={"request": request})
     return Response({"message": "Folder created", "folder": serializer.data})
 
 
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def list_folder_children(request, folder_id):
+    """Cursor-paginated summaries of the folders directly inside a folder."""
+    folder = Folder.objects.filter(id=folder_id, user=request.user).first()
+    if not folder:
+        return Response({"error": "Folder not found"}, status=404)
+
+    paginator = FolderCursorPagination()
+    children = folder_summaries(request.user).filter(parent=folder)
+    page = paginator.paginate_queryset(children, request)
+    serializer = FolderSummarySerializer(page, many=True, context={"request": request})
+    return paginator.get_paginated_response(serializer.data)
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def move_folder(request, folder_id):
+    """Move a folder under parent_id, or to the root when parent_id is empty."""
+    user = request.user
+    folder = Folder.objects.filter(id=folder_id, user=user).first()
+    if not folder:
+        return Response({"error": "Folder not found"}, status=404)
+
+    parent = None
+    parent_id = request.data.get("parent_id")
+    if invalid_ids(parent_id):
+        return Response({"error": "Invalid parent_id"}, status=400)
+    if parent_id:
+        parent = Folder.objects.filter(id=parent_id, user=user).first()
+        if not parent:
+            return Response({"error": "Parent folder not found"}, status=404)
+        if folders.is_in_subtree(folder, parent):
+            return Response(
+                {"error": "Can't move a folder into itself or its subfolders"},
+                status=400,
+            )
+
+    folders.move_folder(folder, parent)
+    serializer = FolderSerializer(folder, context={"request": request})
+    return Response({"message": "Folder moved", "folder": serializer.data})
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def get_folder_size(request, folder_id):
+    """Recursive size, file count and folder count of a folder."""
+    folder = Folder.objects.filter(id=folder_id, user=request.user).first()
+    if not folder:
+        return Response({"error": "Folder not found"}, status=404)
+    return Response(folders.subtree_stats(folder))
+
+
+def buffered_stream(chunks, size=ZIP_STREAM_BUFFER_SIZE):
+    """Join the many small pieces a generator yields into larger writes."""
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        if len(buffer) >= size:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
 @api_view(["GET"])
 def download_folder(request, unique_link):
     folder = Folder.objects.filter(unique_link=unique_link).first()
     if not folder:
         return HttpResponse("Folder not found", status=404)
 
-    files = folder.files.all()
+    files = folders.subtree_files(folder)
     if not files.exists():
         return HttpResponse("No files in folder", status=404)
 
-    # In-memory zip
-    zip_buffer = BytesIO()
-    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-        for f in files:
-            file_path = f.file.path
-            filename = os.path.basename(file_path)
-            zip_file.write(file_path, arcname=filename)
-
-    zip_buffer.seek(0)
+    paths = folders.subtree_paths(folder)
+    local = storage.is_local()
+    if (
+        local
+        and settings.DOWNLOAD_OFFLOAD == "nginx"
+        and settings.DOWNLOAD_NGINX_ZIP
+        and not downloads.has_compressed(files)
+    ):
+        # nginx mod_zip builds the archive from this list of internal URLs
+        response = downloads.StreamingResponse(
+            downloads.zip_manifest(folders.archive_members(files.iterator(), paths)),
+            content_type="text/plain",
+        )
+        response["X-Archive-Files"] = "zip"
+        response["Content-Disposition"] = content_disposition_header(
+            True, f"{folder.name}.zip"
+        )
+        return response
+
+    # Streamed zip: entries are compressed while the response is being sent,
+    # so memory stays flat and the first bytes go out immediately. Photos,
+    # videos and archives are stored as they are; ?store=1 stores everything,
+    # a bigger download that starts at full speed.
+    store_only = request.query_params.get("store") in ("1", "true")
+    entries = (
+        (
+            arcname,
+            f.size,
+            timezone.localtime(f.uploaded_at),
+            storage.iter_file(f.file.name),
+            compression.is_compressed(f.file.name)
+            or not compression.compressed_type(f.filename),
+        )
+        for f, arcname in folders.archive_members(files.iterator(), paths)
+    )
 
     # Return zip file  as attachment
-    response = HttpResponse(zip_buffer, content_type="application/zip")
-    response["Content-Disposition"] = f'attachment; filename="{folder.name}.zip"'
+    response = downloads.StreamingResponse(
+        buffered_stream(archives.build(entries, store_only)),
+        content_type="application/zip",
+    )
+    response["Content-Disposition"] = content_disposition_header(
+        True, f"{folder.name}.zip"
+    )
     return response
 
 
@@ -192,43 +779,181 @@ def download_file(request, unique_link):
     if not file_obj:
         return HttpResponse("File not found", status=404)
 
-    file_path = file_obj.file.path
-    file_handle = open(file_path, "rb")
-    response = FileResponse(file_handle, content_type="application/octet-stream")
-    response["Content-Disposition"] = f'attachment; filename="{file_obj.filename}"'
-    return response
+    # ?inline=1 lets browsers and media players show the file instead of saving it
+    as_attachment = request.query_params.get("inline") not in ("1", "true")
+    if not storage.is_local() and not compression.is_compressed(file_obj.file.name):
+        # the bucket serves it (ranges included) from a short-lived URL
+        return HttpResponseRedirect(
+            default_storage.url(
+                file_obj.file.name, file_obj.filename, as_attachment=as_attachment
+            )
+        )
+    return downloads.serve_file(request, file_obj, as_attachment=as_attachment)
+
+
+@api_view(["GET"])
+def file_thumbnail(request, unique_link):
+    file_obj = (
+        UserFile.objects.filter(unique_link=unique_link).select_related("blob").first()
+    )
+    if not file_obj or not thumbnails.has_preview(file_obj):
+        return HttpResponse("Thumbnail not found", status=404)
+
+    try:
+        size = int(request.query_params.get("size", 0))
+    except ValueError:
+        return Response({"error": "size must be a number"}, status=400)
+
+    thumb = thumbnails.get_thumbnail(file_obj, thumbnails.pick_size(size))
+    if thumb is None:
+        # being made in the background
+        response = HttpResponse("Thumbnail not ready", status=202)
+        response["Retry-After"] = 5
+        return response
+    if not thumb.file:
+        return HttpResponse("No preview for this file", status=404)
+    if not storage.is_local():
+        return HttpResponseRedirect(
+            default_storage.url(thumb.file.name, as_attachment=False)
+        )
+    return downloads.serve_thumbnail(request, thumb)
+
+
+def folder_summaries(user):
+    live_files = Q(files__trashed_at__isnull=True)
+    return Folder.objects.filter(user=user).annotate(
+        file_count=Count("files", filter=live_files),
+        total_size=Coalesce(Sum("files__size", filter=live_files), 0),
+    )
 
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@read_from_replica
 def get_all_storage(request):
     user = request.user
-    # All folders
-    folders = Folder.objects.filter(user=user)
     # Files directly in root directory
     root_files = UserFile.objects.filter(user=user, parent_folder__isnull=True)
+    file_serializer = UserFileSerializer(
+        root_files, many=True, context={"request": request}
+    )
 
+    # ?summary=1 lists folders as name / file count / total size only
+    if request.query_params.get("summary") in ("1", "true"):
+        folder_serializer = FolderSummarySerializer(
+            folder_summaries(user), many=True, context={"request": request}
+        )
+        return Response(
+            {"folders": folder_serializer.data, "files": file_serializer.data}
+        )
+
+    # All folders, with their files fetched in one extra query
+    folders = Folder.objects.filter(user=user).prefetch_related("files")
     folder_serializer = FolderSerializer(
         folders, many=True, context={"request": request}
     )
-    file_serializer = UserFileSerializer(
-        root_files, many=True, context={"request": request}
-    )
 
     return Response({"folders": folder_serializer.data, "files": file_serializer.data})
 
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+def list_folders(request):
+    """Cursor-paginated folder summaries (no file arrays)."""
+    paginator = FolderCursorPagination()
+    page = paginator.paginate_queryset(folder_summaries(request.user), request)
+    serializer = FolderSummarySerializer(page, many=True, context={"request": request})
+    return paginator.get_paginated_response(serializer.data)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def list_files(request):
+    """Cursor-paginated files of one folder (?folder_id=) or of the root."""
+    user = request.user
+    folder_id = request.query_params.get("folder_id")
+    if invalid_ids(folder_id):
+        return Response({"error": "Invalid folder_id"}, status=400)
+
+    files = UserFile.objects.filter(user=user)
+    if folder_id:
+        folder = Folder.objects.filter(id=folder_id, user=user).first()
+        if not folder:
+            return Response({"error": "Folder not found"}, status=404)
+        files = files.filter(parent_folder=folder)
+    else:
+        files = files.filter(parent_folder__isnull=True)
+
+    paginator = FileCursorPagination()
+    page = paginator.paginate_queryset(files, request)
+    serializer = UserFileSerializer(page, many=True, context={"request": request})
+    return paginator.get_paginated_response(serializer.data)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def storage_changes(request):
+    """
+    Delta sync. Without ?cursor= only the current cursor is returned: get it
+    before listing everything, then ask with it for what changed since.
+    Inserted and renamed items come with their current state; a rename of
+    an item the client doesn't know is an insert (older entries of an item
+    are compacted away), and an item's parent may come later in the sync.
+    "has_more" means ask again right away with the new cursor. A 410 with
+    "reset" means the cursor is too old: list everything again and start
+    over with a fresh cursor.
+    """
+    cursor = request.query_params.get("cursor")
+    if not cursor:
+        return Response({"cursor": changes.current_cursor(request.user)})
+
+    try:
+        page_size = min(
+            int(request.query_params.get("page_size", settings.CHANGES_PAGE_SIZE)),
+            MAX_CHANGES_PAGE_SIZE,
+        )
+    except ValueError:
+        return Response({"error": "page_size must be a number"}, status=400)
+    if page_size < 1:
+        return Response({"error": "page_size must be positive"}, status=400)
+
+    try:
+        return Response(changes.feed(request.user, cursor, page_size))
+    except changes.InvalidCursor:
+        return Response({"error": "Invalid cursor"}, status=400)
+    except changes.CursorExpired:
+        return Response(
+            {"error": "Cursor expired, list everything again", "reset": True},
+            status=410,
+        )
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def search_storage(request):
+    """Files and folders matching ?q= by name or content, best match first."""
+    query = request.query_params.get("q", "").strip()
+    if not query:
+        return Response({"error": "q is required"}, status=400)
+
+    paginator = SearchPagination()
+    page = paginator.paginate_queryset(search.Results(request.user, query), request)
+    serializer = SearchResultSerializer(page, many=True, context={"request": request})
+    return paginator.get_paginated_response(serializer.data)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+@read_from_replica
 def get_storage_usage(request):
     user = request.user
     package = user.package
 
     # total used storage calculatin
-    total_used_bytes = sum(f.size for f in user.files.all())
+    total_used_bytes = quota.used(user)
 
     # total allowed storage calculatin
-    total_storage_bytes = getattr(package, "max_storage", package.max_upload_size)
+    total_storage_bytes = quota.storage_limit(package)
 
     # Remaining storage calculatin
     remaining_bytes = total_storage_bytes - total_used_bytes
@@ -264,34 +989,84 @@ def delete_item(request):
     user = request.user
     folder_id = request.data.get("folder_id")
     file_id = request.data.get("file_id")
+    if invalid_ids(folder_id, file_id):
+        return Response({"error": "Invalid folder_id or file_id"}, status=400)
 
-    # Delete Folder and its files if have any.
+    # Move the folder, its subfolders and all their files to the trash
     if folder_id:
         folder = Folder.objects.filter(id=folder_id, user=user).first()
         if not folder:
             return Response({"error": "Folder not found"}, status=404)
 
-        # Delete files inside folder
-        folder_files = folder.files.all()
-        for f in folder_files:
-            if f.file:
-                if os.path.exists(f.file.path):
-                    os.remove(f.file.path)
-            f.delete()
-
-        folder.delete()
-        return Response({"message": "Folder and its files deleted successfully"})
+        trash.trash_folder(user, folder)
+        return Response({"message": "Folder and its files moved to trash"})
 
-    # Delete Single File
+    # Move a single file to the trash
     if file_id:
         file_obj = UserFile.objects.filter(id=file_id, user=user).first()
         if not file_obj:
             return Response({"error": "File not found"}, status=404)
 
-        if file_obj.file and os.path.exists(file_obj.file.path):
-            os.remove(file_obj.file.path)
-        file_obj.delete()
-        return Response({"message": "File deleted successfully"})
+        trash.trash_file(user, file_obj)
+        return Response({"message": "File moved to trash"})
+
+    return Response({"error": "Provide either folder_id or file_id"}, status=400)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def list_trash(request):
+    """Folders and files the user deleted, newest first."""
+    trashed_folders, trashed_files = trash.trashed_roots(request.user)
+    context = {"request": request}
+    trashed_folders = trashed_folders.prefetch_related(
+        Prefetch("files", queryset=UserFile.all_objects.all())
+    ).order_by("-trashed_at")
+    folder_serializer = FolderSerializer(trashed_folders, many=True, context=context)
+    file_serializer = UserFileSerializer(
+        trashed_files.order_by("-trashed_at"), many=True, context=context
+    )
+    return Response(
+        {
+            "folders": folder_serializer.data,
+            "files": file_serializer.data,
+            "retention_days": settings.TRASH_RETENTION_DAYS,
+        }
+    )
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def restore_item(request):
+    user = request.user
+    folder_id = request.data.get("folder_id")
+    file_id = request.data.get("file_id")
+    if invalid_ids(folder_id, file_id):
+        return Response({"error": "Invalid folder_id or file_id"}, status=400)
+
+    if folder_id:
+        folder = Folder.all_objects.filter(
+            id=folder_id, user=user, trashed_at__isnull=False
+        ).first()
+        if not folder:
+            return Response({"error": "Folder not found in trash"}, status=404)
+        if not trash.restore_folder(user, folder):
+            return Response(
+                {"error": "You exceeded your package storage limit"}, status=400
+            )
+        return Response({"message": "Folder restored"})
+
+    if file_id:
+        file_obj = UserFile.all_objects.filter(
+            id=file_id, user=user, trashed_at__isnull=False
+        ).first()
+        if not file_obj:
+            return Response({"error": "File not found in trash"}, status=404)
+        if not trash.restore_file(user, file_obj):
+            return Response(
+                {"error": "You exceeded your package storage limit"}, status=400
+            )
+        return Response({"message": "File restored"})
 
     return Response({"error": "Provide either folder_id or file_id"}, status=400)
 
@@ -361,7 +1136,7 @@ def payment_status(request):
             user.package = (
                 package  # Assign  user the purchased package if transaction is success
             )
-            user.save()
+            user.save(update_fields=["package"])
             success_url = f"/payment-status?order_id={order_id}&status=success"
         else:
             transaction.status = "failed"
@@ -400,53 +1175,27 @@ def chat_ai(request):
     if not package or not getattr(package, "chat_enabled", False):
         return Response({"error": "Chat AI not enabled for your package"}, status=403)
 
-    model_id = (
-        "llama-3.3-70b-versatile"
-        if user.package.name.lower() == "pro"
-        else "groq/compound-mini"
-    )
+    model_id = chat.model_for(package)
 
     try:
-        # Load existing conversation
-        chat = EncryptedChatSession.objects.filter(user=user).first()
-        if chat:
-            try:
-                conversation = chat.get_conversation()
-            except Exception:
-                conversation = []
-        else:
-            conversation = []
-
-        # Clean invalid or malformed messages
-        conversation = [
-            m
-            for m in conversation
-            if isinstance(m, dict)
-            and "role" in m
-            and "content" in m
-            and isinstance(m["role"], str)
-            and isinstance(m["content"], str)
-        ]
-
-        # Append the new user message
-        conversation.append({"role": "user", "content": message})
-
-        # Limit history
-        conversation = conversation[-15:]
-
-        # Add system prompt once + user conversation
-        messages = [
-            {"role": "system", "content": "You are a helpful AI assistant."}
-        ] + conversation
+        # Load existing conversation, append the new user message, limit history
+        conversation = chat.load_conversation(user)
+        user_message = {"role": "user", "content": message}
+        conversation.append(user_message)
+        conversation = conversation[-chat.HISTORY_LENGTH :]
+        messages = chat.build_messages(conversation)
 
         # Send to ai
         payload = {"model": model_id, "messages": messages}
         headers = {
-            "Authorization": f"Bearer {GROQ_API_KEY}",
+            "Authorization": f"Bearer {settings.GROQ_API_KEY}",
             "Content-Type": "application/json",
         }
 
-        response = requests.post(GROQ_CHAT_URL, headers=headers, json=payload)
+        with metrics.upstream("groq"):
+            response = requests.post(
+                settings.GROQ_CHAT_URL, headers=headers, json=payload
+            )
         if response.status_code != 200:
             return Response(
                 {
@@ -459,13 +1208,10 @@ def chat_ai(request):
         data = response.json()
         reply = data["choices"][0]["message"]["content"]
 
-        # Append reply and save conversation
-        conversation.append({"role": "assistant", "content": reply})
-        if chat:
-            chat.set_conversation(conversation)
-        else:
-            chat = EncryptedChatSession.objects.create(user=user)
-            chat.set_conversation(conversation)
+        # Append reply and save the two new messages
+        reply_message = {"role": "assistant", "content": reply}
+        conversation.append(reply_message)
+        chat.append_messages(user, [user_message, reply_message])
 
         # Return AI reply
         return Response({"reply": reply, "conversation": conversation}, status=200)
@@ -474,9 +1220,92 @@ def chat_ai(request):
         return Response({"error": str(e)}, status=500)
 
 
+# The Server-Sent Events views below stream an async generator, which only
+# a server running the ASGI application (backend.asgi) sends as it is made.
+# Under WSGI Django has to collect the whole stream first, so a client would
+# get every event at once when the stream ends.
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+async def authenticated_user(request):
+    """JWT authentication for plain async views, which DRF cannot wrap."""
+    try:
+        auth = await sync_to_async(CachedJWTAuthentication().authenticate)(request)
+    except AuthenticationFailed:
+        return None
+    profiling.sample_this_thread(request)
+    return auth[0] if auth else None
+
+
+@csrf_exempt
+@require_POST
+async def chat_stream(request):
+    """
+    Streaming version of chat_ai for ASGI workers. The reply is sent as
+    Server-Sent Events while it is generated: "token" events with each piece
+    of text, then one "done" event once the conversation has been saved.
+    """
+    user = await authenticated_user(request)
+    if not user:
+        return JsonResponse({"error": "Authentication required"}, status=401)
+
+    try:
+        message = json.loads(request.body or b"{}").get("message")
+    except (ValueError, AttributeError):
+        message = None
+    if not message:
+        return JsonResponse({"error": "Message required"}, status=400)
+
+    package = await sync_to_async(getattr)(user, "package", None)
+    if not package or not getattr(package, "chat_enabled", False):
+        return JsonResponse(
+            {"error": "Chat AI not enabled for your package"}, status=403
+        )
+
+    conversation = await sync_to_async(chat.load_conversation)(user)
+    user_message = {"role": "user", "content": message}
+    conversation.append(user_message)
+    conversation = conversation[-chat.HISTORY_LENGTH :]
+    messages = chat.build_messages(conversation)
+    model_id = chat.model_for(package)
+
+    async def events():
+        reply = []
+        try:
+            async for piece in chat.stream_reply(
+                model_id, messages, shared=isinstance(request, ASGIRequest)
+            ):
+                reply.append(piece)
+                yield sse_event("token", {"content": piece})
+        except chat.UpstreamError as e:
+            yield sse_event("error", {"error": str(e), "details": e.details})
+            return
+        except (httpx.HTTPError, ValueError) as e:
+            yield sse_event("error", {"error": str(e)})
+            return
+
+        # Only a complete reply is saved
+        reply_message = {"role": "assistant", "content": "".join(reply)}
+        conversation.append(reply_message)
+        await sync_to_async(chat.append_messages)(user, [user_message, reply_message])
+        yield sse_event("done", {"reply": "".join(reply), "conversation": conversation})
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # stop nginx from buffering the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
 def generate_image(request):
+    """
+    Queue an image generation job and return right away. The finished image
+    is saved to the user's storage; follow it with img/jobs/<id>/ or the
+    img/jobs/<id>/events/ stream.
+    """
     user = request.user
     prompt = request.data.get("prompt")
 
@@ -489,81 +1318,73 @@ def generate_image(request):
             {"error": "Image generation not enabled for your package"}, status=403
         )
 
-    try:
-        payload = {
-            "prompt": prompt,
-            "steps": 20,
-            "cfg_scale": 7,
-            "sampler_name": "k_euler",
-            "nsfw": True,
-        }
+    job = imagejobs.create_job(user, prompt)
+    serializer = ImageJobSerializer(job, context={"request": request})
+    return Response(serializer.data, status=202)
 
-        headers = {"apikey": API_KEY, "Content-Type": "application/json"}
 
-        # generation request
-        response = requests.post(STABLE_HORDE_URL, headers=headers, json=payload)
-        if response.status_code not in [200, 202]:
-            return Response(
-                {
-                    "error": f"Stable Horde API error {response.status_code}",
-                    "details": response.text,
-                },
-                status=500,
-            )
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def image_job_status(request, job_id):
+    job = ImageJob.objects.filter(id=job_id, user=request.user).first()
+    if not job:
+        return Response({"error": "Job not found"}, status=404)
 
-        data = response.json()
-        prediction_id = data.get("id")
-        if not prediction_id:
-            return Response({"error": "No prediction ID returned"}, status=500)
+    imagejobs.expire(job)
+    serializer = ImageJobSerializer(job, context={"request": request})
+    return Response(serializer.data)
 
-        # Poll until image is ready
-        result_url = f"https://stablehorde.net/api/v2/generate/status/{prediction_id}"
+
+@require_GET
+async def image_job_events(request, job_id):
+    """
+    Server-Sent Events, for ASGI workers: a "status" event on every change
+    until the job ends.
+    """
+    user = await authenticated_user(request)
+    if not user:
+        return JsonResponse({"error": "Authentication required"}, status=401)
+    if not await ImageJob.objects.filter(id=job_id, user=user).aexists():
+        return JsonResponse({"error": "Job not found"}, status=404)
+
+    def job_data():
+        job = imagejobs.expire(ImageJob.objects.select_related("result").get(id=job_id))
+        return ImageJobSerializer(job, context={"request": request}).data
+
+    async def events():
+        last = None
         while True:
-            r = requests.get(result_url, headers=headers)
-            r_data = r.json()
-            if r_data.get("done"):
+            data = await sync_to_async(job_data)()
+            if data != last:
+                yield sse_event("status", data)
+                last = data
+            if data["status"] in ("done", "failed"):
                 break
-            time.sleep(2)  # wait before polling again
-
-        # Get base64 image
-        images_b64 = r_data.get("generations", [{}])[0].get("img")
-        if not images_b64:
-            return Response({"error": "No image returned"}, status=500)
-
-        # Return base64 image to frontend
-        return Response({"image_base64": images_b64})
+            await asyncio.sleep(IMAGE_JOB_EVENT_INTERVAL)
 
-    except Exception as e:
-        return Response({"error": str(e)}, status=500)
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
 
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
 def save_chat_session(request):
-    """Save or update the user's single chat session"""
+    """Append messages to the user's chat history"""
     user = request.user
     conversation = request.data.get("conversation")
 
     if not conversation:
         return Response({"error": "conversation is required"}, status=400)
+    if not isinstance(conversation, list) or len(conversation) > MAX_SAVED_MESSAGES:
+        error = f"conversation must be a list of up to {MAX_SAVED_MESSAGES} messages"
+        return Response({"error": error}, status=400)
 
     try:
-        # get existing chat or create a new one
-        chat, created = EncryptedChatSession.objects.get_or_create(user=user)
-
-        # merge old conversation with new one instead of overwriting
-        try:
-            old_conversation = chat.get_conversation()
-        except Exception:
-            old_conversation = []
-
-        # merge both conversations
-        merged_conversation = old_conversation + conversation
-        chat.set_conversation(merged_conversation)
-
-        return Response(
-            {"message": "Chat saved successfully", "created": created}, status=200
-        )
+        # only the new messages are encrypted and written
+        chat.append_messages(user, conversation)
+        return Response({"message": "Chat saved successfully"}, status=200)
 
     except Exception as e:
         return Response({"error": str(e)}, status=500)
@@ -571,15 +1392,26 @@ def save_chat_session(request):
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@read_from_replica
 def get_chat_history(request):
-    """Return the user's single saved chat session decrypted"""
+    """
+    Return the latest page of the user's chat history, oldest first.
+    "next" points at the page of older messages.
+    """
     try:
-        chat = EncryptedChatSession.objects.filter(user=request.user).first()
-        if not chat:
-            return Response({"conversation": []}, status=200)
-
-        data = chat.get_conversation()
-        return Response({"conversation": data}, status=200)
+        paginator = ChatMessageCursorPagination()
+        page = paginator.paginate_queryset(
+            ChatMessage.objects.filter(user=request.user), request
+        )
+        data = [message.get_message() for message in reversed(page)]
+        return Response(
+            {
+                "conversation": data,
+                "next": paginator.get_next_link(),
+                "previous": paginator.get_previous_link(),
+            },
+            status=200,
+        )
     except Exception as e:
         return Response({"error": str(e)}, status=500)
 
@@ -588,5 +1420,20 @@ def get_chat_history(request):
 @permission_classes([IsAuthenticated])
 def reset_chat_session(request):
     """Reset the user's chat session"""
-    EncryptedChatSession.objects.filter(user=request.user).delete()
+    ChatMessage.objects.filter(user=request.user).delete()
     return Response({"message": "Chat session reset"}, status=200)
+
+
+@require_GET
+def metrics_view(request):
+    """
+    Request metrics of this process in Prometheus text format, for scrapers
+    sending "Authorization: Bearer <METRICS_TOKEN>". Off without a token.
+    """
+    token = settings.METRICS_TOKEN
+    given = request.headers.get("Authorization", "")
+    if not token or not constant_time_compare(given, f"Bearer {token}"):
+        return HttpResponse(status=404)
+    return HttpResponse(
+        metrics.registry.render(), content_type="text/plain; version=0.0.4"
+    )
@@ -27,10 +27,10 @@ function ChatUI() {
     }
   }
 
-  const saveChat = async updatedMessages => {
+  const saveChat = async newMessages => {
     setSaving(true)
     try {
-      await api.post('v1/chat/save/', { conversation: updatedMessages })
+      await api.post('v1/chat/save/', { conversation: newMessages })
     } finally {
       setSaving(false)
     }
@@ -51,9 +51,10 @@ function ChatUI() {
     try {
       const res = await api.post('v1/chat/', { message: input })
       const reply = res.data.reply || 'No response received.'
-      const updated = [...newMsgs, { sender: 'ai', text: reply }]
-      setMessages(updated)
-      saveChat(updated)
+      const aiMsg = { sender: 'ai', text: reply }
+      setMessages([...newMsgs, aiMsg])
+      // the server appends, so only send the new messages
+      saveChat([userMsg, aiMsg])
     } catch (err) {
       console.error(err)
       setMessages([
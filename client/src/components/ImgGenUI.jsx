@@ -18,8 +18,17 @@ function ImgGenUI() {
     setImageUrl('')
 
     try {
-      const res = await api.post('v1/img/gen/', { prompt })
-      setImageUrl(res.data.image_base64)
+      // Generation runs as a job on the server; poll it until it finishes
+      let { data: job } = await api.post('v1/img/gen/', { prompt })
+      while (job.status === 'queued' || job.status === 'running') {
+        await new Promise(resolve => setTimeout(resolve, 2000))
+        ;({ data: job } = await api.get(`v1/img/jobs/${job.id}/`))
+      }
+      if (job.status !== 'done') {
+        setError(job.error || 'Failed to generate image. Try again.')
+        return
+      }
+      setImageUrl(job.image_url)
     } catch (err) {
       setError('Failed to generate image. Try again.')
       console.error(err)
@@ -103,6 +103,13 @@ function FileManager() {
     >
       {type === 'folder' ? (
         <FaFolder className="text-[#99744a] w-10 h-10 mb-2" />
+      ) : item.thumbnail_url ? (
+        <img
+          src={item.thumbnail_url}
+          alt=""
+          loading="lazy"
+          className="w-10 h-10 mb-2 object-cover rounded"
+        />
       ) : (
         <FaFileAlt className="text-[#414a37] w-10 h-10 mb-2" />
       )}
@@ -91,7 +91,16 @@ function FolderView({ folder, onClose, uploadFile }) {
                 key={file.id}
                 className="relative flex flex-col items-center p-4 bg-[#dbc2a6]/20 border border-[#99744a]/30 rounded-xl hover:bg-[#dbc2a6]/40 transition"
               >
-                <FaFileAlt className="text-[#414a37] w-10 h-10 mb-2" />
+                {file.thumbnail_url ? (
+                  <img
+                    src={file.thumbnail_url}
+                    alt=""
+                    loading="lazy"
+                    className="w-full h-24 mb-2 object-cover rounded-lg"
+                  />
+                ) : (
+                  <FaFileAlt className="text-[#414a37] w-10 h-10 mb-2" />
+                )}
                 <span className="text-sm font-medium text-[#414a37] text-center truncate w-full">
                   {file.filename}
                 </span>